@@ -8,6 +8,7 @@ from .forms import CategoryForm, ProductImageForm, ProductModelForm
 from django.contrib.auth.decorators import user_passes_test
 from django.http import HttpResponse
 from django.utils import timezone
+from ecommerce.db_routers import replica_reads
 # from users.decorators import group_required
 
 
@@ -24,6 +25,7 @@ def admin_or_staff_required(view_func):
 
 
 # @group_required('Admin')
+@replica_reads
 def admin_portal(request):
     products = Product.objects.all()
     latest_products = products.order_by('-created_at')[:10]
@@ -107,6 +109,7 @@ def add_product(request):
 
     return render(request, 'admin_portal/add_product.html', context)
 
+@replica_reads
 def inventory(request):
     products = Product.objects.all()
     products_count = products.count()
@@ -165,6 +168,7 @@ def product_inventory(request, slug):
     return render(request, 'admin_portal/product_inventory.html', context)
 
 
+@replica_reads
 def orders(request):
     orders = Order.objects.all()
     shipped = orders.filter(is_shipped=True)
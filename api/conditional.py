@@ -0,0 +1,58 @@
+import hashlib
+
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from store.utils import get_catalog_version
+
+
+class CatalogConditionalMixin:
+    """
+    Conditional GETs for read-only catalog endpoints.
+
+    The ETag hashes the catalog version (bumped on every catalog change)
+    with the URL and response format, so it costs no query. Last-Modified
+    is the newest `updated_at` of `last_modified_models`. A request whose
+    If-None-Match / If-Modified-Since still matches gets a 304 before the
+    queryset is touched or anything is serialized; one that sends
+    If-None-Match gets it without a single query.
+    """
+    last_modified_models = ()
+
+    def catalog_etag(self, request):
+        key = f"{get_catalog_version()}|{request.get_full_path()}|{request.accepted_renderer.format}"
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+    def catalog_last_modified(self):
+        latest = [
+            model.objects.aggregate(latest=Max('updated_at'))['latest']
+            for model in self.last_modified_models
+        ]
+        latest = [value for value in latest if value is not None]
+        return int(max(latest).timestamp()) if latest else None
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag = self.catalog_etag(request)
+        # If-Modified-Since is ignored next to If-None-Match, so skip the
+        # Last-Modified queries unless the response gets a body
+        revalidating = 'HTTP_IF_NONE_MATCH' in request.META
+        last_modified = None if revalidating else self.catalog_last_modified()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if revalidating:
+                last_modified = self.catalog_last_modified()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Let clients keep the payload but check back every time
+            patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
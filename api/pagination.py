@@ -0,0 +1,26 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Newest-first product pages behind an opaque ?cursor=, served by the
+    (is_listed, created_at, id) index however deep the client scrolls.
+    Search results (annotated with `rank`) page best match first instead.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if 'rank' in queryset.query.annotations:
+            return ('-rank', 'id')
+        return self.ordering
+
+
+class LedgerCursorPagination(CursorPagination):
+    """Newest-first wallet transactions, read through the (wallet, -id) index."""
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
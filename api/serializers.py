@@ -47,6 +47,23 @@ class ShippingAddressSerializer(serializers.ModelSerializer):
         return instance
     
 
+class SparseFieldsetMixin:
+    """
+    ?fields=id,name,price trims the response to those fields (unknown names
+    are ignored). Only the top-level serializer looks at the request, so
+    nested ones keep all their fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = request.query_params.get('fields') if request is not None else None
+        if fields:
+            wanted = {name.strip() for name in fields.split(',')}
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -57,7 +74,8 @@ class ProductImageSerializer(serializers.ModelSerializer):
         model = ProductImage
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Full product for the detail screen; needs category and product_images loaded up front."""
     category = CategorySerializer()
     product_images = ProductImageSerializer(many=True, read_only=True)
 
@@ -66,6 +84,30 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ProductCardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Just what a product card shows, for the catalog list screens."""
+    category_name = serializers.CharField(source='category.name', default=None, read_only=True)
+    image = serializers.SerializerMethodField()
+
+    # Model fields the card needs; the list view loads only these
+    MODEL_FIELDS = [
+        'id', 'name', 'slug', 'price', 'sale_price', 'is_sale', 'percentage_discount',
+        'is_featured', 'stock_quantity', 'created_at', 'category', 'profile_image', 'image_variants',
+    ]
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'slug', 'price', 'sale_price', 'is_sale', 'percentage_discount',
+            'is_featured', 'stock_quantity', 'created_at', 'category', 'category_name', 'image',
+        ]
+
+    def get_image(self, product):
+        url = product.variant_url('card')
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request is not None else url
+
+
 
 class MobileBannerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,220 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
+from django.utils.http import http_date
+
+from api.serializers import CategorySerializer, MobileBannerSerializer, ProductCardSerializer
+from ecommerce.testing import QueryBudgetMixin
+from payment.utils import place_order
+from store.models import CatalogChange, Category, MobileBanner, Product, ProductImage
+from store.utils import get_catalog_version
+from users.models import CustomUser
+
+
+class ProductApiTests(QueryBudgetMixin, TestCase):
+    """The product API's query count mustn't grow with the number of products."""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f"Category {i}") for i in range(3)]
+        for i in range(45):
+            product = Product.objects.create(
+                name=f"Product {i}", price=Decimal("10.00"), category=categories[i % 3], stock_quantity=5,
+            )
+            ProductImage.objects.create(product=product)
+        cls.product = product
+
+    def test_list_is_one_query_per_page(self):
+        # The page, plus newest product and category for Last-Modified
+        response = self.assertQueryBudget("/api/products/", 3)
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0]['name'], "Product 44")  # newest first
+        self.assertNotIn('description', data['results'][0])
+
+        seen = [row['id'] for row in data['results']]
+        while data['next']:
+            data = self.assertQueryBudget(data['next'], 3).json()
+            seen += [row['id'] for row in data['results']]
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(len(set(seen)), 45)
+
+    def test_sparse_fields(self):
+        data = self.client.get("/api/products/", {'fields': 'id,name,nonsense'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+
+    def test_detail(self):
+        response = self.assertQueryBudget(f"/api/products/{self.product.pk}/", 4)
+        data = response.json()
+        self.assertEqual(data['category']['name'], "Category 2")
+        self.assertEqual(len(data['product_images']), 1)
+
+        data = self.client.get(f"/api/products/{self.product.pk}/", {'fields': 'id,price'}).json()
+        self.assertEqual(set(data), {'id', 'price'})
+
+
+class ConditionalCatalogTests(QueryBudgetMixin, TestCase):
+    """Unchanged catalog responses come back as 304s without being serialized again."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Shoes")
+        cls.product = Product.objects.create(name="Runner", price=Decimal("10.00"), category=cls.category)
+        MobileBanner.objects.create(image="uploads/banners/banner.png", caption="Sale", in_use=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_if_none_match(self):
+        serializers = {
+            "/api/products/": ProductCardSerializer,
+            "/api/categories/": CategorySerializer,
+            "/api/banners/": MobileBannerSerializer,
+        }
+        for url, serializer in serializers.items():
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn("Last-Modified", first)
+                self.assertIn("no-cache", first["Cache-Control"])
+
+                with mock.patch.object(serializer, "to_representation") as to_representation:
+                    with self.assertNumQueries(0):
+                        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+                self.assertEqual(second.status_code, 304)
+                self.assertEqual(second["ETag"], first["ETag"])
+                self.assertEqual(second.content, b"")
+                to_representation.assert_not_called()
+
+    def test_if_modified_since(self):
+        first = self.client.get("/api/products/")
+        second = self.client.get("/api/products/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(second.status_code, 304)
+
+        Product.objects.filter(pk=self.product.pk).update(updated_at=self.product.updated_at.replace(year=2100))
+        third = self.client.get("/api/products/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third["Last-Modified"], http_date(self.product.updated_at.replace(year=2100).timestamp()))
+
+    def test_changes_invalidate(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal("12.00")
+            self.product.save()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["price"], "12.00")
+
+    def test_etag_depends_on_the_query(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        response = self.client.get("/api/products/", {"fields": "id"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class CatalogChangesTests(QueryBudgetMixin, TestCase):
+    """The sync feed returns what changed since a token, in a fixed number of queries."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(name="Shoes")
+            self.products = [
+                Product.objects.create(name=f"Runner {i}", price=Decimal("10.00"), category=self.category)
+                for i in range(3)
+            ]
+        self.token = self.client.get("/api/catalog/changes/").json()["token"]
+
+    def sync(self, token, max_queries=6):
+        return self.assertQueryBudget(f"/api/catalog/changes/?since={token}", max_queries).json()
+
+    def test_changes_since_token(self):
+        data = self.sync(self.token)
+        self.assertEqual(data["token"], self.token)
+        self.assertFalse(data["has_more"])
+        self.assertEqual(data["products"], {"changed": [], "removed": []})
+
+        runner, delisted, deleted = self.products
+        removed = sorted([delisted.pk, deleted.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            runner.price = Decimal("12.00")
+            runner.save()
+            delisted.stock_quantity = 0
+            delisted.save()
+            deleted.delete()
+            image = ProductImage.objects.create(product=runner)
+            banner = MobileBanner.objects.create(image="uploads/banners/banner.png", in_use=True)
+
+        data = self.sync(self.token)
+        self.assertEqual([row["price"] for row in data["products"]["changed"]], ["12.00"])
+        self.assertEqual(data["products"]["removed"], removed)
+        self.assertEqual([row["id"] for row in data["images"]["changed"]], [image.pk])
+        self.assertEqual([row["id"] for row in data["banners"]["changed"]], [banner.pk])
+        self.assertEqual(data["categories"], {"changed": [], "removed": []})
+
+        # Nothing new after the returned token
+        later = self.sync(data["token"])
+        self.assertEqual(later["products"], {"changed": [], "removed": []})
+
+    def test_checkout_and_category_rename(self):
+        user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        sold_out, bought = self.products[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            # stock_quantity defaults to 1, so this sells the first one out
+            place_order(user, [(sold_out.pk, 1)], payment_method="COD", shipping_address="")
+        data = self.sync(self.token)
+        self.assertEqual(data["products"], {"changed": [], "removed": [sold_out.pk]})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=bought.pk).update(stock_quantity=5)
+            self.category.name = "Sneakers"
+            self.category.save()
+        data = self.sync(data["token"])
+        self.assertEqual([row["name"] for row in data["categories"]["changed"]], ["Sneakers"])
+        self.assertEqual(
+            [(row["id"], row["category_name"]) for row in data["products"]["changed"]],
+            [(bought.pk, "Sneakers"), (self.products[2].pk, "Sneakers")],
+        )
+
+    def test_log_commits_with_the_change(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.products[0].save()
+            # Written in the transaction, not after it commits
+            self.assertTrue(CatalogChange.objects.filter(pk__gt=self.token, object_id=self.products[0].pk).exists())
+            raise RuntimeError
+        self.assertFalse(CatalogChange.objects.filter(pk__gt=self.token).exists())
+        self.assertEqual(self.sync(self.token)["products"], {"changed": [], "removed": []})
+
+    def test_checkout_that_leaves_stock_keeps_the_catalog(self):
+        user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        product = self.products[0]
+        Product.objects.filter(pk=product.pk).update(stock_quantity=5)
+        self.assertContains(self.client.get(f"/product/{product.slug}"), "We have 5 items available")
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(user, [(product.pk, 1)], payment_method="COD", shipping_address="")
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(self.sync(self.token)["products"], {"changed": [], "removed": []})
+        # The cached product page still shows the stock left
+        self.assertContains(self.client.get(f"/product/{product.slug}"), "Only 4 items left")
+
+    def test_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in self.products:
+                product.save()
+        with mock.patch("api.views.CATALOG_SYNC_BATCH", 2):
+            first = self.sync(self.token)
+            second = self.sync(first["token"])
+        self.assertTrue(first["has_more"])
+        self.assertFalse(second["has_more"])
+        synced = [row["id"] for row in first["products"]["changed"] + second["products"]["changed"]]
+        self.assertEqual(sorted(synced), [product.pk for product in self.products])
 
-# Create your tests here.
+    def test_bad_tokens(self):
+        self.assertEqual(self.client.get("/api/catalog/changes/?since=abc").status_code, 400)
+        latest = int(self.token)
+        self.assertEqual(self.client.get(f"/api/catalog/changes/?since={latest + 1}").status_code, 410)
+        CatalogChange.objects.filter(pk__lt=latest).delete()  # pruned
+        self.assertEqual(self.client.get("/api/catalog/changes/?since=0").status_code, 410)
+        self.assertEqual(self.sync(latest - 1)["token"], self.token)
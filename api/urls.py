@@ -2,8 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import CategoryViewSet, ProductViewSet, ProductImageViewSet, ProfileViewSet, MobileBannerViewSet, ShippingAddressViewSet, create_order, user_order_history_api 
 from . import views
-from cart.api_views import CartView, AddToCartView, UpdateCartView, DeleteFromCartView, CartTotalView
-from wallet.api_views import get_wallet_balance,get_wallet_transactions ,withdraw_from_wallet
+from cart.api_views import CartView, CartBatchView, AddToCartView, UpdateCartView, DeleteFromCartView, CartTotalView
+from wallet.api_views import get_wallet_balance,get_wallet_transactions ,withdraw_from_wallet, get_earnings_summary
 from payment.api_views import PaymentViewSet
 from users.api_views import add_bank_details_api, get_bank_details_api
 
@@ -20,6 +20,7 @@ router.register(r'payment', PaymentViewSet, basename='payment')
 urlpatterns = [
     path('', include(router.urls)),
     path('get_csrf_token/', views.get_csrf_token, name='get_csrf_token'),
+    path('catalog/changes/', views.catalog_changes, name='catalog-changes'),
    
     path('orders/history/', user_order_history_api, name='user_order_history'),
     path('user/referrals/', views.referred_users_view, name='user-referrals'),
@@ -29,9 +30,11 @@ urlpatterns = [
     path('cart/update/', UpdateCartView.as_view(), name='api_cart_update'),
     path('cart/delete/', DeleteFromCartView.as_view(), name='api_cart_delete'),
     path('cart/total/', CartTotalView.as_view(), name='api_cart_total'),
+    path('cart/batch/', CartBatchView.as_view(), name='api_cart_batch'),
     # Wallet
     path('wallet/balance/', get_wallet_balance, name='wallet-balance'),
     path('wallet/transactions/', get_wallet_transactions, name='wallet-transactions'),
+    path('wallet/earnings/', get_earnings_summary, name='wallet-earnings'),
 	path('wallet/withdraw/', withdraw_from_wallet, name='wallet-withdraw'),
     # bank_details
     path('users/bank-details/', add_bank_details_api, name='add_bank_details_api'),
@@ -6,9 +6,14 @@ from users.models import Profile
 from .serializers import OrderSerializer, ProfileSerializer
 
 
-from store.models import Category, Product, ProductImage, MobileBanner
+from collections import defaultdict
+from django.db.models import Max, Min
+from store.models import CatalogChange, Category, Product, ProductImage, MobileBanner
+from store.search import search_products
 from users.models import Profile, ShippingAddress
-from .serializers import CategorySerializer, ProductSerializer, ProductImageSerializer, MobileBannerSerializer, ProfileSerializer, ShippingAddressSerializer
+from .serializers import CategorySerializer, ProductCardSerializer, ProductSerializer, ProductImageSerializer, MobileBannerSerializer, ProfileSerializer, ShippingAddressSerializer
+from .pagination import ProductCursorPagination
+from .conditional import CatalogConditionalMixin
 
 from django.http import JsonResponse
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
@@ -16,7 +21,8 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from users.models import CustomUser
 from store.models import Product
-from cart.models import Order, OrderItem
+from cart.models import Order
+from payment.utils import place_order
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
@@ -27,9 +33,10 @@ from .serializers import ReferredUserSerializer
 def get_csrf_token(request):
     return JsonResponse({'csrfToken': 'set'}) 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogConditionalMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    last_modified_models = (Category,)
 
 
 class ProductImageViewSet(viewsets.ModelViewSet):
@@ -37,13 +44,33 @@ class ProductImageViewSet(viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
 
 
-class ProductViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
+class ProductViewSet(CatalogConditionalMixin, viewsets.GenericViewSet,
+                     mixins.ListModelMixin, mixins.RetrieveModelMixin):
+    """
+    List: cursor-paged product cards (ProductCardSerializer), one query
+    per page. Detail: the full product with its category and images
+    loaded in two queries. Both take ?fields= to trim the response, and
+    answer conditional GETs with 304s (CatalogConditionalMixin).
+    """
     products = Product.objects.all()
     queryset = products.filter(is_listed=True)
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    last_modified_models = (Product, Category)
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductCardSerializer
+        return ProductSerializer
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = self.queryset.select_related('category')
+        if self.action == 'list':
+            queryset = queryset.only(
+                *ProductCardSerializer.MODEL_FIELDS, 'category__id', 'category__name',
+            )
+        else:
+            queryset = queryset.prefetch_related('product_images')
         query = Q()
 
         # Retrieve query parameters
@@ -53,6 +80,7 @@ class ProductViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
         key_words = self.request.query_params.get('key_words', None)
         color = self.request.query_params.get('color', None)
         material = self.request.query_params.get('material', None)
+        search = self.request.query_params.get('q', None)
         
 
         # Add filters dynamically based on the presence of query parameters
@@ -78,32 +106,91 @@ class ProductViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
         # Apply the dynamic query filters to the queryset
         queryset = queryset.filter(query)
 
+        # Full-text search uses the product search index, best matches first
+        if search:
+            queryset = search_products(search, queryset)
+
         # Debug: Log the constructed query (for development purposes only)
         #print(queryset.query)
 
         return queryset
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
     
     
 
 
-class MobileBannerViewSet(viewsets.ReadOnlyModelViewSet):
+class MobileBannerViewSet(CatalogConditionalMixin, viewsets.ReadOnlyModelViewSet):
     queryset = MobileBanner.objects.filter(in_use=True) 
     serializer_class = MobileBannerSerializer
+    last_modified_models = (MobileBanner,)
+
+
+CATALOG_SYNC_BATCH = 500
+
+# Change log kind -> (response key, queryset, serializer, flag that keeps a row visible)
+CATALOG_SYNC_FEEDS = {
+    'product': (
+        'products',
+        Product.objects.select_related('category').only(
+            *ProductCardSerializer.MODEL_FIELDS, 'is_listed', 'category__id', 'category__name',
+        ),
+        ProductCardSerializer,
+        'is_listed',
+    ),
+    'category': ('categories', Category.objects.all(), CategorySerializer, None),
+    'image': ('images', ProductImage.objects.all(), ProductImageSerializer, None),
+    'banner': ('banners', MobileBanner.objects.all(), MobileBannerSerializer, 'in_use'),
+}
+
+
+# Not @replica_reads: a lagging replica would turn fresh tokens into 410s
+@api_view(['GET'])
+def catalog_changes(request):
+    """
+    Delta sync for the mobile catalog. ?since=<token> returns, per kind,
+    the current data of rows created or updated after that token
+    (`changed`) and the ids of rows deleted or delisted since (`removed`),
+    plus the token to send next time. Keep going while `has_more` is true.
+
+    Without ?since= only the current token comes back: take it before a
+    full fetch of the catalog and sync from it afterwards. A token older
+    than the pruned log (or from another database) gets a 410, meaning
+    fetch everything again.
+    """
+    bounds = CatalogChange.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+    latest = bounds['latest'] or 0
+    since = request.query_params.get('since')
+    if since is None:
+        return Response({'token': str(latest)})
+    try:
+        since = int(since)
+    except ValueError:
+        return Response({'error': 'Invalid sync token.'}, status=status.HTTP_400_BAD_REQUEST)
+    if since > latest or (bounds['oldest'] is not None and since < bounds['oldest'] - 1):
+        return Response(
+            {'error': 'Sync token expired; fetch the full catalog again.'}, status=status.HTTP_410_GONE,
+        )
+
+    entries = list(
+        CatalogChange.objects.filter(id__gt=since).order_by('id')
+        .values_list('id', 'kind', 'object_id')[:CATALOG_SYNC_BATCH + 1]
+    )
+    has_more = len(entries) > CATALOG_SYNC_BATCH
+    entries = entries[:CATALOG_SYNC_BATCH]
+    changed_ids = defaultdict(set)
+    for _, kind, object_id in entries:
+        changed_ids[kind].add(object_id)
+
+    data = {'token': str(entries[-1][0] if entries else since), 'has_more': has_more}
+    for kind, (key, queryset, serializer_class, listed_field) in CATALOG_SYNC_FEEDS.items():
+        ids = changed_ids.get(kind, set())
+        # Whatever isn't there (or visible) any more is removed, however it got that way
+        rows = list(queryset.filter(pk__in=ids).order_by('pk')) if ids else []
+        visible = [row for row in rows if not listed_field or getattr(row, listed_field)]
+        data[key] = {
+            'changed': serializer_class(visible, many=True, context={'request': request}).data,
+            'removed': sorted(ids - {row.pk for row in visible}),
+        }
+    return Response(data)
 
 
 class ProfileViewSet(mixins.RetrieveModelMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
@@ -192,49 +279,24 @@ def create_order(request):
         
         
 
-        # Use database transaction to prevent race conditions
-        from django.db import transaction
-        
-        with transaction.atomic():
-            order = Order.objects.create(
-                user=user,
-                full_name=data.get('full_name', ''),
-                email=data.get('email', ''),
-                amount_paid=data.get('amount_paid', 0),
-                shipping_address=data.get('shipping_address', {})
-            )
-
-            items = data.get('items', [])
-            for item in items:
-                product_id = item.get('product_id')
-                if not product_id:
-                    continue  # or handle the error appropriately
-
-                # Use select_for_update to prevent race conditions
-                product = Product.objects.select_for_update().get(id=product_id)
-                
-                # Check if enough quantity is available
-                if product.stock_quantity < item.get('quantity', 1):
-                    return Response({'error': f'Insufficient stock for product {product.name}'}, status=status.HTTP_400_BAD_REQUEST)
-
-                # Reduce the quantity
-                product.stock_quantity -= item.get('quantity', 1)
-                product.save()
-                
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    user=user,
-                    quantity=item.get('quantity', 1),
-                    price=item.get('price', 0)
-                )
+        # Prices, totals and stock come from the locked product rows
+        lines = [
+            (item['product_id'], int(item.get('quantity', 1)))
+            for item in data.get('items', [])
+            if item.get('product_id')
+        ]
+        place_order(
+            user,
+            lines,
+            payment_method='COD',
+            shipping_address=data.get('shipping_address', {}),
+            full_name=data.get('full_name', ''),
+        )
 
         return Response({'message': 'Order created successfully'}, status=status.HTTP_201_CREATED)
 
     except CustomUser.DoesNotExist:
         return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-    except Product.DoesNotExist:
-        return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
     except ValueError as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html
+from .invoices import iter_invoice_zip
 from .models import Order, OrderItem, Cart, CartItem
 
 # ---------------------------
@@ -40,7 +43,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from .models import Order, OrderItem, Cart, CartItem
-from mlmtree.utils import distribute_commission
+from mlmtree.utils import distribute_order_commission
 
 # ---------------------------
 # QR Payment Verification Action
@@ -61,22 +64,28 @@ def verify_qr_payments(modeladmin, request, queryset):
             payment.status = 'captured'
             payment.save()
 
-        # Distribute commission for each order item
-        order_items = OrderItem.objects.filter(order=order)
-        for item in order_items:
-            for _ in range(item.quantity):
-                distribute_commission(order.user, item.product)
+        # Distribute commission for the whole order
+        distribute_order_commission(order)
 
     modeladmin.message_user(request, "✅ Selected QR payments verified and commissions distributed.")
 
 
+@admin.action(description="Download invoices (zip)")
+def download_invoices(modeladmin, request, queryset):
+    # Streamed a few invoices at a time; use `manage.py export_invoices` for big exports
+    response = StreamingHttpResponse(iter_invoice_zip(queryset), content_type='application/zip')
+    filename = f"invoices-{timezone.now():%Y%m%d-%H%M%S}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 # ---------------------------
 # Order Admin
 # ---------------------------
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'amount_paid', 'is_shipped', 'is_delivered', 'view_invoice_link', 'payment_method', 'payment_status')
-    actions = [verify_qr_payments]  # <-- Add the action here
+    actions = [verify_qr_payments, download_invoices]  # <-- Add the action here
 
     def view_invoice_link(self, obj):
         url = reverse('admin_order_invoice', args=[obj.id])
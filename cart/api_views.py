@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -5,8 +7,33 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem
 from store.models import Product
-from .serializers import CartSerializer
-
+from api.serializers import ProductCardSerializer
+from .serializers import CartBatchSerializer, CompactCartItemSerializer
+from .utils import CartError, apply_cart_operations
+
+
+def compact_cart(request, cart):
+    """
+    The cart as compact lines plus totals, priced in one query.
+    ?expand=product adds each line's product card.
+    """
+    expand = 'product' in request.query_params.get('expand', '').split(',')
+    items = cart.items.with_prices()
+    if expand:
+        items = items.select_related('product__category').only(
+            'id', 'cart', 'quantity', 'product__category__id', 'product__category__name',
+            *(f'product__{name}' for name in ProductCardSerializer.MODEL_FIELDS),
+        )
+    else:
+        items = items.only('id', 'cart', 'quantity', 'product__id', 'product__profile_image', 'product__image_variants')
+    items = list(items)
+    context = {'request': request, 'expand_product': expand}
+    return {
+        'id': cart.pk,
+        'items': CompactCartItemSerializer(items, many=True, context=context).data,
+        'total_quantity': items[0].cart_quantity if items else 0,
+        'order_total': str(Decimal(items[0].cart_total if items else 0).quantize(Decimal('0.01'))),
+    }
 
 
 class CartView(APIView):
@@ -14,19 +41,33 @@ class CartView(APIView):
 
     def get(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(compact_cart(request, cart))
 
 
-class AddToCartView(APIView):
+class CartBatchView(APIView):
+    """
+    POST {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+    {"op": "set", "product_id": 2, "quantity": 1}, {"op": "remove", "product_id": 3}]}
+    applies every operation in one transaction (all or nothing) and
+    returns the cart like CartView does.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        print("== AddToCartView Called ==")
-        print("User:", request.user)
-        print("Authenticated:", request.user.is_authenticated)
-        print("POST data:", request.data)
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            apply_cart_operations(cart, serializer.validated_data['operations'])
+        except CartError as e:
+            return Response({'error': str(e), 'operation': e.index}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(compact_cart(request, cart))
+
 
+class AddToCartView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
 
@@ -99,8 +140,4 @@ class CartTotalView(APIView):
 
     def get(self, request):
         cart = get_object_or_404(Cart, user=request.user)
-        total = 0
-        for item in cart.items.all():
-            price = item.product.sale_price if item.product.is_sale else item.product.price
-            total += price * item.quantity
-        return Response({'total': total})
+        return Response({'total': cart.order_total()})
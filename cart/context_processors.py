@@ -1,10 +1,8 @@
-from .models import Cart
+from .utils import get_cart_summary
 
-def cart_item_count(request): 
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            return {'cart_item_count': sum(item.quantity for item in cart.items.all())}
-        except Cart.DoesNotExist:
-            return {'cart_item_count': 0}
-    return {'cart_item_count': 0}
+def cart_item_count(request):
+    # Memoised on the request; the summary itself is cached per user
+    if not hasattr(request, '_cart_summary'):
+        request._cart_summary = get_cart_summary(request.user)
+    summary = request._cart_summary
+    return {'cart_item_count': summary['item_count'], 'cart_summary': summary}
@@ -0,0 +1,217 @@
+"""
+Invoice PDFs.
+
+get_invoice() renders an order's invoice once per revision - a hash of
+everything printed on it - and keeps the PDF in media storage, so repeat
+views just stream the stored file. iter_invoice_zip() renders many invoices
+(in a process pool when given one) into a zip that is yielded chunk by
+chunk, for the admin action and `manage.py export_invoices`.
+
+render_invoice_pdf() only takes plain data and has no Django imports at
+module level, so pool workers can run it without setting Django up.
+"""
+import hashlib
+import json
+import zipfile
+from collections import deque
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+# Bump when the layout changes so cached PDFs are rendered again
+INVOICE_LAYOUT_VERSION = 2
+COMPANY_NAME = "Skyage Global Pvt Ltd"
+COMPANY_FOOTER = (
+    "Skyage Global Pvt Ltd",
+    "123, Business Street, City, Country",
+    "Email: info@skyageglobal.com | Phone: +91-XXXXXXXXXX",
+)
+
+
+def render_invoice_pdf(invoice):
+    """PDF bytes for an invoice_data() dict. Items flow onto as many pages as they need."""
+    buffer = BytesIO()
+    width, height = letter
+    doc = SimpleDocTemplate(
+        buffer, pagesize=letter, leftMargin=50, rightMargin=50, topMargin=90, bottomMargin=80,
+        title=f"Invoice {invoice['number']}", author=COMPANY_NAME,
+        invariant=True,  # same invoice, same bytes
+    )
+    styles = getSampleStyleSheet()
+    text = ParagraphStyle('invoice', parent=styles['Normal'], fontSize=12, leading=20)
+    cell = ParagraphStyle('invoice-cell', parent=styles['Normal'], fontSize=12, leading=14)
+
+    def page_frame(canvas, doc):
+        canvas.saveState()
+        canvas.setFont("Helvetica-Bold", 18)
+        canvas.drawString(50, height - 50, COMPANY_NAME)
+        canvas.setFont("Helvetica", 12)
+        canvas.drawString(50, height - 70, "Invoice")
+        canvas.drawRightString(width - 50, height - 70, f"#{invoice['number']} - page {doc.page}")
+        canvas.line(50, height - 75, width - 50, height - 75)
+        canvas.setFont("Helvetica", 10)
+        for offset, line in zip((50, 35, 20), COMPANY_FOOTER):
+            canvas.drawString(50, offset, line)
+        canvas.restoreState()
+
+    story = [
+        Paragraph(f"<b>Invoice #: {invoice['number']}</b>", text),
+        Paragraph(f"Customer: {escape(invoice['customer'])}", text),
+        Paragraph(f"Email: {escape(invoice['email'])}", text),
+        Paragraph(f"Shipping Address: {escape(invoice['shipping_address'])}", text),
+        Paragraph(f"Date: {invoice['date']}", text),
+        Spacer(1, 12),
+    ]
+    rows = [["Product", "Quantity", "Price", "Total"]]
+    rows += [
+        [Paragraph(escape(name), cell), quantity, f"₹{price}", f"₹{total}"]
+        for name, quantity, price, total in invoice['items']
+    ]
+    table = Table(rows, colWidths=[200, 100, 100, width - 500], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, 0), 'Helvetica-Bold', 12),
+        ('FONT', (0, 1), (-1, -1), 'Helvetica', 12),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.black),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.Color(0.95, 0.95, 0.95), colors.white]),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ]))
+    story += [
+        table,
+        Spacer(1, 12),
+        Paragraph(f"<b>Total Amount Paid: ₹{invoice['amount_paid']}</b>", text),
+    ]
+    doc.build(story, onFirstPage=page_frame, onLaterPages=page_frame)
+    return buffer.getvalue()
+
+
+def invoice_data(order, items):
+    """
+    Everything printed on the invoice as plain, picklable data.
+    `items` are (product name, quantity, price) tuples.
+    """
+    return {
+        'number': order.id,
+        'customer': order.full_name or f"{order.user.first_name} {order.user.last_name}".strip(),
+        'email': order.email or order.user.email,
+        'shipping_address': order.shipping_address,
+        'date': order.date_ordered.strftime('%d %B %Y'),
+        'items': [
+            (name, quantity, f"{price:.2f}", f"{price * quantity:.2f}")
+            for name, quantity, price in items
+        ],
+        'amount_paid': f"{order.amount_paid:.2f}",
+    }
+
+
+def invoice_revision(invoice):
+    payload = json.dumps([INVOICE_LAYOUT_VERSION, invoice], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _order_items(order_ids):
+    """{order_id: [(name, quantity, price)]} in one query."""
+    from cart.models import OrderItem
+
+    items = {order_id: [] for order_id in order_ids}
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id', 'pk')
+        .values_list('order_id', 'product__name', 'quantity', 'price')
+    )
+    for order_id, name, quantity, price in rows:
+        items[order_id].append((name, quantity, price))
+    return items
+
+
+def get_invoice(order):
+    """
+    Returns a file object with the order's invoice PDF, rendering and
+    storing it only if nothing is stored for the current revision yet.
+    `order` should come with its user (select_related).
+    """
+    from django.core.files.base import ContentFile
+    from cart.models import Order
+
+    invoice = invoice_data(order, _order_items([order.pk])[order.pk])
+    revision = invoice_revision(invoice)
+    if order.invoice_revision == revision and order.invoice_file:
+        try:
+            return order.invoice_file.open('rb')
+        except OSError:
+            pass  # gone from storage, render it again
+
+    pdf = render_invoice_pdf(invoice)
+    storage = order.invoice_file.storage
+    name = storage.save(f"invoices/invoice-{order.pk}-{revision[:12]}.pdf", ContentFile(pdf))
+    old_name = order.invoice_file.name
+    # Guarded so two renders of the same order don't both swap their file in
+    if Order.objects.filter(pk=order.pk, invoice_revision=order.invoice_revision).update(
+        invoice_file=name, invoice_revision=revision,
+    ):
+        if old_name:
+            storage.delete(old_name)
+    else:
+        storage.delete(name)
+    return BytesIO(pdf)
+
+
+class _ZipSink:
+    """Write-only file for ZipFile that hands back what was written so far."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _rendered_invoices(orders, executor=None, batch_size=200, max_pending=8):
+    """Yields (filename, pdf) for `orders` in pk order, keeping at most `max_pending` renders in flight."""
+    pending = deque()
+    last_pk = 0
+    while True:
+        batch = list(orders.filter(pk__gt=last_pk).select_related('user').order_by('pk')[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        items = _order_items([order.pk for order in batch])
+        for order in batch:
+            invoice = invoice_data(order, items[order.pk])
+            filename = f"invoice-{order.pk}.pdf"
+            if executor is None:
+                yield filename, render_invoice_pdf(invoice)
+                continue
+            pending.append((filename, executor.submit(render_invoice_pdf, invoice)))
+            if len(pending) >= max_pending:
+                filename, future = pending.popleft()
+                yield filename, future.result()
+    while pending:
+        filename, future = pending.popleft()
+        yield filename, future.result()
+
+
+def iter_invoice_zip(orders, executor=None, batch_size=200, max_pending=8):
+    """
+    Yields a zip of the invoices for an Order queryset, a few invoices at a
+    time, so the archive never has to fit in memory.
+    """
+    sink = _ZipSink()
+    # PDFs are compressed already
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, pdf in _rendered_invoices(orders, executor, batch_size, max_pending):
+            archive.writestr(filename, pdf)
+            yield sink.drain()
+    yield sink.drain()
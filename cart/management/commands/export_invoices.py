@@ -0,0 +1,57 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from cart.invoices import iter_invoice_zip
+from cart.models import Order
+
+
+class Command(BaseCommand):
+    help = "Renders order invoices in a process pool and writes them to a zip file (or stdout with '-')."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Zip file to write, or - for stdout.")
+        parser.add_argument("--ids", nargs="+", type=int, help="Only these orders.")
+        parser.add_argument("--since", type=date.fromisoformat, help="Orders placed on or after this date (YYYY-MM-DD).")
+        parser.add_argument("--until", type=date.fromisoformat, help="Orders placed before this date (YYYY-MM-DD).")
+        parser.add_argument("--status", help="Only orders with this status.")
+        parser.add_argument("--workers", type=int, default=4, help="Pool size; 0 renders inline.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Orders read from the database at a time.")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        if options["ids"]:
+            orders = orders.filter(pk__in=options["ids"])
+        if options["since"]:
+            orders = orders.filter(date_ordered__date__gte=options["since"])
+        if options["until"]:
+            orders = orders.filter(date_ordered__date__lt=options["until"])
+        if options["status"]:
+            orders = orders.filter(status=options["status"])
+
+        # Spawned workers only run ReportLab: no Django setup, no inherited DB connections
+        executor = None
+        if options["workers"] > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn"),
+            )
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        written = 0
+        try:
+            chunks = iter_invoice_zip(
+                orders, executor, options["batch_size"], max_pending=max(options["workers"], 1) * 2,
+            )
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+            if executor:
+                executor.shutdown()
+
+        if options["output"] != "-":
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}."))
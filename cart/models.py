@@ -30,6 +30,15 @@ class Order(models.Model):
     shipped_at = models.DateTimeField(null=True, blank=True)
     is_delivered = models.BooleanField(default=False)
     delivered_at = models.DateTimeField(null=True, blank=True)
+    # Rendered invoice PDF and the revision it was rendered for (see cart/invoices.py)
+    invoice_file = models.FileField(upload_to='invoices/', blank=True, editable=False)
+    invoice_revision = models.CharField(max_length=40, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Order history, newest first
+            models.Index(fields=['user', '-date_ordered'], name='cart_order_user_date_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id}"
@@ -58,6 +67,27 @@ class OrderItem(models.Model):
 from django.db import models
 from store.models import Product
 from users.models import CustomUser
+from decimal import Decimal
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Sum, When, Window
+
+class CartItemQuerySet(models.QuerySet):
+    def with_prices(self):
+        """
+        Annotates each line with unit_price (sale price when on sale), line_total
+        and, through window sums, the cart's total_quantity and order_total -
+        so a whole cart is priced by one query.
+        """
+        money = DecimalField(max_digits=12, decimal_places=2)
+        return self.select_related('product').annotate(
+            unit_price=Case(
+                When(product__is_sale=True, then=F('product__sale_price')),
+                default=F('product__price'),
+                output_field=money,
+            ),
+            line_total=ExpressionWrapper(F('quantity') * F('unit_price'), output_field=money),
+            cart_quantity=Window(Sum('quantity'), partition_by=[F('cart_id')]),
+            cart_total=Window(Sum('line_total'), partition_by=[F('cart_id')], output_field=money),
+        ).order_by('pk')
 
 class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='cart')
@@ -66,18 +96,35 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart {self.id} for {self.user.email if self.user and self.user.email else 'Unknown'}"
     def get_prods(self):
-        return self.items.select_related('product').all()
+        return self.items.with_prices()
     def get_quants(self):
-        return {str(item.product.id): item.quantity for item in self.items.all()}
+        return {str(product_id): quantity for product_id, quantity in self.items.values_list('product_id', 'quantity')}
+
+    def get_pricing(self):
+        """Priced lines plus total_quantity and order_total, from a single query."""
+        items = list(self.items.with_prices())
+        return {
+            'items': items,
+            'total_quantity': items[0].cart_quantity if items else 0,
+            'order_total': Decimal(items[0].cart_total if items else 0).quantize(Decimal('0.01')),
+        }
 
     def order_total(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.get_pricing()['order_total']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One line per product, so racing get_or_create calls can't add a second
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_cartitem_unique_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name if self.product and self.product.name else 'Unknown Product'}"
 
@@ -87,12 +134,12 @@ class CartItem(models.Model):
 
     @property
     def imageURL(self):
-        if self.product and self.product.image:
-            return self.product.image.url
-        return ''
+        return self.product.variant_url('thumb') if self.product else ''
 
     @property
     def price(self):
+        if hasattr(self, 'unit_price'):  # annotated by with_prices()
+            return self.unit_price
         if hasattr(self.product, 'is_sale') and self.product.is_sale:
             return self.product.sale_price
         return self.product.price
@@ -103,11 +150,6 @@ class CartItem(models.Model):
 
     @property
     def total_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.price * self.quantity
-    
-    @property
-    def imageURL(self):
-        try:
-            return self.product.image.url if self.product.image else ""
-        except AttributeError:
-            return ""  # fallback if product.image doesn't exist
@@ -1,25 +1,49 @@
 from rest_framework import serializers
-from store.models import Product
-from .models import Cart, CartItem
-from api.serializers import ProductSerializer
+from .models import CartItem
+from api.serializers import ProductCardSerializer
+from .utils import CART_BATCH_LIMIT
+
+
+class CompactCartItemSerializer(serializers.ModelSerializer):
+    """
+    A cart line as ids and numbers plus a thumbnail URL, for the mobile
+    cart. Expects lines from CartItem.objects.with_prices(). With
+    context['expand_product'] it also embeds the product card.
+    """
+    product_id = serializers.IntegerField(read_only=True)
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    line_total = serializers.DecimalField(source='total_price', max_digits=12, decimal_places=2, read_only=True)
+    thumb = serializers.SerializerMethodField()
 
-from django.contrib.auth import authenticate
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product_id', 'quantity', 'price', 'line_total', 'thumb']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('expand_product'):
+            self.fields['product'] = ProductCardSerializer(read_only=True)
 
+    def get_thumb(self, item):
+        url = item.imageURL
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if url and request is not None else url
 
 
-# CartItem serializer with product and quantity
-class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer()
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, required=False)
 
-    class Meta:
-        model = CartItem
-        fields = ['id', 'product', 'quantity']
+    def validate(self, data):
+        if data['op'] == 'add':
+            data.setdefault('quantity', 1)
+            if data['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Add at least one item.'})
+        elif data['op'] == 'set' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return data
 
-# Full Cart with items
-class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
 
-    class Meta:
-        model = Cart
-        fields = ['id', 'user', 'items', 'created_at']
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=CART_BATCH_LIMIT)
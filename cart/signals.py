@@ -0,0 +1,30 @@
+# cart/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from store.models import Product
+from .models import Cart, CartItem
+from .utils import invalidate_cart_summary
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id:
+        invalidate_cart_summary(user_id)
+
+
+@receiver(post_delete, sender=Cart)
+def cart_deleted(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created, **kwargs):
+    # Subtotals use the live price, so carts holding the product go stale
+    if not created:
+        user_ids = set(
+            CartItem.objects.filter(product=instance).values_list('cart__user_id', flat=True)
+        )
+        if user_ids:
+            invalidate_cart_summary(*user_ids)
@@ -1,3 +1,285 @@
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
 from django.test import TestCase
 
-# Create your tests here.
+from cart.invoices import get_invoice, invoice_data, iter_invoice_zip
+from cart.models import Cart, CartItem, Order, OrderItem
+from cart.utils import get_cart_summary
+from ecommerce.testing import QueryBudgetMixin, TempMediaMixin
+from store.models import Category, Product
+from users.models import CustomUser
+
+
+class CartApiTests(QueryBudgetMixin, TestCase):
+    """The mobile cart API: compact cart payloads and all-or-nothing batch updates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        category = Category.objects.create(name="Shoes")
+        cls.products = [
+            Product.objects.create(
+                name=f"Runner {i}", price=Decimal("10.00"), category=category, stock_quantity=5,
+            )
+            for i in range(4)
+        ]
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def batch(self, *operations, **kwargs):
+        return self.client.post(
+            "/api/cart/batch/", {"operations": list(operations)}, content_type="application/json", **kwargs,
+        )
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list("product_id", "quantity"))
+
+    def test_batch(self):
+        first, second, third, fourth = self.products
+        CartItem.objects.create(cart=self.cart, product=first, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=second, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=third, quantity=1)
+
+        response = self.batch(
+            {"op": "add", "product_id": first.pk, "quantity": 2},
+            {"op": "set", "product_id": second.pk, "quantity": 4},
+            {"op": "remove", "product_id": third.pk},
+            {"op": "add", "product_id": fourth.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {first.pk: 3, second.pk: 4, fourth.pk: 1})
+        data = response.json()
+        self.assertEqual(data["total_quantity"], 8)
+        self.assertEqual(data["order_total"], "80.00")
+        self.assertEqual(
+            set(data["items"][0]), {"id", "product_id", "quantity", "price", "line_total", "thumb"},
+        )
+
+    def test_batch_is_all_or_nothing(self):
+        first, second = self.products[:2]
+        CartItem.objects.create(cart=self.cart, product=first, quantity=1)
+        response = self.batch(
+            {"op": "set", "product_id": first.pk, "quantity": 0},
+            {"op": "add", "product_id": second.pk, "quantity": 3},
+            {"op": "add", "product_id": second.pk, "quantity": 3},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["operation"], 2)
+        self.assertEqual(self.quantities(), {first.pk: 1})
+
+        response = self.batch({"op": "add", "product_id": 0})
+        self.assertEqual(response.json()["operation"], 0)
+        self.assertEqual(self.batch({"op": "set", "product_id": first.pk}).status_code, 400)
+        self.assertEqual(self.batch().status_code, 400)
+
+    def test_cart_query_count(self):
+        for product in self.products:
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        # Session and user, the cart, then its priced lines
+        data = self.assertQueryBudget("/api/cart/", 4).json()
+        self.assertEqual(len(data["items"]), 4)
+        self.assertNotIn("product", data["items"][0])
+
+        data = self.assertQueryBudget("/api/cart/?expand=product", 4).json()
+        self.assertEqual(data["items"][0]["product"]["name"], "Runner 0")
+        self.assertEqual(data["items"][0]["product"]["category_name"], "Shoes")
+
+
+class CartSummaryTests(TestCase):
+    """get_cart_summary is cached per cart version and bumped on committed changes only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        cls.product = Product.objects.create(name="Runner", price=Decimal("10.00"), stock_quantity=5)
+        cls.cart = Cart.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def summary(self):
+        return get_cart_summary(self.user)
+
+    def test_cached(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.summary()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.summary()["item_count"], 2)
+
+    def test_add_update_delete(self):
+        self.assertEqual(self.summary()["item_count"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=2)
+        self.assertEqual(self.summary(), {"item_count": 2, "line_count": 1, "subtotal": Decimal("20.00")})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.quantity = 3
+            item.save()
+        self.assertEqual(self.summary()["subtotal"], Decimal("30.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=self.product.pk)
+            product.price = Decimal("12.00")
+            product.save()
+        self.assertEqual(self.summary()["subtotal"], Decimal("36.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.summary(), {"item_count": 0, "line_count": 0, "subtotal": Decimal("0.00")})
+
+    def test_invalidated_on_commit_only(self):
+        self.summary()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        # Not committed yet: the cached summary still stands
+        self.assertEqual(self.summary()["item_count"], 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.summary()["item_count"], 1)
+
+        # A rolled back change never bumps the version
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    CartItem.objects.filter(cart=self.cart).update(quantity=1)
+                    CartItem.objects.get(cart=self.cart).delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.summary()["item_count"], 1)
+
+
+class CartPricingTests(TestCase):
+    """with_prices()/get_pricing() agree with the old per-item arithmetic."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        cls.products = [
+            Product.objects.create(name="Plain", price=Decimal("19.99"), stock_quantity=5),
+            Product.objects.create(
+                name="Sale", price=Decimal("40.00"), is_sale=True, sale_price=Decimal("33.33"), stock_quantity=5,
+            ),
+            Product.objects.create(name="Was on sale", price=Decimal("7.50"), stock_quantity=5),
+        ]
+        # is_sale switched off with the sale_price left behind, which must be ignored
+        Product.objects.filter(pk=cls.products[2].pk).update(sale_price=Decimal("1.00"))
+        cls.cart = Cart.objects.create(user=cls.user)
+        for product, quantity in zip(cls.products, [3, 2, 4]):
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=quantity)
+        # Someone else's cart mustn't leak into the window sums
+        other = Cart.objects.create(user=CustomUser.objects.create_user("other@example.com", "pw"))
+        CartItem.objects.create(cart=other, product=cls.products[0], quantity=9)
+
+    def test_matches_per_item_sum(self):
+        # Plain instances, so price/total_price take the un-annotated path
+        plain = [CartItem.objects.get(pk=item.pk) for item in self.cart.items.all()]
+        pricing = self.cart.get_pricing()
+
+        self.assertEqual(pricing["total_quantity"], sum(item.quantity for item in plain))
+        self.assertEqual(pricing["order_total"], sum(item.total_price for item in plain))
+        self.assertEqual(pricing["order_total"], Decimal("156.63"))
+        self.assertEqual(
+            [(item.pk, item.price, item.total_price) for item in pricing["items"]],
+            [(item.pk, item.price, item.total_price) for item in sorted(plain, key=lambda item: item.pk)],
+        )
+        self.assertEqual(self.cart.order_total(), pricing["order_total"])
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            self.cart.get_pricing()
+
+    def test_empty_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        self.assertEqual(cart.get_pricing(), {"items": [], "total_quantity": 0, "order_total": Decimal("0.00")})
+
+
+class InvoiceTests(TempMediaMixin, TestCase):
+    """Invoice PDFs: stored once per revision, re-rendered on change, zipped in bulk."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw", first_name="Sam", last_name="Shopper")
+        cls.products = [
+            Product.objects.create(name=f"Runner {i}", price=Decimal("10.00"), stock_quantity=50) for i in range(3)
+        ]
+        cls.orders = []
+        for n in range(3):
+            order = Order.objects.create(user=cls.user, shipping_address="1 Test Road", amount_paid=Decimal("30.00"))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, user=cls.user, quantity=n + 1, price=product.price)
+                for product in cls.products
+            ])
+            cls.orders.append(order)
+
+    def order(self):
+        return Order.objects.select_related("user").get(pk=self.orders[0].pk)
+
+    def test_customer_falls_back_to_user_name(self):
+        self.assertEqual(invoice_data(self.order(), [])["customer"], "Sam Shopper")
+
+    def test_stored_once_per_revision(self):
+        pdf = get_invoice(self.order()).read()
+        self.assertTrue(pdf.startswith(b"%PDF"))
+        order = self.order()
+        self.assertTrue(order.invoice_revision)
+        self.assertTrue(order.invoice_file.storage.exists(order.invoice_file.name))
+
+        # Same revision: streamed from storage, not rendered again
+        with mock.patch("cart.invoices.render_invoice_pdf", side_effect=AssertionError("rendered again")):
+            with get_invoice(order) as stored:
+                self.assertEqual(stored.read(), pdf)
+
+    def test_rendered_again_after_change(self):
+        get_invoice(self.order())
+        old = self.order()
+
+        OrderItem.objects.filter(order=old).update(quantity=7)
+        changed = get_invoice(self.order()).read()
+
+        order = self.order()
+        self.assertNotEqual(order.invoice_revision, old.invoice_revision)
+        self.assertNotEqual(order.invoice_file.name, old.invoice_file.name)
+        self.assertEqual(order.invoice_file.open("rb").read(), changed)
+        self.assertFalse(order.invoice_file.storage.exists(old.invoice_file.name))
+
+        # So does anything else printed on it
+        Order.objects.filter(pk=order.pk).update(shipping_address="2 Other Road")
+        get_invoice(self.order())
+        self.assertNotEqual(self.order().invoice_revision, order.invoice_revision)
+
+    def assertZipOfInvoices(self, data):
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), [f"invoice-{order.pk}.pdf" for order in self.orders])
+            for name in archive.namelist():
+                self.assertTrue(archive.read(name).startswith(b"%PDF"), name)
+
+    def test_streamed_zip(self):
+        chunks = list(iter_invoice_zip(Order.objects.all(), batch_size=2))
+        self.assertGreater(len(chunks), len(self.orders))  # yielded as it goes, not in one piece
+        self.assertZipOfInvoices(b"".join(chunks))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            self.assertZipOfInvoices(b"".join(iter_invoice_zip(Order.objects.all(), executor, max_pending=1)))
+
+    def test_export_invoices(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "invoices.zip")
+            call_command("export_invoices", path, "--workers=0", stdout=StringIO())
+            with open(path, "rb") as output:
+                self.assertZipOfInvoices(output.read())
@@ -1,69 +1,125 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from io import BytesIO
-from django.http import HttpResponse
-from cart.models import Order
-
-def generate_invoice(order_id):
-    order = Order.objects.get(id=order_id)
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-
-    # --- Company Header ---
-    p.setFont("Helvetica-Bold", 18)
-    p.drawString(50, height - 50, "Skyage Global Pvt Ltd")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, height - 70, "Invoice")
-    p.line(50, height - 75, width - 50, height - 75)
-
-    # --- Customer Details ---
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, height - 100, f"Invoice #: {order.id}")
-    p.setFont("Helvetica", 12)
-    p.drawString(50, height - 120, f"Customer: {order.full_name or order.user.get_full_name()}")
-    p.drawString(50, height - 140, f"Email: {order.email or order.user.email}")
-    p.drawString(50, height - 160, f"Shipping Address: {order.shipping_address}")
-    p.drawString(50, height - 180, f"Date: {order.date_ordered.strftime('%d %B %Y')}")
-
-    # --- Table Header ---
-    table_y = height - 210
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, table_y, "Product")
-    p.drawString(250, table_y, "Quantity")
-    p.drawString(350, table_y, "Price")
-    p.drawString(450, table_y, "Total")
-    p.line(50, table_y - 5, width - 50, table_y - 5)
-
-    # --- Table Rows ---
-    y = table_y - 25
-    p.setFont("Helvetica", 12)
-    for index, item in enumerate(order.items.all()):
-        if index % 2 == 0:
-            p.setFillColorRGB(0.95, 0.95, 0.95)  # light gray background
-            p.rect(50, y - 5, width - 100, 20, fill=1, stroke=0)
-            p.setFillColor(colors.black)
-        p.drawString(50, y, item.product.name)
-        p.drawString(250, y, str(item.quantity))
-        p.drawString(350, y, f"₹{item.price:.2f}")
-        p.drawString(450, y, f"₹{item.price * item.quantity:.2f}")
-        y -= 25
-
-    # --- Total Amount ---
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(50, y - 10, f"Total Amount Paid: ₹{order.amount_paid:.2f}")
-    p.line(50, y - 15, width - 50, y - 15)
-
-    # --- Footer ---
-    p.setFont("Helvetica", 10)
-    p.drawString(50, 50, "Skyage Global Pvt Ltd")
-    p.drawString(50, 35, "123, Business Street, City, Country")
-    p.drawString(50, 20, "Email: info@skyageglobal.com | Phone: +91-XXXXXXXXXX")
-
-    # Finish PDF
-    p.showPage()
-    p.save()
-    buffer.seek(0)
-    return buffer
+import time
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Sum, When
+from cart.models import Cart, CartItem
+from store.models import Product
+
+CART_SUMMARY_TIMEOUT = 60 * 15
+CART_BATCH_LIMIT = 50
+
+
+class CartError(ValueError):
+    """Raised when a batch of cart operations can't be applied; `index` is the operation at fault."""
+
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.index = index
+
+
+def _cart_version_key(user_id):
+    return f"cart-summary-version:{user_id}"
+
+
+def _cart_version(user_id):
+    # Seeded from the clock so an evicted counter never restarts at an old value
+    key = _cart_version_key(user_id)
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def get_cart_summary(user):
+    """
+    Returns {'item_count', 'line_count', 'subtotal'} for the user's cart.
+    Computed with one aggregate query and cached under the cart's current
+    version, so any cart mutation (see cart.signals) makes it stale. The
+    version lives in the cache too, so workers only see each other's bumps
+    on a shared backend (see CACHES in settings).
+    """
+    if not user.is_authenticated:
+        return {'item_count': 0, 'line_count': 0, 'subtotal': Decimal('0.00')}
+
+    key = f"cart-summary:{user.pk}:{_cart_version(user.pk)}"
+    summary = cache.get(key)
+    if summary is None:
+        totals = CartItem.objects.filter(cart__user_id=user.pk).aggregate(
+            item_count=Sum('quantity'),
+            line_count=Count('id'),
+            subtotal=Sum(
+                F('quantity') * Case(
+                    When(product__is_sale=True, then=F('product__sale_price')),
+                    default=F('product__price'),
+                ),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        summary = {
+            'item_count': totals['item_count'] or 0,
+            'line_count': totals['line_count'],
+            'subtotal': Decimal(totals['subtotal'] or 0).quantize(Decimal('0.01')),
+        }
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(*user_ids):
+    """Bumps the cart version of each user once the current transaction commits."""
+    def bump():
+        for user_id in user_ids:
+            try:
+                cache.incr(_cart_version_key(user_id))
+            except ValueError:
+                pass  # no version yet, so nothing cached either
+    transaction.on_commit(bump)
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Applies [{'op': 'add'|'set'|'remove', 'product_id', 'quantity'}, ...]
+    to `cart` in order and in one transaction, so either all of them land
+    or none does. add puts `quantity` more of the product in the cart, set
+    makes it exactly `quantity` (0 drops the line) and remove drops the
+    line. The resulting quantities are checked against stock, as
+    AddToCartView does. Raises CartError for an unknown product or too
+    little stock.
+    """
+    product_ids = {operation['product_id'] for operation in operations}
+    with transaction.atomic():
+        # Batches on the same cart take turns
+        list(Cart.objects.select_for_update().filter(pk=cart.pk).values_list('pk', flat=True))
+        lines = {item.product_id: item for item in cart.items.filter(product_id__in=product_ids)}
+        stock = dict(Product.objects.filter(pk__in=product_ids).values_list('pk', 'stock_quantity'))
+
+        quantities = {product_id: item.quantity for product_id, item in lines.items()}
+        for index, operation in enumerate(operations):
+            product_id = operation['product_id']
+            if product_id not in stock:
+                raise CartError(f"Product {product_id} does not exist.", index)
+            if operation['op'] == 'remove':
+                quantities[product_id] = 0
+                continue
+            quantity = operation['quantity']
+            if operation['op'] == 'add':
+                quantity += quantities.get(product_id, 0)
+            if quantity > stock[product_id]:
+                raise CartError(f"Only {stock[product_id]} item(s) available in stock.", index)
+            quantities[product_id] = quantity
+
+        removed = [product_id for product_id, item in lines.items() if not quantities[product_id]]
+        changed = []
+        for product_id, item in lines.items():
+            if quantities[product_id] and quantities[product_id] != item.quantity:
+                item.quantity = quantities[product_id]
+                changed.append(item)
+        added = [
+            CartItem(cart=cart, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+            if quantity and product_id not in lines
+        ]
+        if removed:
+            cart.items.filter(product_id__in=removed).delete()
+        CartItem.objects.bulk_update(changed, ['quantity'])
+        CartItem.objects.bulk_create(added)
+        # The bulk writes skip the CartItem signals
+        invalidate_cart_summary(cart.user_id)
@@ -9,6 +9,10 @@ from cart.models import Cart, CartItem, Order, OrderItem
 from store.models import Product
 from users.forms import ShippingAddressForm
 from users.models import ShippingAddress
+from .utils import get_cart_summary
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def login_required_ajax(view_func):
@@ -40,14 +44,12 @@ def login_required_ajax(view_func):
 @login_required_ajax
 def cart(request):
     cart, _ = Cart.objects.get_or_create(user=request.user)
-    items = cart.items.select_related('product').all()
-    total_quantity = sum(item.quantity for item in items)
-    order_total = sum((item.product.sale_price if item.product.is_sale else item.product.price) * item.quantity for item in items)
+    pricing = cart.get_pricing()
 
     context = {
-        'cart_items': items,
-        'total_quantity': total_quantity,
-        'order_total': order_total,
+        'cart_items': pricing['items'],
+        'total_quantity': pricing['total_quantity'],
+        'order_total': pricing['order_total'],
     }
     return render(request, 'cart/cart.html', context)
 
@@ -72,8 +74,12 @@ def cart_add(request):
         cart_item.save()
 
         messages.success(request, f"{product.name} added to cart.")
-        cart_quantity = sum(item.quantity for item in cart.items.all())
-        return JsonResponse({'qty': cart_quantity})
+        summary = get_cart_summary(request.user)
+        return JsonResponse({
+            'qty': summary['item_count'],
+            'lines': summary['line_count'],
+            'subtotal': str(summary['subtotal']),
+        })
 
 
 
@@ -86,9 +92,6 @@ def cart_update(request):
             cart_item_id = int(request.POST.get('product_id'))
             new_quantity = int(request.POST.get('product_qty'))
 
-            print("✅ cart_update view triggered")
-            print("🛒 CartItem ID received:", cart_item_id)
-
             # Get cart item by ID
             cart = get_object_or_404(Cart, user=request.user)
             cart_item = get_object_or_404(CartItem, cart=cart, id=cart_item_id)
@@ -100,7 +103,7 @@ def cart_update(request):
 
             return JsonResponse({'qty': cart_item.quantity})
         except Exception as e:
-            print("❌ Error in cart_update:", e)
+            logger.exception("cart_update failed")
             return JsonResponse({'error': str(e)}, status=500)
 
     return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -119,12 +122,7 @@ def cart_delete(request):
 @login_required
 def checkout(request):
     cart = get_object_or_404(Cart, user=request.user)
-    cart_items = cart.items.select_related('product').all()
-    total_quantity = sum(item.quantity for item in cart_items)
-    order_total = sum(
-        (item.product.sale_price if item.product.is_sale else item.product.price) * item.quantity
-        for item in cart_items
-    )
+    pricing = cart.get_pricing()
 
     try:
         shipping_address = ShippingAddress.objects.get(user=request.user)
@@ -159,9 +157,9 @@ def checkout(request):
         form = ShippingAddressForm(instance=shipping_address)
 
     context = {
-        'cart_items': cart_items,
-        'total_quantity': total_quantity,
-        'order_total': order_total,
+        'cart_items': pricing['items'],
+        'total_quantity': pricing['total_quantity'],
+        'order_total': pricing['order_total'],
         'form': form,
         'user_profile': request.user.profile,
     }
@@ -227,16 +225,16 @@ def order_detail(request, order_id):
     return render(request, 'users/order_detail.html', {'order': order})
 
 
-from django.http import HttpResponse
-from .utils import generate_invoice
+from django.http import FileResponse, HttpResponse
+from .invoices import get_invoice
 
 def view_invoice(request, order_id):
-    order = Order.objects.get(id=order_id)
+    order = get_object_or_404(Order.objects.select_related('user'), id=order_id)
     if request.user != order.user:
         return HttpResponse("Unauthorized", status=401)
 
-    pdf_file = generate_invoice(order_id)
-    return HttpResponse(pdf_file, content_type='application/pdf')
+    # Rendered once per invoice revision, then streamed from storage
+    return FileResponse(get_invoice(order), content_type='application/pdf', filename=f"invoice-{order.id}.pdf")
 
 
 from django.shortcuts import render, get_object_or_404
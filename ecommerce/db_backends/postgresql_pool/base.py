@@ -0,0 +1,120 @@
+# ecommerce/db_backends/postgresql_pool/base.py
+"""
+PostgreSQL backend that borrows connections from a per-process psycopg2
+ThreadedConnectionPool instead of opening a new one (TCP + TLS + auth) for
+every request. Enabled with DB_POOL=true (see settings.py):
+
+    'ENGINE': 'ecommerce.db_backends.postgresql_pool',
+    'CONN_MAX_AGE': 0,            # hand the connection back after each request
+    'POOL': {'MIN_SIZE': 1, 'MAX_SIZE': 10, 'TIMEOUT': 10},
+
+Every worker process has its own pool, so MAX_SIZE should be at least the
+number of threads per process (gunicorn --threads), and workers x MAX_SIZE
+(for each database alias) has to stay below the server's max_connections.
+When all MAX_SIZE connections are out, a request waits up to TIMEOUT
+seconds for one to come back and then fails with OperationalError.
+
+With CONN_HEALTH_CHECKS a borrowed connection is pinged before use and
+replaced if the server dropped it.
+"""
+import os
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+if is_psycopg3:
+    raise ImproperlyConfigured("The pooled PostgreSQL backend needs psycopg2.")
+
+import psycopg2.extras  # noqa: E402
+from psycopg2 import pool as psycopg2_pool  # noqa: E402
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE  # noqa: E402
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _pools = {}
+    _pools_lock = threading.Lock()
+    # Per pool, notified whenever a connection goes back into it
+    _returned = {}
+
+    def _get_pool(self, conn_params):
+        # Keyed by pid too: a pool must never be shared across a fork
+        key = (self.alias, os.getpid())
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    options = self.settings_dict.get('POOL') or {}
+                    pool = psycopg2_pool.ThreadedConnectionPool(
+                        options.get('MIN_SIZE', 1), options.get('MAX_SIZE', 10), **conn_params,
+                    )
+                    self._returned[key] = threading.Condition()
+                    self._pools[key] = pool
+        return pool
+
+    def _borrow(self, pool):
+        """
+        A connection from `pool`, waiting up to POOL['TIMEOUT'] seconds for
+        one to be handed back when all of them are in use.
+        """
+        options = self.settings_dict.get('POOL') or {}
+        returned = self._returned[(self.alias, os.getpid())]
+        deadline = time.monotonic() + options.get('TIMEOUT', 10)
+        with returned:
+            while True:
+                try:
+                    return pool.getconn()
+                except psycopg2_pool.PoolError:
+                    if pool.closed:
+                        raise
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise psycopg2.OperationalError(
+                            f"All {options.get('MAX_SIZE', 10)} pooled connections to '{self.alias}' "
+                            f"stayed in use for {options.get('TIMEOUT', 10)}s; raise DB_POOL_MAX_SIZE "
+                            f"to at least the threads per worker process."
+                        ) from None
+                    returned.wait(remaining)
+
+    def _give_back(self, pool, connection, close=False):
+        pool.putconn(connection, close=close)
+        returned = self._returned[(self.alias, os.getpid())]
+        with returned:
+            returned.notify()
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool(conn_params)
+        connection = self._borrow(pool)
+        if self.settings_dict['CONN_HEALTH_CHECKS']:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except psycopg2.Error:
+                self._give_back(pool, connection, close=True)
+                connection = self._borrow(pool)
+        elif connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+
+        # Same per-connection setup as the stock backend
+        options = self.settings_dict['OPTIONS']
+        if 'isolation_level' in options:
+            self.isolation_level = base.IsolationLevel(options['isolation_level'])
+            connection.isolation_level = self.isolation_level
+        else:
+            self.isolation_level = base.IsolationLevel.READ_COMMITTED
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = self._pools.get((self.alias, os.getpid()))
+        with self.wrap_database_errors:
+            if pool is None or self.connection.closed:
+                return self.connection.close()
+            # putconn() rolls back anything left open and drops broken connections
+            self._give_back(pool, self.connection)
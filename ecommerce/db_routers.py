@@ -0,0 +1,156 @@
+# ecommerce/db_routers.py
+"""
+Read-replica routing.
+
+Nothing reads from the replica unless asked to: wrap read-only views in
+@replica_reads (or a block of code in `with use_replica():`) and their
+reads go to the 'replica' alias when one is configured. Writes always go
+to the primary, and once a request has written, the rest of it reads the
+primary too. "Written" means an INSERT/UPDATE/DELETE actually ran there:
+lookups that are merely routed as writes (get_or_create finding its row,
+select_for_update) don't count.
+
+Replicas lag a little, so PrimaryPinMiddleware keeps a user on the primary
+for REPLICA_STICKY_SECONDS after a request of theirs wrote something (cart,
+checkout, payout...): a cookie for the browser, plus a cache entry for
+signed-in users so it holds across their devices and API clients.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'db_primary_until'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+_WRITE_SQL = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def replica_configured():
+    return settings.REPLICA_READS and REPLICA_DB_ALIAS in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f"db-primary-pin:{user_id}"
+
+
+def _note_writes(execute, sql, params, many, context):
+    if _WRITE_SQL.match(sql):
+        _wrote.set(True)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def watch_writes():
+    """Records in _wrote when a write statement runs on the primary inside the block."""
+    with connections[DEFAULT_DB_ALIAS].execute_wrapper(_note_writes):
+        yield
+
+
+@contextmanager
+def use_replica():
+    """Reads inside the block go to the replica, until something in it writes."""
+    reads_token, wrote_token = _replica_reads.set(True), _wrote.set(False)
+    try:
+        with watch_writes():
+            yield
+    finally:
+        wrote = _wrote.get()
+        _wrote.reset(wrote_token)
+        _replica_reads.reset(reads_token)
+        if wrote:
+            _wrote.set(True)  # still a write as far as the request is concerned
+
+
+def is_pinned_to_primary(request):
+    """True if the user wrote something recently enough that the replica may not have it."""
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and cache.get(_pin_key(user.pk)))
+
+
+def replica_reads(view_func):
+    """
+    Runs a read-only view against the replica. Only GET/HEAD requests are
+    routed, and not for users pinned to the primary after a write.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or not replica_configured()
+                or _wrote.get() or is_pinned_to_primary(request)):
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the 'replica' alias inside use_replica()/@replica_reads,
+    and everything else, including every write, to the primary - saves of
+    rows that were read from the replica too.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _wrote.get() and replica_configured():
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Routing isn't writing (get_or_create routes its lookup here too);
+        # watch_writes() notes the statements that really write
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # A real replica gets its schema from the primary and is never
+        # migrated directly; the local/test SQLite one needs the tables.
+        return True
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins the user to the primary for REPLICA_STICKY_SECONDS after a request
+    that wrote to the database. Goes after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        token = _wrote.set(False)
+        try:
+            with watch_writes():
+                response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _wrote.reset(token)
+
+        if wrote:
+            seconds = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, f"{time.time() + seconds:.0f}", max_age=seconds,
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                cache.set(_pin_key(user.pk), True, seconds)
+        return response
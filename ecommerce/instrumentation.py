@@ -0,0 +1,231 @@
+# ecommerce/instrumentation.py
+"""
+Per-request SQL and latency instrumentation.
+
+QueryInstrumentationMiddleware counts every query a request runs (on every
+database alias), its DB time, repeated query shapes (N+1 patterns) and wall
+time, keyed by URL name. With REQUEST_INSTRUMENTATION_HEADERS (on in DEBUG)
+they're added as X-DB-* / Server-Timing headers. In every mode they go to
+the `ecommerce.instrumentation` logger as one JSON line per request, and are
+summed per URL name for the staff-only request_metrics view: each worker
+adds them up in memory and flushes its totals to the cache every
+METRICS_FLUSH_SECONDS or METRICS_FLUSH_REQUESTS requests, so a request
+costs no cache round-trips of its own and the view lags by up to that much.
+
+Queries run while a streaming response is being consumed aren't counted.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+logger = logging.getLogger('ecommerce.instrumentation')
+
+METRICS_KEY_PREFIX = 'request-metrics'
+METRIC_FIELDS = ('requests', 'queries', 'duplicate_queries', 'db_us', 'wall_us')
+METRICS_FLUSH_SECONDS = 10
+METRICS_FLUSH_REQUESTS = 100
+
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """The query's shape: IN lists and inlined numbers (LIMIT/OFFSET) folded."""
+    return _NUMBER.sub('N', _IN_LIST.sub('(...)', sql))
+
+
+class QueryCollector:
+    """execute_wrapper that tallies queries, DB time and query shapes."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicate_count(self):
+        """Queries that repeated an earlier query's shape."""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def top_duplicates(self, limit=5):
+        return [(sql, count) for sql, count in self.fingerprints.most_common(limit) if count > 1]
+
+
+@contextmanager
+def collect_queries():
+    """Collects the queries run inside the block on every database alias."""
+    collector = QueryCollector()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        yield collector
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.add_headers = getattr(settings, 'REQUEST_INSTRUMENTATION_HEADERS', settings.DEBUG)
+        self.query_warning = getattr(settings, 'QUERY_COUNT_WARNING', 50)
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect_queries() as queries:
+            response = self.get_response(request)
+        wall = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        stats = {
+            'view': match.view_name if match else '<unresolved>',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': queries.count,
+            'duplicate_queries': queries.duplicate_count,
+            'db_ms': round(queries.duration * 1000, 2),
+            'wall_ms': round(wall * 1000, 2),
+        }
+        if self.add_headers:
+            response['X-DB-Queries'] = stats['queries']
+            response['X-DB-Duplicate-Queries'] = stats['duplicate_queries']
+            response['X-DB-Time-ms'] = stats['db_ms']
+            response['X-Response-Time-ms'] = stats['wall_ms']
+            response['Server-Timing'] = (
+                f'db;dur={stats["db_ms"]};desc="{stats["queries"]} queries", app;dur={stats["wall_ms"]}'
+            )
+
+        if queries.count > self.query_warning:
+            stats['top_duplicates'] = queries.top_duplicates()
+            logger.warning(json.dumps(stats))
+        else:
+            logger.info(json.dumps(stats))
+        record_metrics(stats)
+        return response
+
+
+def _metric_key(view, field):
+    return f"{METRICS_KEY_PREFIX}:{view}:{field}"
+
+
+# This worker's totals since its last flush: {view: Counter(field=value)}
+_pending = defaultdict(Counter)
+_pending_requests = 0
+_last_flush = time.monotonic()
+_pending_lock = threading.Lock()
+
+
+def record_metrics(stats):
+    """Adds one request's numbers to this worker's totals, flushing them to the cache now and then."""
+    global _pending_requests
+    with _pending_lock:
+        _pending[stats['view']].update({
+            'requests': 1,
+            'queries': stats['queries'],
+            'duplicate_queries': stats['duplicate_queries'],
+            'db_us': int(stats['db_ms'] * 1000),
+            'wall_us': int(stats['wall_ms'] * 1000),
+        })
+        _pending_requests += 1
+        due = (
+            _pending_requests >= METRICS_FLUSH_REQUESTS
+            or time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS
+        )
+    if due:
+        flush_metrics()
+
+
+def flush_metrics():
+    """Adds this worker's pending totals to the shared ones in the cache."""
+    global _pending, _pending_requests, _last_flush
+    with _pending_lock:
+        pending, _pending = _pending, defaultdict(Counter)
+        _pending_requests = 0
+        _last_flush = time.monotonic()
+    if pending:
+        _add_to_cache(pending)
+
+
+def _add_to_cache(pending):
+    new_views = []
+    for view, totals in pending.items():
+        for field, value in totals.items():
+            key = _metric_key(view, field)
+            try:
+                cache.incr(key, value)
+            except ValueError:
+                # First time (or evicted): whoever adds the counter lists the view
+                if cache.add(key, value, None):
+                    if field == 'requests':
+                        new_views.append(view)
+                else:
+                    cache.incr(key, value)
+    for view in new_views:
+        _register_view(view)
+
+
+def _register_view(view):
+    # Each view gets its own numbered slot, so two workers listing views at
+    # once can't overwrite each other the way rewriting one shared set would
+    index_key = f"{METRICS_KEY_PREFIX}:views"
+    cache.add(index_key, 0, None)
+    try:
+        slot = cache.incr(index_key)
+    except ValueError:
+        return  # evicted in between; listed again on its next first request
+    cache.set(f"{index_key}:{slot}", view, None)
+
+
+def _listed_views():
+    count = cache.get(f"{METRICS_KEY_PREFIX}:views") or 0
+    names = cache.get_many([f"{METRICS_KEY_PREFIX}:views:{slot}" for slot in range(1, count + 1)])
+    return sorted(set(names.values()))
+
+
+def metrics_summary():
+    """Per-view totals and averages, slowest total wall time first. Flushes this worker's totals first."""
+    flush_metrics()
+    views = _listed_views()
+    keys = [_metric_key(view, field) for view in views for field in METRIC_FIELDS]
+    values = cache.get_many(keys)
+    summary = []
+    for view in views:
+        totals = {field: values.get(_metric_key(view, field), 0) for field in METRIC_FIELDS}
+        requests = totals['requests'] or 1
+        summary.append({
+            'view': view,
+            'requests': totals['requests'],
+            'queries': totals['queries'],
+            'duplicate_queries': totals['duplicate_queries'],
+            'avg_queries': round(totals['queries'] / requests, 1),
+            'avg_db_ms': round(totals['db_us'] / requests / 1000, 2),
+            'avg_wall_ms': round(totals['wall_us'] / requests / 1000, 2),
+            'total_wall_ms': round(totals['wall_us'] / 1000, 2),
+        })
+    summary.sort(key=lambda row: row['total_wall_ms'], reverse=True)
+    return summary
+
+
+@staff_member_required
+def request_metrics(request):
+    return JsonResponse({'views': metrics_summary()})
@@ -16,6 +16,7 @@ from dotenv import load_dotenv
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 import os
+import tempfile
 
 # Load environment variables
 ENV_FILE = BASE_DIR / ".env"
@@ -65,12 +66,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecommerce.instrumentation.QueryInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ecommerce.db_routers.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
@@ -91,6 +94,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'cart.context_processors.cart_item_count',
+                'store.context_processors.catalog_version',
 
             ],
         },
@@ -112,17 +116,102 @@ if DEBUG:
     }
 else:
     # Production: PostgreSQL (RDS)
+    # DB_CONN_MAX_AGE keeps each worker's connection open between requests
+    # (checked before reuse with DB_CONN_HEALTH_CHECKS). DB_POOL=true borrows
+    # connections from an in-process pool instead (ecommerce/db_backends).
+    # The pool is per worker process: DB_POOL_MAX_SIZE >= gunicorn --threads,
+    # and workers x DB_POOL_MAX_SIZE (twice that with a replica) must fit in
+    # Postgres' max_connections. A request finding the pool empty waits
+    # DB_POOL_TIMEOUT seconds for a connection before failing.
+    DB_POOL = os.getenv('DB_POOL', 'False').lower() in ('true', '1', 'yes')
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'ecommerce.db_backends.postgresql_pool' if DB_POOL else 'django.db.backends.postgresql',
             'NAME': os.getenv('DB_NAME'),
             'USER': os.getenv('DB_USER'),
             'PASSWORD': os.getenv('DB_PASSWORD'),
             'HOST': os.getenv('DB_HOST'),
             'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() in ('true', '1', 'yes'),
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
+                'sslmode': os.getenv('DB_SSLMODE', 'prefer'),
+            },
+            'POOL': {
+                'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+                'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            },
         }
     }
 
+    # Optional read replica for read-only catalog/report queries (ecommerce/db_routers.py)
+    if os.getenv('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.getenv('DB_REPLICA_HOST'),
+            'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Reads in @replica_reads views go to the 'replica' alias when there is one
+# (ecommerce/db_routers.py). DB_REPLICA_READS=false sends them back to the
+# primary without removing the alias. After a write, a user stays on the
+# primary for REPLICA_STICKY_SECONDS so they don't miss their own changes.
+REPLICA_READS = os.getenv('DB_REPLICA_READS', 'True').lower() in ('true', '1', 'yes')
+REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', '10'))
+DATABASE_ROUTERS = ['ecommerce.db_routers.ReplicaRouter']
+
+
+# Cache
+# CACHE_BACKEND: locmem (default) | file | redis
+# locmem is private to each process. Version-keyed entries (catalog pages and
+# product card fragments under the catalog version, the cart summary under the
+# cart version) are only invalidated in the worker that made the change, so
+# with more than one gunicorn worker the others serve stale cards, prices and
+# totals until they time out: use redis (or another shared backend) there.
+# redis needs the `redis` package (requirements.txt) and a running server.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem').lower()
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'sales'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(tempfile.gettempdir(), 'sales-cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.getenv('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'sales'),
+    }
+}
+# Catalog pages/fragments (store/utils.py); invalidated by catalog version bumps
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', '900'))
+
+# Per-request query count / DB time / wall time (ecommerce/instrumentation.py).
+# Headers default to DEBUG; the JSON log line and /metrics/requests/ are always on.
+REQUEST_INSTRUMENTATION = os.getenv('REQUEST_INSTRUMENTATION', 'True').lower() in ('true', '1', 'yes')
+REQUEST_INSTRUMENTATION_HEADERS = os.getenv('REQUEST_INSTRUMENTATION_HEADERS', str(DEBUG)).lower() in ('true', '1', 'yes')
+QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', '50'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per request; INFO logs every request, WARNING only the heavy ones
+        'ecommerce.instrumentation': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -170,6 +259,7 @@ if DEBUG:
 
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+    DEFAULT_FILE_STORAGE = "ecommerce.storage_backends.HashedFileSystemStorage"
 
 else:
     # Production: S3
@@ -210,6 +300,14 @@ else:
     # DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
 
 
+# Uploads are hashed while they stream in; the media storages use the hash to
+# store each distinct file once (see ecommerce/storage_backends.py)
+FILE_UPLOAD_HANDLERS = [
+    "ecommerce.upload_handlers.HashingMemoryFileUploadHandler",
+    "ecommerce.upload_handlers.HashingTemporaryFileUploadHandler",
+]
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -1,12 +1,118 @@
 # ecommerce/storage_backends.py
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
 from storages.backends.s3boto3 import S3Boto3Storage
 
+
+def file_digest(content):
+    """sha256 of a File, read in chunks so large uploads never sit in memory."""
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+class ContentAddressedMixin:
+    """
+    Stores every distinct file once, as blobs/<aa>/<sha256><ext>. Saving
+    content that is already stored returns the existing name without writing
+    (or uploading) it again. store.MediaBlob counts the references and
+    delete() only removes the file when the last one is gone.
+
+    Uploads arrive already hashed by ecommerce.upload_handlers; anything else
+    is hashed here.
+
+    The file is written before the MediaBlob row is locked, so a slow upload
+    holds no database lock. It is also written before the surrounding
+    transaction commits, so a rollback leaves it in the blob store with no
+    MediaBlob row; `manage.py sweep_media_blobs` removes those.
+    """
+    content_addressed = True
+    blob_prefix = 'blobs'
+
+    def save(self, name, content, max_length=None):
+        from store.models import MediaBlob
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = getattr(content, 'content_hash', None) or file_digest(content)
+        extension = os.path.splitext(name)[1].lower()
+
+        uploaded = None
+        while True:
+            known = MediaBlob.objects.filter(digest=digest).values_list('name', flat=True).first()
+            if uploaded is None and (known is None or not self.exists(known)):
+                # No lock while the bytes travel; racing uploads are settled below
+                uploaded = self._save(f"{self.blob_prefix}/{digest[:2]}/{digest}{extension}", content)
+
+            duplicate = None
+            with transaction.atomic():
+                if uploaded is None:
+                    blob = MediaBlob.objects.select_for_update().filter(digest=digest).first()
+                    if blob is None:
+                        continue  # its last reference went while we looked: upload after all
+                else:
+                    blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                        digest=digest, defaults={'name': uploaded, 'size': content.size},
+                    )
+                    if not created and blob.name != uploaded:
+                        if self.exists(blob.name):
+                            duplicate = uploaded  # another upload of the same content got there first
+                        else:
+                            blob.name = uploaded
+                            blob.save(update_fields=['name'])
+                MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+            if duplicate:
+                super().delete(duplicate)
+            return blob.name
+
+    def retain(self, name):
+        """Adds a reference to an existing blob. False if `name` isn't one."""
+        from store.models import MediaBlob
+
+        return bool(MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1))
+
+    def release(self, name):
+        """Drops a reference to a blob; files outside the blob store are left alone."""
+        from store.models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+    def delete(self, name):
+        from store.models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).exists():
+            self.release(name)
+        else:
+            super().delete(name)
+
+
+class HashedFileSystemStorage(ContentAddressedMixin, FileSystemStorage):
+    pass
+
+
 class StaticStorage(S3Boto3Storage):
     location = 'static'
     # default_acl = 'public-read'  # make static files public
-    default_acl = None 
-class MediaStorage(S3Boto3Storage):
+    default_acl = None
+class MediaStorage(ContentAddressedMixin, S3Boto3Storage):
     location = 'media'
     file_overwrite = False
     # default_acl = 'public-read'  # make media files public
-    default_acl = None 
\ No newline at end of file
+    default_acl = None
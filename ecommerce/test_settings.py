@@ -0,0 +1,17 @@
+"""
+Settings for running the test suite:
+
+    python manage.py test --settings=ecommerce.test_settings
+
+Adds a second, separate SQLite database as the 'replica' alias so the
+read-replica routing tests (main/tests.py) can tell which database a query
+went to. Replica reads stay off unless a test switches them on.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES.setdefault('replica', {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.replica.sqlite3',
+})
+REPLICA_READS = False
@@ -0,0 +1,123 @@
+# ecommerce/testing.py
+"""Test helpers for keeping views inside their query budgets and on their indexes."""
+import json
+import re
+import shutil
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.test import override_settings
+
+from .instrumentation import collect_queries
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\S+)(?: AS \S+)?$')
+
+
+@contextmanager
+def query_budget(max_queries, max_duplicates=None):
+    """
+    Fails if the block runs more than `max_queries` queries (or repeats a
+    query shape more than `max_duplicates` times), listing the repeated
+    shapes so the N+1 is easy to find.
+    """
+    with collect_queries() as queries:
+        yield queries
+    problems = []
+    if queries.count > max_queries:
+        problems.append(f"{queries.count} queries, budget is {max_queries}")
+    if max_duplicates is not None and queries.duplicate_count > max_duplicates:
+        problems.append(f"{queries.duplicate_count} repeated queries, budget is {max_duplicates}")
+    if problems:
+        repeated = "\n".join(f"  {count}x {sql}" for sql, count in queries.top_duplicates())
+        raise AssertionError("; ".join(problems) + (f"\nMost repeated:\n{repeated}" if repeated else ""))
+
+
+class QueryBudgetMixin:
+    """For TestCases: self.assertQueryBudget('/products/', 8) returns the response."""
+
+    def assertQueryBudget(self, url, max_queries, max_duplicates=None, method='get', client=None, **kwargs):
+        client = client or self.client
+        with query_budget(max_queries, max_duplicates):
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, f"{url} returned {response.status_code}")
+        return response
+
+
+@contextmanager
+def record_queries():
+    """Yields a list that fills with the (alias, sql, params) of every query run in the block."""
+    queries = []
+    with ExitStack() as stack:
+        for connection in connections.all():
+            def record(execute, sql, params, many, context, alias=connection.alias):
+                queries.append((alias, sql, params))
+                return execute(sql, params, many, context)
+            stack.enter_context(connection.execute_wrapper(record))
+        yield queries
+
+
+def full_table_scans(sql, params, using='default'):
+    """
+    Tables the database plans to read in full for `sql` (via EXPLAIN). On
+    PostgreSQL sequential scans are priced out first, so a Seq Scan only
+    shows up when no index can serve the query, however small the table.
+    Other backends aren't inspected.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [match.group(1) for *_, detail in cursor.fetchall() if (match := _SQLITE_SCAN.match(detail))]
+        if connection.vendor == 'postgresql':
+            cursor.execute("SET enable_seqscan = off")
+            try:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute("RESET enable_seqscan")
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return list(_seq_scans(plan[0]['Plan']))
+    return []
+
+
+def _seq_scans(node):
+    if node['Node Type'] == 'Seq Scan':
+        yield node['Relation Name']
+    for child in node.get('Plans', ()):
+        yield from _seq_scans(child)
+
+
+class QueryPlanMixin:
+    """
+    For TestCases: self.assertIndexed('/orders/', tables) fails if any SELECT
+    the request runs reads one of `tables` in full. Returns the response.
+    """
+
+    def assertIndexed(self, url, tables, method='get', client=None, **kwargs):
+        client = client or self.client
+        with record_queries() as queries:
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400, f"{url} returned {response.status_code}")
+        scans = [
+            f"  {table}: {sql}"
+            for alias, sql, params in queries
+            if sql.lstrip().upper().startswith('SELECT')
+            for table in full_table_scans(sql, params, using=alias)
+            if table in tables
+        ]
+        if scans:
+            self.fail(f"{url} reads whole tables:\n" + "\n".join(scans))
+        return response
+
+
+class TempMediaMixin:
+    """For TestCases: MEDIA_ROOT is a fresh directory for each test, removed afterwards."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
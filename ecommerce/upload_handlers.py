@@ -0,0 +1,36 @@
+# ecommerce/upload_handlers.py
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashingMixin:
+    """
+    Hashes each uploaded file chunk by chunk as it streams in and sets
+    `content_hash` on the result, so the content-addressed media storage
+    doesn't have to read the file a second time.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.sha = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # The memory handler passes big files on to the temporary file handler
+        if getattr(self, 'activated', True):
+            self.sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.sha.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    pass
@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from . import settings
+from .instrumentation import request_metrics
 
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
@@ -38,6 +39,7 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path("mlmtree/", include("mlmtree.urls")), 
     path('wallet/', include('wallet.urls')),  
+    path('metrics/requests/', request_metrics, name='request_metrics'),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,457 @@
+"""
+Storefront/checkout benchmark: seed data plus a runner for the hot endpoints.
+
+    python manage.py seed_benchmark --products 2000 --depth 4
+    python manage.py run_benchmark --mode both --output bench.json --compare old.json
+
+Seeded rows are tagged (BENCH_EMAIL_DOMAIN users, BENCH_PREFIX products and
+categories) so `seed_benchmark --clear` can remove them again. Run it
+against a development database, not production - payment_execute places
+real orders.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, build_opener, HTTPRedirectHandler
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.utils.crypto import get_random_string
+from django.utils.text import slugify
+
+from cart.models import Cart, CartItem, Order, OrderItem
+from ecommerce.instrumentation import collect_queries
+from store.models import Category, Product
+from store.search import index_products
+from store.utils import bump_catalog_version
+from users.models import CustomUser
+from wallet.models import Wallet
+
+BENCH_EMAIL_DOMAIN = "bench.example.com"
+BENCH_PREFIX = "Bench"
+BENCH_PASSWORD = "bench-password"
+BENCH_WALLET_BALANCE = Decimal("10000000.00")
+TREE_WIDTH = 5
+WORDS = (
+    "cotton", "steel", "herbal", "classic", "premium", "organic", "smart", "travel",
+    "kitchen", "garden", "wireless", "leather", "bamboo", "sport", "kids", "deluxe",
+)
+NOUNS = ("bottle", "shirt", "lamp", "charger", "bag", "tea", "mat", "watch", "soap", "oil")
+SHIPPING = {
+    'phone': '9999999999', 'shipping_address1': '1 Bench Road', 'shipping_address2': '',
+    'city': 'Pune', 'state': 'MH', 'zipcode': '411001', 'country': 'India',
+}
+
+
+# ---------------------------
+# Seed data
+# ---------------------------
+def clear_seed():
+    CustomUser.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}").delete()
+    Product.objects.filter(name__startswith=f"{BENCH_PREFIX} ").delete()
+    Category.objects.filter(name__startswith=f"{BENCH_PREFIX} ").delete()
+    bump_catalog_version()
+
+
+def seed(products=500, depth=3, carts=50, orders=200, seed_value=1, log=print):
+    """
+    Creates `products` products, a TREE_WIDTH-ary MLM tree `depth` levels
+    deep under one bench sponsor, carts for `carts` users and `orders`
+    orders. Returns the row counts.
+    """
+    rng = random.Random(seed_value)
+
+    categories = [
+        Category.objects.get_or_create(name=f"{BENCH_PREFIX} {word.title()}")[0] for word in WORDS[:8]
+    ]
+    start = Product.objects.filter(name__startswith=f"{BENCH_PREFIX} ").count()
+    new_products = []
+    for i in range(start, start + products):
+        name = f"{BENCH_PREFIX} {rng.choice(WORDS).title()} {rng.choice(NOUNS).title()} {i}"
+        price = Decimal(rng.randrange(100, 5000))
+        on_sale = rng.random() < 0.2
+        product = Product(
+            name=name, slug=f"{slugify(name)}-{i}", price=price,
+            sale_price=(price * Decimal("0.8")).quantize(Decimal("1")) if on_sale else None, is_sale=on_sale,
+            special_commission_amount=Decimal("12.00"), stock_quantity=10**6, is_listed=True,
+            is_featured=rng.random() < 0.1, category=rng.choice(categories),
+            description=f"{name} for benchmarking.", key_words=" ".join(rng.sample(WORDS, 3)),
+        )
+        product.search_document = product.build_search_document()
+        new_products.append(product)
+    # bulk_create skips Product.save(), so slug/search_document are set above and indexed here
+    new_products = Product.objects.bulk_create(new_products, batch_size=500)
+    index_products(new_products)
+    bump_catalog_version()
+    log(f"{len(new_products)} products")
+
+    # Each level is sponsored by the one above, so placement fills the tree breadth first
+    sponsor = CustomUser.objects.filter(is_superuser=True).first()
+    top = CustomUser.objects.create_user(
+        f"top-{get_random_string(6).lower()}@{BENCH_EMAIL_DOMAIN}", None,
+        first_name="Bench", last_name="Top", parent_sponsor=sponsor,
+    )
+    level, users = [top], [top]
+    for depth_level in range(1, depth + 1):
+        next_level = []
+        for parent in level:
+            for _ in range(TREE_WIDTH):
+                next_level.append(CustomUser.objects.create_user(
+                    f"u{len(users) + len(next_level)}-{get_random_string(6).lower()}@{BENCH_EMAIL_DOMAIN}", None,
+                    first_name="Bench", last_name=f"L{depth_level}", parent_sponsor=parent,
+                ))
+        users += next_level
+        level = next_level
+        log(f"level {depth_level}: {len(next_level)} users")
+    user_ids = [user.pk for user in users]
+    CustomUser.objects.filter(pk__in=user_ids).update(password=make_password(BENCH_PASSWORD))
+    Wallet.objects.filter(user_id__in=user_ids).update(balance=BENCH_WALLET_BALANCE)
+
+    for user in rng.sample(users, min(carts, len(users))):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product=product, quantity=rng.randint(1, 3))
+             for product in rng.sample(new_products, min(3, len(new_products)))],
+            ignore_conflicts=True,
+        )
+
+    for _ in range(orders):
+        user = rng.choice(users)
+        lines = [(product, rng.randint(1, 4)) for product in rng.sample(new_products, min(rng.randint(1, 8), len(new_products)))]
+        order = Order.objects.create(
+            user=user, full_name=f"{user.first_name} {user.last_name}", email=user.email,
+            shipping_address="1 Bench Road\nPune", payment_method="wallet", payment_status="Paid",
+            amount_paid=sum((product.sale_price or product.price) * quantity for product, quantity in lines),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, user=user, quantity=quantity, price=product.sale_price or product.price)
+            for product, quantity in lines
+        ])
+    log(f"{len(users)} users, {min(carts, len(users))} carts, {orders} orders")
+    return {'products': len(new_products), 'users': len(users), 'carts': min(carts, len(users)), 'orders': orders}
+
+
+# ---------------------------
+# Scenarios
+# ---------------------------
+class Scenario:
+    """
+    One endpoint to time. `request(ctx)` returns (method, path, data);
+    `prepare(ctx)` runs untimed before each request (e.g. refilling a cart).
+    """
+
+    def __init__(self, name, request, auth=False, prepare=None, headers=None):
+        self.name = name
+        self.request = request
+        self.auth = auth
+        self.prepare = prepare
+        self.headers = headers or {}
+
+
+def _refill_cart(ctx):
+    Wallet.objects.filter(user=ctx['user']).update(balance=BENCH_WALLET_BALANCE)
+    cart, _ = Cart.objects.get_or_create(user=ctx['user'])
+    if not cart.items.exists():
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, quantity=1)
+            for product_id in ctx['rng'].sample(ctx['product_ids'], 2)
+        ])
+    ctx['session_update']({'payment_method': 'wallet', 'shipping': SHIPPING})
+
+
+SCENARIOS = [
+    Scenario('home', lambda ctx: ('get', '/', None)),
+    Scenario('products', lambda ctx: ('get', '/products/', None)),
+    Scenario('search', lambda ctx: ('get', '/search/', {'query': ctx['rng'].choice(WORDS)})),
+    Scenario('api_products', lambda ctx: ('get', '/api/products/', None)),
+    Scenario('mlm_tree', lambda ctx: ('get', '/mlmtree/api/tree/', {'root': ctx['tree_root']})),
+    Scenario(
+        'cart_add',
+        lambda ctx: ('post', '/cart/add/', {'product_id': ctx['rng'].choice(ctx['product_ids']), 'product_qty': 1}),
+        auth=True, headers={'X-Requested-With': 'XMLHttpRequest'},
+    ),
+    Scenario('payment_execute', lambda ctx: ('get', '/payment/execute/', None), auth=True, prepare=_refill_cart),
+    Scenario(
+        'view_invoice',
+        lambda ctx: ('get', f"/cart/invoice/view/{ctx['rng'].choice(ctx['order_ids'])}/", None),
+        auth=True,
+    ),
+]
+
+
+def _bench_context(seed_value):
+    users = list(CustomUser.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}").order_by('pk'))
+    if not users:
+        raise ValueError("No benchmark data; run `manage.py seed_benchmark` first.")
+    product_ids = list(Product.objects.filter(name__startswith=f"{BENCH_PREFIX} ").values_list('pk', flat=True))
+    # The bench user with the most orders buys and views invoices
+    buyer_id = (
+        Order.objects.filter(user__in=users).values('user').annotate(orders=Count('pk'))
+        .order_by('-orders').values_list('user', flat=True).first()
+    )
+    buyer = next((user for user in users if user.pk == buyer_id), users[-1])
+    return {
+        'rng': random.Random(seed_value),
+        'user': buyer,
+        'product_ids': product_ids,
+        'order_ids': list(Order.objects.filter(user=buyer).values_list('pk', flat=True)),
+        'tree_root': users[0].pk,
+    }
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarize(latencies, queries, statuses, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'statuses': dict(sorted(statuses.items())),
+    }
+
+
+# ---------------------------
+# Runners
+# ---------------------------
+def run_client(scenarios, iterations, warmup=3, seed_value=1):
+    """Sequential runs through the Django test client; queries counted with execute_wrapper."""
+    ctx = _bench_context(seed_value)
+    client = Client()
+    client.force_login(ctx['user'])
+
+    def session_update(values):
+        session = client.session
+        session.update(values)
+        session.save()
+    ctx['session_update'] = session_update
+
+    results = {}
+    for scenario in scenarios:
+        latencies, queries, statuses = [], [], defaultdict(int)
+        active = client if scenario.auth else Client()
+        headers = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in scenario.headers.items()}
+        elapsed = 0.0
+        for i in range(warmup + iterations):
+            if scenario.prepare:
+                scenario.prepare(ctx)
+            method, path, data = scenario.request(ctx)
+            with collect_queries() as collector:
+                start = time.perf_counter()
+                response = getattr(active, method)(path, data or {}, **headers)
+                duration = time.perf_counter() - start
+            if i < warmup:
+                continue
+            elapsed += duration
+            latencies.append(duration)
+            queries.append(collector.count)
+            statuses[response.status_code] += 1
+        results[scenario.name] = summarize(latencies, queries, statuses, elapsed)
+    return results
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def run_wsgi(scenarios, iterations, concurrency=4, warmup=3, seed_value=1):
+    """
+    Serves the project with wsgiref on a local port and hits it from
+    `concurrency` threads. Queries per request come from the X-DB-Queries header.
+    """
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+    from socketserver import ThreadingMixIn
+    from django.core.wsgi import get_wsgi_application
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    ctx = _bench_context(seed_value)
+    client = Client()
+    client.force_login(ctx['user'])
+    session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+    csrf_token = get_random_string(32)
+
+    def session_update(values):
+        stored = SessionStore(session_key=session_key)
+        stored.update(values)
+        stored.save()
+    ctx['session_update'] = session_update
+
+    with override_settings(REQUEST_INSTRUMENTATION=True, REQUEST_INSTRUMENTATION_HEADERS=True):
+        server = make_server('127.0.0.1', 0, get_wsgi_application(),
+                             server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+        opener = build_opener(_NoRedirect)
+        lock = threading.Lock()
+        results = {}
+        try:
+            for scenario in scenarios:
+                cookies = SimpleCookie()
+                cookies['csrftoken'] = csrf_token
+                if scenario.auth:
+                    cookies[settings.SESSION_COOKIE_NAME] = session_key
+                headers = dict(scenario.headers)
+                headers['Cookie'] = '; '.join(f"{key}={morsel.value}" for key, morsel in cookies.items())
+                headers['X-CSRFToken'] = csrf_token
+
+                latencies, queries, statuses = [], [], defaultdict(int)
+                # Requests that share state (the buyer's cart/session) are prepared under the lock
+                serial = scenario.prepare is not None
+
+                def fetch(record):
+                    with lock:
+                        if scenario.prepare:
+                            scenario.prepare(ctx)
+                        method, path, data = scenario.request(ctx)
+                    body = None
+                    if method == 'get' and data:
+                        path = f"{path}?{urlencode(data)}"
+                    elif method == 'post':
+                        body = urlencode(data or {}).encode()
+                    request = Request(base_url + path, data=body, headers=headers, method=method.upper())
+                    start = time.perf_counter()
+                    try:
+                        response = opener.open(request)
+                    except HTTPError as e:
+                        response = e  # redirects and errors still carry status + headers
+                    response.read()
+                    duration = time.perf_counter() - start
+                    if record:
+                        with lock:
+                            latencies.append(duration)
+                            statuses[response.status] += 1
+                            if response.headers.get('X-DB-Queries'):
+                                queries.append(int(response.headers['X-DB-Queries']))
+
+                for _ in range(warmup):
+                    fetch(False)
+
+                workers = 1 if serial else concurrency
+                counts = [iterations // workers + (1 if i < iterations % workers else 0) for i in range(workers)]
+                threads = [threading.Thread(target=lambda n=n: [fetch(True) for _ in range(n)]) for n in counts]
+                start = time.perf_counter()
+                for worker in threads:
+                    worker.start()
+                for worker in threads:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                results[scenario.name] = summarize(latencies, queries, statuses, elapsed)
+                results[scenario.name]['concurrency'] = workers
+        finally:
+            server.shutdown()
+            server.server_close()
+    return results
+
+
+def compare(current, previous):
+    """Rows of (mode, scenario, metric, previous, current, change %) for the headline metrics."""
+    rows = []
+    for mode, scenarios in current.get('results', {}).items():
+        for name, metrics in scenarios.items():
+            before = previous.get('results', {}).get(mode, {}).get(name)
+            if not before:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'throughput_rps'):
+                old, new = before.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                change = round((new - old) / old * 100, 1) if old else None
+                rows.append((mode, name, metric, old, new, change))
+    return rows
+
+
+def save_results(path, data):
+    with open(path, 'w') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+
+
+# ---------------------------
+# Connection setup cost
+# ---------------------------
+POOL_ENGINE = 'ecommerce.db_backends.postgresql_pool'
+
+
+def connection_modes(alias=DEFAULT_DB_ALIAS):
+    """{mode: settings overrides} worth comparing for this database."""
+    base = connections.settings[alias]
+    modes = {
+        'new_per_request': {'CONN_MAX_AGE': 0},
+        'persistent': {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True},
+    }
+    if base['ENGINE'] in ('django.db.backends.postgresql', POOL_ENGINE):
+        modes['pooled'] = {'ENGINE': POOL_ENGINE, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}
+    return modes
+
+
+def run_connection_benchmark(requests=200, alias=DEFAULT_DB_ALIAS, modes=None):
+    """
+    Simulates `requests` request cycles per connection mode on a scratch
+    alias copied from `alias`: the request_started/finished connection
+    housekeeping around one `SELECT 1`. Returns latency stats per mode,
+    plus how many new connections each mode opened.
+    """
+    from django.db.backends.signals import connection_created
+
+    results = {}
+    for mode, overrides in (modes or connection_modes(alias)).items():
+        bench_alias = f"bench_{mode}"
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            bench_alias: {**connections.settings[alias], **overrides},
+        })
+        connections.settings[bench_alias] = configured[bench_alias]
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == bench_alias:
+                opened.append(1)
+        connection_created.connect(count)
+        latencies = []
+        try:
+            connection = connections[bench_alias]
+            for _ in range(requests):
+                start = time.perf_counter()
+                connection.close_if_unusable_or_obsolete()  # request_started
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                connection.close_if_unusable_or_obsolete()  # request_finished
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection_created.disconnect(count)
+            connections[bench_alias].close()
+            del connections[bench_alias]
+            del connections.settings[bench_alias]
+        results[mode] = summarize(latencies, [], {}, sum(latencies))
+        results[mode].pop('statuses')
+        results[mode].pop('queries_per_request')
+        results[mode]['connections_opened'] = len(opened)
+    return results
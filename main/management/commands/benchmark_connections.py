@@ -0,0 +1,36 @@
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main.benchmark import connection_modes, run_connection_benchmark, save_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures per-request connection cost: a new connection per request, a persistent "
+        "connection (CONN_MAX_AGE) and, on PostgreSQL, the in-process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--mode", action="append", dest="modes", help="Only these modes (repeatable).")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["database"] not in connections.settings:
+            raise CommandError(f"Unknown database {options['database']}.")
+        modes = connection_modes(options["database"])
+        if options["modes"]:
+            modes = {mode: modes[mode] for mode in options["modes"] if mode in modes}
+        results = run_connection_benchmark(options["requests"], options["database"], modes)
+
+        self.stdout.write(f"{'mode':<18}{'p50 ms':>9}{'p95 ms':>9}{'mean ms':>9}{'opened':>8}")
+        for mode, metrics in results.items():
+            self.stdout.write(
+                f"{mode:<18}{metrics['p50_ms']:>9}{metrics['p95_ms']:>9}{metrics['mean_ms']:>9}"
+                f"{metrics['connections_opened']:>8}"
+            )
+        if options["output"]:
+            save_results(options["output"], {"database": options["database"], "results": results})
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}."))
@@ -0,0 +1,79 @@
+import json
+import platform
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main.benchmark import SCENARIOS, compare, run_client, run_wsgi, save_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the hot storefront/checkout endpoints through the test client and/or a local "
+        "WSGI server: p50/p95/p99 latency, queries per request and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["client", "wsgi", "both"], default="client")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--concurrency", type=int, default=4, help="Client threads in wsgi mode.")
+        parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="Only these scenarios (repeatable): " + ", ".join(s.name for s in SCENARIOS))
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Earlier JSON results to compare against.")
+
+    def handle(self, *args, **options):
+        scenarios = SCENARIOS
+        if options["scenarios"]:
+            unknown = set(options["scenarios"]) - {scenario.name for scenario in SCENARIOS}
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = [scenario for scenario in SCENARIOS if scenario.name in options["scenarios"]]
+
+        run_options = {"iterations": options["iterations"], "warmup": options["warmup"], "seed_value": options["seed"]}
+        results = {}
+        try:
+            if options["mode"] in ("client", "both"):
+                results["client"] = run_client(scenarios, **run_options)
+            if options["mode"] in ("wsgi", "both"):
+                results["wsgi"] = run_wsgi(scenarios, concurrency=options["concurrency"], **run_options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        data = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "options": {key: options[key] for key in ("mode", "iterations", "warmup", "concurrency", "seed")},
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "cache": settings.CACHES["default"]["BACKEND"],
+            },
+            "results": results,
+        }
+
+        for mode, rows in results.items():
+            self.stdout.write(f"\n[{mode}]")
+            self.stdout.write(f"{'scenario':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'req/s':>9}  statuses")
+            for name, metrics in rows.items():
+                self.stdout.write(
+                    f"{name:<16}{metrics['p50_ms']:>9}{metrics['p95_ms']:>9}{metrics['p99_ms']:>9}"
+                    f"{str(metrics['queries_per_request']):>9}{str(metrics['throughput_rps']):>9}  {metrics['statuses']}"
+                )
+
+        if options["compare"]:
+            with open(options["compare"]) as previous:
+                rows = compare(data, json.load(previous))
+            self.stdout.write(f"\nCompared with {options['compare']}:")
+            for mode, name, metric, old, new, change in rows:
+                self.stdout.write(f"  {mode:<7}{name:<16}{metric:<20}{old:>10} -> {new:<10} ({change:+}%)" if change is not None
+                                  else f"  {mode:<7}{name:<16}{metric:<20}{old:>10} -> {new}")
+
+        if options["output"]:
+            save_results(options["output"], data)
+            self.stdout.write(self.style.SUCCESS(f"\nSaved results to {options['output']}."))
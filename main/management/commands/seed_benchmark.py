@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from main.benchmark import clear_seed, seed
+
+
+class Command(BaseCommand):
+    help = "Seeds benchmark data: products, a 5-ary MLM tree of users, carts and orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500)
+        parser.add_argument("--depth", type=int, default=3, help="Levels of the MLM tree below the bench top user.")
+        parser.add_argument("--carts", type=int, default=50)
+        parser.add_argument("--orders", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=1, help="Random seed, for reproducible data.")
+        parser.add_argument("--clear", action="store_true", help="Delete earlier benchmark data first.")
+
+    def handle(self, *args, **options):
+        if options["clear"]:
+            clear_seed()
+            self.stdout.write("Cleared earlier benchmark data.")
+        counts = seed(
+            products=options["products"], depth=options["depth"], carts=options["carts"],
+            orders=options["orders"], seed_value=options["seed"], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded " + ", ".join(f"{count} {name}" for name, count in counts.items()) + "."
+        ))
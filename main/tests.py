@@ -1,3 +1,317 @@
-from django.test import TestCase
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from cart.models import Cart, CartItem, Order
+from ecommerce import instrumentation
+from ecommerce.db_routers import PIN_COOKIE, _pin_key, use_replica
+from ecommerce.instrumentation import _add_to_cache, _metric_key, flush_metrics, metrics_summary, record_metrics
+from ecommerce.testing import QueryPlanMixin
+from payment.models import Payment
+from store.models import Category, Product
+from users.models import CustomUser
+from wallet.models import Payout, Wallet, WalletTransaction
+
+try:
+    from psycopg2 import pool as psycopg2_pool
+    from ecommerce.db_backends.postgresql_pool import base as pool_backend
+except ImportError:
+    pool_backend = None
+
+HAS_REPLICA = 'replica' in settings.DATABASES
+REPLICA_IS_MIRROR = bool(settings.DATABASES.get('replica', {}).get('TEST', {}).get('MIRROR'))
+
+
+@skipUnless(HAS_REPLICA, "needs a replica alias; run with --settings=ecommerce.test_settings")
+@skipIf(REPLICA_IS_MIRROR, "the replica mirrors the primary in tests, so reads can't be told apart")
+@override_settings(REPLICA_READS=True)
+class ReplicaRoutingTests(TestCase):
+    """
+    Runs against two separate SQLite databases, so the rows a page shows
+    tell which one it read: "Primary product" only exists on the primary,
+    "Replica product" only on the replica.
+    """
+    # The runner sets up every alias a test class names, skipped or not
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        primary_category = Category.objects.create(name="Catalog")
+        replica_category = Category.objects.using('replica').create(name="Catalog")
+        cls.primary_product = Product.objects.create(
+            name="Primary product", price=Decimal("10.00"), category=primary_category, stock_quantity=5,
+        )
+        Product.objects.using('replica').create(
+            name="Replica product", price=Decimal("10.00"), category=replica_category, stock_quantity=5,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reads_use_primary_by_default(self):
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_use_replica(self):
+        with use_replica():
+            self.assertEqual(Product.objects.all().db, 'replica')
+            self.assertEqual(Product.objects.get().name, "Replica product")
+        self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_reads_after_a_write_use_primary(self):
+        with use_replica():
+            Category.objects.create(name="New")
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_lookup_routed_as_a_write_does_not_pin(self):
+        with use_replica():
+            Category.objects.get_or_create(name="Catalog")
+            Product.objects.select_for_update().filter(pk=self.primary_product.pk).exists()
+            self.assertEqual(Product.objects.all().db, 'replica')
+
+    def test_get_or_create_that_creates_pins(self):
+        with use_replica():
+            Category.objects.get_or_create(name="Brand new")
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_bulk_update_pins(self):
+        with use_replica():
+            Product.objects.filter(pk=self.primary_product.pk).update(stock_quantity=4)
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_replica_view(self):
+        response = self.client.get("/products/")
+        self.assertContains(response, "Replica product")
+        self.assertNotContains(response, "Primary product")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_READS=False)
+    def test_replica_reads_switched_off(self):
+        self.assertContains(self.client.get("/products/"), "Primary product")
+
+    def test_write_pins_user_to_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            "/cart/add/", {'product_id': self.primary_product.pk, 'product_qty': 1},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(cache.get(_pin_key(self.user.pk)))
+
+        self.assertContains(self.client.get("/products/"), "Primary product")
+
+    def test_view_that_only_looks_up_does_not_pin(self):
+        Cart.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        response = self.client.get("/cart/")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIsNone(cache.get(_pin_key(self.user.pk)))
+
+    def test_pin_follows_the_user_without_the_cookie(self):
+        self.client.force_login(self.user)
+        self.client.post(
+            "/cart/add/", {'product_id': self.primary_product.pk, 'product_qty': 1},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertContains(self.client.get("/products/"), "Primary product")
+
+
+class QueryPlanTests(QueryPlanMixin, TestCase):
+    """
+    EXPLAINs every query the main storefront and account pages run, and
+    fails if one reads a whole hot table instead of using an index.
+    """
+    HOT_TABLES = {
+        'store_product', 'cart_order', 'cart_orderitem', 'cart_cartitem',
+        'payment_payment', 'wallet_wallettransaction', 'wallet_payout',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f"Category {i}") for i in range(3)]
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", slug=f"product-{i}", price=Decimal("10.00"), sale_price=Decimal("8.00"),
+                category=categories[i % 3], stock_quantity=i % 5, is_listed=i % 5 > 0,
+                is_sale=i % 4 == 0, is_featured=i % 7 == 0,
+            )
+            for i in range(300)
+        ])
+        cls.product = Product.objects.filter(is_listed=True).first()
+
+        cls.user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        others = [CustomUser.objects.create_user(f"other{i}@example.com", "pw") for i in range(3)]
+        for n, owner in enumerate([cls.user] * 20 + others * 20):
+            order = Order.objects.create(user=owner, shipping_address="Address", amount_paid=Decimal("10.00"))
+            Payment.objects.create(
+                user=owner, order=order, transaction_id=f"txn-{n}", amount=order.amount_paid,
+                status='captured' if n % 2 else 'pending',
+            )
+        for owner in [cls.user] + others:
+            wallet = Wallet.objects.get(user=owner)
+            WalletTransaction.objects.bulk_create([
+                WalletTransaction(wallet=wallet, transaction_type='credit', category='commission', amount=Decimal("1.00"))
+                for _ in range(50)
+            ])
+            Payout.objects.bulk_create([Payout(user=owner, amount=Decimal("5.00")) for _ in range(10)])
+            cart = Cart.objects.create(user=owner)
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=product) for product in Product.objects.filter(is_listed=True)[:10]
+            ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_storefront(self):
+        for url in ("/", "/products/", "/sale/", "/featured/", "/new/", f"/product/{self.product.slug}"):
+            with self.subTest(url=url):
+                self.assertIndexed(url, self.HOT_TABLES)
+
+    def test_account_pages(self):
+        self.client.force_login(self.user)
+        for url in ("/cart/", "/cart/orders/", "/api/orders/history/", "/wallet/transactions/", "/api/wallet/transactions/"):
+            with self.subTest(url=url):
+                self.assertIndexed(url, self.HOT_TABLES)
+
+    def test_cart_add(self):
+        self.client.force_login(self.user)
+        self.assertIndexed(
+            "/cart/add/", self.HOT_TABLES, method='post',
+            data={'product_id': self.product.pk, 'product_qty': 1}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+
+def request_stats(view, queries=3):
+    return {'view': view, 'queries': queries, 'duplicate_queries': 1, 'db_ms': 1.5, 'wall_ms': 10.0}
+
+
+@mock.patch.object(instrumentation, 'METRICS_FLUSH_SECONDS', 3600)
+class RequestMetricsTests(TestCase):
+    """Per-view request totals: buffered per worker, flushed to the cache in batches."""
+
+    def setUp(self):
+        flush_metrics()  # whatever earlier tests' requests left behind
+        cache.clear()
+
+    def test_buffered_until_flush(self):
+        with mock.patch.object(instrumentation, 'cache') as mocked_cache:
+            for _ in range(3):
+                record_metrics(request_stats('store:products'))
+        mocked_cache.assert_not_called()
+        self.assertEqual(mocked_cache.method_calls, [])
+
+        [row] = metrics_summary()
+        self.assertEqual(row['view'], 'store:products')
+        self.assertEqual((row['requests'], row['queries'], row['duplicate_queries']), (3, 9, 3))
+        self.assertEqual((row['avg_db_ms'], row['avg_wall_ms']), (1.5, 10.0))
+
+    def test_flushed_every_n_requests(self):
+        with mock.patch.object(instrumentation, 'METRICS_FLUSH_REQUESTS', 2):
+            record_metrics(request_stats('a'))
+            self.assertIsNone(cache.get(_metric_key('a', 'requests')))
+            record_metrics(request_stats('a'))
+            self.assertEqual(cache.get(_metric_key('a', 'requests')), 2)
+            record_metrics(request_stats('a'))
+            record_metrics(request_stats('a'))
+            self.assertEqual(cache.get(_metric_key('a', 'queries')), 12)
+
+    def test_views_listed_once_when_workers_race(self):
+        views = [f'view-{n}' for n in range(8)]
+        barrier = threading.Barrier(len(views) * 2)
+
+        def worker(view):
+            # Each thread stands in for a worker process with its own buffer
+            totals = {view: Counter(requests=1, queries=3, duplicate_queries=1, db_us=1500, wall_us=10000)}
+            barrier.wait()
+            _add_to_cache(totals)
+
+        # Two workers per view, all flushing at once
+        threads = [threading.Thread(target=worker, args=(view,)) for view in views * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        summary = metrics_summary()
+        self.assertEqual(sorted(row['view'] for row in summary), views)
+        self.assertEqual({row['requests'] for row in summary}, {2})
+
+    def test_request_metrics_view(self):
+        staff = CustomUser.objects.create_superuser(email='staff@example.com', password='x')
+        self.client.force_login(staff)
+        self.client.get('/products/')
+        self.client.get('/products/')
+        views = {row['view']: row for row in self.client.get('/metrics/requests/').json()['views']}
+        self.assertEqual(views['products']['requests'], 2)
+
+
+class FakePool:
+    """Stands in for psycopg2's ThreadedConnectionPool: hands out `size` tokens."""
+
+    def __init__(self, minconn, maxconn, **conn_params):
+        self.free = [object() for _ in range(maxconn)]
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.closed:
+                raise psycopg2_pool.PoolError("connection pool is closed")
+            if not self.free:
+                raise psycopg2_pool.PoolError("connection pool exhausted")
+            return self.free.pop()
+
+    def putconn(self, connection, close=False):
+        with self.lock:
+            self.free.append(connection)
+
+
+@skipUnless(pool_backend, "needs psycopg2")
+class ConnectionPoolTests(SimpleTestCase):
+    """The pooled backend waits for a connection when the pool is empty, up to POOL['TIMEOUT']."""
+
+    def setUp(self):
+        self.wrapper = pool_backend.DatabaseWrapper({
+            **settings.DATABASES['default'], 'POOL': {'MIN_SIZE': 1, 'MAX_SIZE': 2, 'TIMEOUT': 0.3},
+        }, alias='pool-test')
+        with mock.patch.object(pool_backend.psycopg2_pool, 'ThreadedConnectionPool', FakePool):
+            self.pool = self.wrapper._get_pool({})
+        self.addCleanup(self.wrapper._pools.clear)
+        self.addCleanup(self.wrapper._returned.clear)
+
+    def test_exhausted_pool_times_out(self):
+        self.wrapper._borrow(self.pool)
+        self.wrapper._borrow(self.pool)
+        start = time.monotonic()
+        with self.assertRaisesMessage(OperationalError, 'raise DB_POOL_MAX_SIZE'):
+            with self.wrapper.wrap_database_errors:
+                self.wrapper._borrow(self.pool)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def test_waits_for_a_returned_connection(self):
+        first = self.wrapper._borrow(self.pool)
+        self.wrapper._borrow(self.pool)
+        borrowed = []
+        waiter = threading.Thread(target=lambda: borrowed.append(self.wrapper._borrow(self.pool)))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(borrowed, [])
+
+        self.wrapper._give_back(self.pool, first)
+        waiter.join(1)
+        self.assertEqual(borrowed, [first])
+
+    def test_closed_pool_fails_at_once(self):
+        self.pool.closed = True
+        with self.assertRaises(psycopg2_pool.PoolError):
+            self.wrapper._borrow(self.pool)
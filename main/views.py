@@ -1,22 +1,26 @@
 from django.shortcuts import render, get_object_or_404
 from store.models import Product, Category, WebBanner
+from store.utils import HOME_SECTION_SIZE, cached_catalog
 from django.utils import timezone
 from django.db.models import Q
 import datetime
 
-def home(request):
+def home_sections():
     all_products = Product.objects.all()
-    products = all_products.filter(is_listed=True)
-    banners = WebBanner.objects.filter(in_use=True)
-    categories = Category.objects.all()
-    sale_products = products.filter(is_sale=True)
-    featured_products = products.filter(is_featured=True)
-
-    context = {
-        'products': products,
-        'sale_products': sale_products,
-        'featured_products': featured_products,
-        'categories': categories,
-        'banners': banners,
+    # Newest first, which the (is_listed, ..., created_at, id) indexes serve
+    products = all_products.filter(is_listed=True).order_by('-created_at', '-pk')
+    newest = list(products[:HOME_SECTION_SIZE])
+    # Each section is capped; "See More" leads to the paginated listing
+    return {
+        'products': newest,
+        'new_products': newest,
+        'sale_products': list(products.filter(is_sale=True)[:HOME_SECTION_SIZE]),
+        'featured_products': list(products.filter(is_featured=True)[:HOME_SECTION_SIZE]),
+        'categories': list(Category.objects.all()),
+        'banners': list(WebBanner.objects.filter(in_use=True)),
     }
+
+def home(request):
+    # Shared catalog data only; the cart badge and messages come from context processors
+    context = cached_catalog('home', home_sections)
     return render(request, 'main/index.html', context)
@@ -0,0 +1,64 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mlmtree.models import MLMTree, UplineLink
+from mlmtree.utils import compute_upline_links
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the upline closure table and each MLMTree node's child_count "
+        "from CustomUser.parent_node, and verifies both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the table and child counts with parent_node; don't rebuild them.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            parent_of = dict(CustomUser.objects.values_list("pk", "parent_node_id"))
+            with transaction.atomic():
+                UplineLink.objects.all().delete()
+                UplineLink.objects.bulk_create(
+                    (
+                        UplineLink(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+                        for ancestor_id, descendant_id, depth in compute_upline_links(parent_of)
+                    ),
+                    batch_size=options["batch_size"],
+                )
+            self.stdout.write(f"Rebuilt upline links for {len(parent_of)} users.")
+            stale = self.stale_child_counts(parent_of)
+            MLMTree.objects.bulk_update(stale, ["child_count"], batch_size=options["batch_size"])
+            self.stdout.write(f"Corrected child_count on {len(stale)} tree nodes.")
+
+        # Verify against a fresh read of parent_node
+        parent_of = dict(CustomUser.objects.values_list("pk", "parent_node_id"))
+        stale = self.stale_child_counts(parent_of)
+        if stale:
+            raise CommandError(f"child_count out of step with parent_node on {len(stale)} tree nodes.")
+        expected = set(compute_upline_links(parent_of))
+        actual = set(UplineLink.objects.values_list("ancestor_id", "descendant_id", "depth").iterator())
+        missing = expected - actual
+        extra = actual - expected
+        if missing or extra:
+            raise CommandError(
+                f"Upline table out of step with parent_node: {len(missing)} missing, {len(extra)} extra rows."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Upline table matches parent_node ({len(actual)} rows)."))
+
+    def stale_child_counts(self, parent_of):
+        """Unsaved MLMTree rows carrying the right child_count, for the nodes whose count is off."""
+        counts = Counter(parent_id for parent_id in parent_of.values() if parent_id)
+        return [
+            MLMTree(pk=pk, child_count=counts[user_id])
+            for pk, user_id, child_count in MLMTree.objects.values_list("pk", "user_id", "child_count").iterator()
+            if child_count != counts[user_id]
+        ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def compute_upline_links(parent_of):
+    """
+    Yields (ancestor_id, descendant_id, depth) for every user in
+    `parent_of` ({user_id: parent_node_id}). A parent_node cycle is cut
+    where it closes. A frozen copy of mlmtree.utils.compute_upline_links,
+    so this migration doesn't depend on the current models.
+    """
+    chains = {}  # user_id -> ancestor ids, nearest first
+    for start in parent_of:
+        path = []
+        on_path = set()
+        current = start
+        while current is not None and current not in chains and current not in on_path:
+            path.append(current)
+            on_path.add(current)
+            current = parent_of.get(current)
+
+        if current is None or current in on_path:
+            above = []
+        else:
+            above = [current] + chains[current]
+        for user_id in reversed(path):
+            chains[user_id] = above
+            above = [user_id] + above
+
+    for user_id, ancestors in chains.items():
+        for depth, ancestor_id in enumerate(ancestors, start=1):
+            yield ancestor_id, user_id, depth
+
+
+def build_upline_links(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UplineLink = apps.get_model('mlmtree', 'UplineLink')
+    parent_of = dict(User.objects.values_list('pk', 'parent_node_id'))
+    UplineLink.objects.bulk_create(
+        (
+            UplineLink(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+            for ancestor_id, descendant_id, depth in compute_upline_links(parent_of)
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mlmtree', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UplineLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='downline_links', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upline_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='mlmtree_upline_ancestor_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='uplinelink',
+            constraint=models.UniqueConstraint(fields=('descendant', 'depth'), name='mlmtree_upline_descendant_depth'),
+        ),
+        migrations.RunPython(build_upline_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_children(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    MLMTree = apps.get_model('mlmtree', 'MLMTree')
+    children = (
+        User.objects.filter(parent_node=OuterRef('user'))
+        .order_by()
+        .values('parent_node')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    MLMTree.objects.update(child_count=Coalesce(Subquery(children), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('mlmtree', '0002_uplinelink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mlmtree',
+            name='child_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_children, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='mlmtree',
+            index=models.Index(condition=models.Q(('child_count__lt', 5)), fields=['tree_id', 'level', 'lft'], name='mlmtree_open_slot_idx'),
+        ),
+    ]
@@ -4,14 +4,29 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()  # ✅ Fix: Avoid circular import
 
+MAX_CHILDREN = 5  # placement width of the MLM tree
+
 class MLMTree(MPTTModel):
     """Model to store MLM hierarchical structure using MPTT."""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="mlm_tree")
     parent = TreeForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='children')
+    child_count = models.PositiveIntegerField(default=0, editable=False)  # users placed directly under this one
 
     class MPTTMeta:
         order_insertion_by = ['user']
 
+    class Meta:
+        indexes = [
+            # Subtree range scans (tree_id + lft/rght) for the lazy tree API
+            models.Index(fields=['tree_id', 'lft'], name='mlmtree_tree_lft_idx'),
+            # Nodes that can still take a child, in BFS order within each tree
+            models.Index(
+                fields=['tree_id', 'level', 'lft'],
+                condition=models.Q(child_count__lt=MAX_CHILDREN),
+                name='mlmtree_open_slot_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} ({self.user.unique_id})"
 
@@ -22,3 +37,25 @@ class MLMTree(MPTTModel):
     def get_upline(self):
         """Returns the chain of sponsors above this user."""
         return self.get_ancestors()
+
+
+class UplineLink(models.Model):
+    """
+    Closure table over CustomUser.parent_node: `ancestor` is placed `depth`
+    levels above `descendant`. Kept in step by the placement and move signals and
+    rebuilt with `manage.py rebuild_uplines`.
+    """
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="downline_links")
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upline_links")
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["descendant", "depth"], name="mlmtree_upline_descendant_depth"),
+        ]
+        indexes = [
+            models.Index(fields=["ancestor", "depth"], name="mlmtree_upline_ancestor_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
@@ -1,3 +1,386 @@
-from django.test import TestCase
+import importlib
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
 
-# Create your tests here.
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from cart.models import Order, OrderItem
+from mlmtree.models import MAX_CHILDREN, MLMTree, UplineLink
+from mlmtree.utils import (
+    compute_upline_links, distribute_commission, distribute_order_commission, get_upline_ids, record_placement,
+)
+from payment.tests import CHECKOUT_THREADS, run_concurrently
+from store.models import Product
+from users.models import CustomUser
+from wallet.models import Wallet, WalletTransaction
+
+
+def old_per_unit_ledger(buyer, lines):
+    """
+    [(user_id, description, amount)] as the old per-unit distribute_commission
+    loop wrote them: one pass over the uplines per unit bought, every credit
+    stored to the cent (DecimalField, half up).
+    """
+    company = CustomUser.objects.filter(is_superuser=True).order_by('pk').first()
+    rows = []
+    for product, quantity in lines:
+        if not product.special_commission_amount:
+            continue
+        share = Decimal(product.special_commission_amount) / Decimal(12)
+        for _ in range(quantity):
+            uplines_paid = 0
+            current = buyer.parent_node
+            while current and uplines_paid < 10:
+                rows.append((current.pk, 'commission', share))
+                current = current.parent_node
+                uplines_paid += 1
+            sponsor_paid = False
+            if buyer.parent_sponsor:
+                rows.append((buyer.parent_sponsor_id, 'Sponsor commission', share))
+                sponsor_paid = True
+            remaining_shares = (10 - uplines_paid) + (0 if sponsor_paid else 1) + 1
+            rows.append((company.pk, 'Company share of commission', share * remaining_shares))
+    return [
+        (user_id, description, amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        for user_id, description, amount in rows
+    ]
+
+
+class OrderCommissionTests(TestCase):
+    """distribute_order_commission credits exactly what the old per-unit loop did, in fewer rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        cls.sponsor = CustomUser.objects.create_user('sponsor@example.com', 'x')
+        # A straight line of uplines, so a buyer's depth is under our control
+        cls.chain = [cls.sponsor]
+        for n in range(12):
+            cls.chain.append(CustomUser.objects.create_user(
+                f'upline{n}@example.com', 'x', parent_sponsor=cls.sponsor, parent_node=cls.chain[-1],
+            ))
+        cls.products = [
+            # 10.00 / 12 and 7.77 / 12 don't divide into cents
+            Product.objects.create(name='Rounding', price=Decimal('50.00'), special_commission_amount=Decimal('10.00')),
+            Product.objects.create(name='Odd', price=Decimal('30.00'), special_commission_amount=Decimal('7.77')),
+            Product.objects.create(name='Even', price=Decimal('80.00'), special_commission_amount=Decimal('24.00')),
+            Product.objects.create(name='None', price=Decimal('5.00'), special_commission_amount=Decimal('0.00')),
+        ]
+
+    def place(self, buyer, quantities):
+        order = Order.objects.create(user=buyer, shipping_address='Address', amount_paid=Decimal('0.00'))
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, user=buyer, quantity=quantity, price=product.price)
+            for product, quantity in zip(self.products, quantities)
+        ])
+        return order, items
+
+    def assertSameAsPerUnitLoop(self, buyer):
+        quantities = [3, 2, 1, 4]
+        expected = old_per_unit_ledger(buyer, list(zip(self.products, quantities)))
+        order, items = self.place(buyer, quantities)
+        before = dict(Wallet.objects.values_list('user_id', 'balance'))
+
+        distribute_order_commission(order, items)
+
+        expected_by_row = defaultdict(Decimal)
+        for user_id, description, amount in expected:
+            expected_by_row[(user_id, description)] += amount
+        actual_by_row = defaultdict(Decimal)
+        for user_id, description, amount in WalletTransaction.objects.filter(order=order).values_list(
+            'wallet__user_id', 'description', 'amount',
+        ):
+            actual_by_row[(user_id, description)] += amount
+        self.assertEqual(dict(actual_by_row), dict(expected_by_row))
+
+        credited = defaultdict(Decimal)
+        for user_id, _, amount in expected:
+            credited[user_id] += amount
+        after = dict(Wallet.objects.values_list('user_id', 'balance'))
+        for user_id, balance in after.items():
+            self.assertEqual(balance - before[user_id], credited.get(user_id, Decimal('0')), user_id)
+        return expected_by_row
+
+    def test_full_upline(self):
+        buyer = CustomUser.objects.create_user(
+            'buyer@example.com', 'x', parent_sponsor=self.sponsor, parent_node=self.chain[-1],
+        )
+        rows = self.assertSameAsPerUnitLoop(buyer)
+        self.assertEqual(len([key for key in rows if key[1] == 'commission']), 10)
+        # Ten uplines and a sponsor leave the company its own share only:
+        # 3 x 0.83 + 2 x 0.65 + 1 x 2.00
+        self.assertEqual(rows[(self.company.pk, 'Company share of commission')], Decimal('5.79'))
+        self.assertEqual(rows[(self.sponsor.pk, 'Sponsor commission')], Decimal('5.79'))
+
+    def test_short_upline(self):
+        buyer = CustomUser.objects.create_user(
+            'buyer@example.com', 'x', parent_sponsor=self.sponsor, parent_node=self.chain[2],
+        )
+        rows = self.assertSameAsPerUnitLoop(buyer)
+        # Two chain members, the sponsor and the company (the sponsor's own parent_node)
+        self.assertEqual(len([key for key in rows if key[1] == 'commission']), 4)
+        # Six unpaid upline shares plus its own: 3 x 5.83 + 2 x 4.53 + 1 x 14.00
+        self.assertEqual(rows[(self.company.pk, 'Company share of commission')], Decimal('40.55'))
+        # The sponsor is also the third upline and is paid as both
+        self.assertEqual(rows[(self.sponsor.pk, 'commission')], Decimal('5.79'))
+
+
+class UplineLinkTests(TestCase):
+    """The upline closure table: how it's computed, kept up on signup and checked."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        cls.users = [cls.company]
+        for n in range(4):
+            cls.users.append(CustomUser.objects.create_user(
+                f'member{n}@example.com', 'x', parent_sponsor=cls.company, parent_node=cls.users[-1],
+            ))
+
+    def links(self, **filters):
+        return set(UplineLink.objects.filter(**filters).values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def test_compute_upline_links(self):
+        self.assertEqual(
+            set(compute_upline_links({1: None, 2: 1, 3: 2, 4: 2})),
+            {(1, 2, 1), (2, 3, 1), (1, 3, 2), (2, 4, 1), (1, 4, 2)},
+        )
+
+    def test_compute_upline_links_cuts_cycles(self):
+        # 1 -> 3 -> 2 -> 1 loops; 4 hangs off the loop
+        links = set(compute_upline_links({1: 3, 2: 1, 3: 2, 4: 3}))
+        self.assertFalse([link for link in links if link[0] == link[1]])
+        self.assertEqual(links, {(3, 1, 1), (2, 1, 2), (2, 3, 1), (3, 4, 1), (2, 4, 2)})
+
+    def test_migration_copy_of_compute_upline_links(self):
+        migration = importlib.import_module('mlmtree.migrations.0002_uplinelink')
+        parent_of = {1: None, 2: 1, 3: 2, 4: 2, 5: 7, 6: 5, 7: 6, 8: 7}
+        self.assertEqual(set(migration.compute_upline_links(parent_of)), set(compute_upline_links(parent_of)))
+
+    def test_record_placement(self):
+        # Signup recorded the whole chain
+        member = self.users[-1]
+        expected = {(ancestor.pk, member.pk, depth) for depth, ancestor in enumerate(reversed(self.users[:-1]), 1)}
+        self.assertEqual(self.links(descendant=member), expected)
+
+        UplineLink.objects.filter(descendant=member).delete()
+        record_placement(member)
+        self.assertEqual(self.links(descendant=member), expected)
+        # Recording twice adds nothing
+        record_placement(member)
+        self.assertEqual(UplineLink.objects.filter(descendant=member).count(), len(expected))
+
+    def test_move_rewrites_the_subtree_links(self):
+        side = CustomUser.objects.create_user('side@example.com', 'x', parent_sponsor=self.company, parent_node=self.company)
+        product = Product.objects.create(name='Kit', price=Decimal('50.00'), special_commission_amount=Decimal('12.00'))
+        moved, below = self.users[3], self.users[4]
+        moved.parent_node = side
+        moved.save()
+
+        self.assertEqual(get_upline_ids(below), [moved.pk, side.pk, self.company.pk])
+        parent_of = dict(CustomUser.objects.values_list('pk', 'parent_node_id'))
+        self.assertEqual(self.links(), set(compute_upline_links(parent_of)))
+        call_command('rebuild_uplines', '--check', stdout=StringIO())
+
+        distribute_commission(below, product)
+        paid = dict(
+            WalletTransaction.objects.filter(category='commission')
+            .values_list('wallet__user_id').annotate(total=Sum('amount')).order_by()
+        )
+        self.assertEqual(paid[side.pk], Decimal('1.00'))
+        self.assertNotIn(self.users[2].pk, paid)
+        self.assertNotIn(self.users[1].pk, paid)
+
+    def test_move_under_own_downline(self):
+        top = self.users[1]
+        top.parent_node = self.users[3]
+        with self.assertRaises(ValueError), transaction.atomic():
+            top.save()
+        self.assertEqual(get_upline_ids(self.users[3]), [user.pk for user in reversed(self.users[:3])])
+
+    def test_rebuild_uplines_check(self):
+        call_command('rebuild_uplines', '--check', stdout=StringIO())
+
+        # Re-parented without going through the signal
+        CustomUser.objects.filter(pk=self.users[3].pk).update(parent_node=self.users[1])
+        with self.assertRaisesMessage(CommandError, 'out of step'):
+            call_command('rebuild_uplines', '--check', stdout=StringIO())
+
+        call_command('rebuild_uplines', stdout=StringIO())
+        self.assertIn((self.users[1].pk, self.users[4].pk, 2), self.links())
+        UplineLink.objects.filter(descendant=self.users[2], depth=1).delete()
+        with self.assertRaisesMessage(CommandError, '1 missing'):
+            call_command('rebuild_uplines', '--check', stdout=StringIO())
+
+
+def child_counts():
+    """{user_id: (stored child_count, users actually placed under them)}"""
+    placed = dict(
+        CustomUser.objects.filter(parent_node__isnull=False)
+        .values_list('parent_node_id').annotate(n=Count('pk')).order_by()
+    )
+    return {
+        user_id: (child_count, placed.get(user_id, 0))
+        for user_id, child_count in MLMTree.objects.values_list('user_id', 'child_count')
+    }
+
+
+class ChildCountTests(TestCase):
+    """MLMTree.child_count tracks parent_node through signups, moves and deletes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        cls.members = [CustomUser.objects.create_user(f'member{n}@example.com', 'x') for n in range(MAX_CHILDREN + 2)]
+
+    def assertCountsMatch(self):
+        for user_id, (stored, placed) in child_counts().items():
+            self.assertEqual(stored, placed, user_id)
+
+    def test_signup_fills_breadth_first(self):
+        self.assertCountsMatch()
+        self.assertEqual(MLMTree.objects.get(user=self.company).child_count, MAX_CHILDREN)
+        self.assertEqual(self.members[-1].parent_node, self.members[0])
+
+    def test_delete_frees_the_slot(self):
+        self.members[2].delete()
+        self.assertCountsMatch()
+        self.assertEqual(MLMTree.objects.get(user=self.company).child_count, MAX_CHILDREN - 1)
+        late = CustomUser.objects.create_user('late@example.com', 'x')
+        self.assertEqual(late.parent_node, self.company)
+        self.assertCountsMatch()
+
+    def test_move(self):
+        member = CustomUser.objects.get(pk=self.members[1].pk)
+        member.parent_node = self.members[3]
+        member.save()
+        member.save()  # saving again isn't another move
+        self.assertCountsMatch()
+        self.assertEqual(MLMTree.objects.get(user=self.members[3]).child_count, 1)
+
+    def test_move_moves_the_tree_node(self):
+        member = CustomUser.objects.get(pk=self.members[1].pk)
+        member.parent_node = self.members[3]
+        member.save()
+        tree_parents = dict(MLMTree.objects.values_list('user_id', 'parent__user_id'))
+        self.assertEqual(tree_parents, dict(CustomUser.objects.values_list('pk', 'parent_node_id')))
+        self.assertIn(member.mlm_tree, MLMTree.objects.get(user=self.members[3]).get_children())
+        positions = set(MLMTree.objects.values_list('user_id', 'tree_id', 'lft', 'rght', 'level'))
+        MLMTree.objects.rebuild()  # the MPTT fields were already right
+        self.assertEqual(set(MLMTree.objects.values_list('user_id', 'tree_id', 'lft', 'rght', 'level')), positions)
+
+        # The sponsor's freed slot is the first open one in BFS order again
+        late = CustomUser.objects.create_user('late@example.com', 'x')
+        self.assertEqual(late.parent_node, self.company)
+        self.assertCountsMatch()
+
+    def test_rebuild_uplines_repairs_counts(self):
+        MLMTree.objects.filter(user=self.company).update(child_count=MAX_CHILDREN - 2)
+        with self.assertRaisesMessage(CommandError, 'child_count out of step'):
+            call_command('rebuild_uplines', '--check', stdout=StringIO())
+        call_command('rebuild_uplines', stdout=StringIO())
+        self.assertCountsMatch()
+
+
+class ConcurrentPlacementTests(TransactionTestCase):
+    """Parallel signups under a full sponsor never overfill a node."""
+
+    def test_parallel_signups(self):
+        company = CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        for n in range(MAX_CHILDREN):
+            CustomUser.objects.create_user(f'member{n}@example.com', 'x', parent_sponsor=company)
+        self.assertEqual(MLMTree.objects.get(user=company).child_count, MAX_CHILDREN)
+
+        def signup(n):
+            def job():
+                # The whole signup retries if SQLite turns a writer away
+                with transaction.atomic():
+                    CustomUser.objects.create_user(f'new{n}@example.com', 'x', parent_sponsor=company)
+            return job
+
+        placed, rejected = run_concurrently([signup(n) for n in range(CHECKOUT_THREADS)])
+
+        self.assertEqual((placed, rejected), (CHECKOUT_THREADS, 0))
+        newcomers = CustomUser.objects.filter(email__startswith='new')
+        self.assertFalse(newcomers.filter(parent_node__isnull=True).exists())
+        self.assertFalse(newcomers.filter(parent_node=company).exists())
+        for user_id, (stored, placed_under) in child_counts().items():
+            self.assertLessEqual(placed_under, MAX_CHILDREN, user_id)
+            self.assertEqual(stored, placed_under, user_id)
+
+
+class TreeApiTests(TestCase):
+    """get_mlm_tree: the nested whole tree, and the paged lazy slices."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        # Five under the company, the next three under the first of them
+        cls.members = [
+            CustomUser.objects.create_user(f'member{n}@example.com', 'x', first_name=f'Member{n}', last_name='Test')
+            for n in range(MAX_CHILDREN + 3)
+        ]
+        cls.url = reverse('get_mlm_tree')
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_nested_tree(self):
+        with self.assertNumQueries(1):
+            tree = self.get()
+        self.assertEqual([node['id'] for node in tree], [self.company.pk])
+        top = tree[0]
+        self.assertEqual(top['node_id'], self.company.mlm_tree.pk)
+        self.assertEqual([child['id'] for child in top['children']], [m.pk for m in self.members[:MAX_CHILDREN]])
+        first = top['children'][0]
+        self.assertEqual(first['name'], 'Member0 Test')
+        self.assertEqual(first['child_count'], 3)
+        self.assertEqual([child['id'] for child in first['children']], [m.pk for m in self.members[MAX_CHILDREN:]])
+
+    def test_cursor_paging(self):
+        whole = self.get(depth=2)
+        self.assertIsNone(whole['next_cursor'])
+        self.assertEqual(len(whole['nodes']), 1 + len(self.members))
+
+        paged, cursor = [], None
+        while True:
+            params = {'depth': 2, 'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.get(**params)
+            self.assertLessEqual(len(page['nodes']), 3)
+            paged += page['nodes']
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(paged, whole['nodes'])
+
+    def test_lazy_children(self):
+        top = self.get(depth=1)['nodes']
+        self.assertEqual(len(top), 1 + MAX_CHILDREN)
+        first = next(node for node in top if node['id'] == self.members[0].pk)
+        self.assertEqual(first['parent'], self.company.pk)
+        self.assertEqual(first['child_count'], 3)
+        self.assertNotIn(self.members[-1].pk, [node['id'] for node in top])
+
+        # Expanding a node: its user id as root, one level down
+        with self.assertNumQueries(2):
+            subtree = self.get(root=self.members[0].pk, depth=1)['nodes']
+        self.assertEqual(subtree[0]['id'], self.members[0].pk)
+        self.assertEqual(
+            [(node['id'], node['parent']) for node in subtree[1:]],
+            [(m.pk, self.members[0].pk) for m in self.members[MAX_CHILDREN:]],
+        )
+
+    def test_bad_parameters(self):
+        for params in ({'depth': 'x'}, {'limit': -1}, {'cursor': '1'}, {'cursor': 'a:b'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+        self.assertEqual(self.client.get(self.url, {'root': 999999}).status_code, 404)
@@ -1,9 +1,180 @@
-from decimal import Decimal
+from collections import defaultdict, deque
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from mlmtree.models import MAX_CHILDREN, MLMTree, UplineLink
 from users.models import CustomUser
-from wallet.models import Wallet
-from wallet.utils import log_wallet_transaction  # ✅ Import transaction logger
+from wallet.models import Wallet, WalletTransaction
+from wallet.utils import record_earnings
+
+UPLINE_LEVELS = 10      # uplines paid through parent_node
+COMMISSION_SHARES = 12  # 10 uplines + 1 sponsor + 1 company
+CENT = Decimal('0.01')
+
+
+def _to_cents(amount):
+    """Round the way a DecimalField(decimal_places=2) column stores the value."""
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def get_upline_ids(user, limit=UPLINE_LEVELS):
+    """Returns the ids of up to `limit` parent_node ancestors, nearest first."""
+    upline_ids = list(
+        UplineLink.objects.filter(descendant_id=user.pk, depth__lte=limit)
+        .order_by('depth')
+        .values_list('ancestor_id', flat=True)
+    )
+    if upline_ids or not user.parent_node_id:
+        return upline_ids
+
+    # No closure rows yet (e.g. placed outside the signal): walk parent_node
+    current_id = user.parent_node_id
+    while current_id and len(upline_ids) < limit:
+        upline_ids.append(current_id)
+        current_id = (
+            CustomUser.objects.filter(pk=current_id)
+            .values_list('parent_node_id', flat=True)
+            .first()
+        )
+    return upline_ids
+
+
+def claim_open_slot(sponsor):
+    """
+    Returns the id of the user a new registrant under `sponsor` is placed
+    under: the first node in BFS order from the sponsor with fewer than
+    MAX_CHILDREN children. The slot is taken (child_count incremented)
+    before returning, so call this inside the registration's transaction.
+    """
+    try:
+        sponsor_node = MLMTree.objects.get(user=sponsor)
+    except MLMTree.DoesNotExist:
+        return _claim_open_slot_bfs(sponsor)
+
+    with transaction.atomic():
+        # Inserts shift lft/rght across the whole tree, so placements in one
+        # tree are serialised on its root row.
+        list(MLMTree.objects.select_for_update().filter(tree_id=sponsor_node.tree_id, level=0).values_list('pk'))
+        sponsor_node.refresh_from_db(fields=['tree_id', 'lft', 'rght'])
+
+        while True:
+            # Within one level, MPTT lft order is BFS order (children by user id)
+            candidate = (
+                MLMTree.objects.filter(
+                    tree_id=sponsor_node.tree_id,
+                    lft__gte=sponsor_node.lft,
+                    rght__lte=sponsor_node.rght,
+                    child_count__lt=MAX_CHILDREN,
+                )
+                .order_by('level', 'lft')
+                .values_list('pk', 'user_id')
+                .first()
+            )
+            if candidate is None:
+                return None
+            node_id, user_id = candidate
+            claimed = MLMTree.objects.filter(pk=node_id, child_count__lt=MAX_CHILDREN).update(
+                child_count=F('child_count') + 1
+            )
+            if claimed:
+                return user_id
+
+
+def _claim_open_slot_bfs(sponsor):
+    """Fallback for sponsors without an MLMTree node: plain BFS over child_nodes."""
+    queue = deque([sponsor])
+    while queue:
+        current = queue.popleft()
+        children = list(current.child_nodes.all())
+        if len(children) < MAX_CHILDREN:
+            MLMTree.objects.filter(user=current).update(child_count=F('child_count') + 1)
+            return current.pk
+        queue.extend(children)
+    return None
+
+
+def record_placement(user):
+    """Adds the closure rows for a newly placed user: its parent's rows, one level deeper."""
+    if not user.parent_node_id:
+        return
+    links = [UplineLink(ancestor_id=user.parent_node_id, descendant_id=user.pk, depth=1)]
+    links += [
+        UplineLink(ancestor_id=ancestor_id, descendant_id=user.pk, depth=depth + 1)
+        for ancestor_id, depth in UplineLink.objects.filter(
+            descendant_id=user.parent_node_id
+        ).values_list('ancestor_id', 'depth')
+    ]
+    UplineLink.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def move_upline_links(user):
+    """
+    Rewrites the closure rows after `user` moved to its current parent_node:
+    the links from the user's subtree to its old ancestors go, and every
+    (new ancestor, subtree member) pair goes in at the combined depth.
+    """
+    with transaction.atomic():
+        subtree = {user.pk: 0}
+        subtree.update(UplineLink.objects.filter(ancestor_id=user.pk).values_list('descendant_id', 'depth'))
+        if user.parent_node_id in subtree:
+            raise ValueError("A user can't be placed under their own downline.")
+        ancestors = {}
+        if user.parent_node_id:
+            ancestors[user.parent_node_id] = 1
+            ancestors.update(
+                (ancestor_id, depth + 1)
+                for ancestor_id, depth in UplineLink.objects.filter(
+                    descendant_id=user.parent_node_id
+                ).values_list('ancestor_id', 'depth')
+            )
+        old_ancestor_ids = list(
+            UplineLink.objects.filter(descendant_id=user.pk).values_list('ancestor_id', flat=True)
+        )
+
+        UplineLink.objects.filter(descendant_id__in=subtree, ancestor_id__in=old_ancestor_ids).delete()
+        UplineLink.objects.bulk_create(
+            [
+                UplineLink(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=above + below)
+                for ancestor_id, above in ancestors.items()
+                for descendant_id, below in subtree.items()
+            ],
+            batch_size=5000,
+        )
+
 
-def distribute_commission(user, product):
+def compute_upline_links(parent_of):
+    """
+    Yields (ancestor_id, descendant_id, depth) for every user in
+    `parent_of` ({user_id: parent_node_id}). A parent_node cycle is cut
+    where it closes.
+    """
+    chains = {}  # user_id -> ancestor ids, nearest first
+    for start in parent_of:
+        path = []
+        on_path = set()
+        current = start
+        while current is not None and current not in chains and current not in on_path:
+            path.append(current)
+            on_path.add(current)
+            current = parent_of.get(current)
+
+        if current is None or current in on_path:
+            above = []
+        else:
+            above = [current] + chains[current]
+        for user_id in reversed(path):
+            chains[user_id] = above
+            above = [user_id] + above
+
+    for user_id, ancestors in chains.items():
+        for depth, ancestor_id in enumerate(ancestors, start=1):
+            yield ancestor_id, user_id, depth
+
+
+def distribute_commission(user, product, quantity=1):
     """
     Distributes commission from product.special_commission_amount:
     - Up to 10 uplines (parent_node)
@@ -11,51 +182,115 @@ def distribute_commission(user, product):
     - Remaining shares to company (superuser)
     Also logs each credit in WalletTransaction.
     """
-    if not product.special_commission_amount:
-        return
+    return apply_commission(user, [(product, quantity)])
 
-    total_commission = Decimal(product.special_commission_amount)
-    share = total_commission / Decimal(12)
-    company = CustomUser.objects.filter(is_superuser=True).first()
-
-    uplines_paid = 0
-    current = user.parent_node
-
-    # 1️⃣ Pay 10 uplines
-    while current and uplines_paid < 10:
-        wallet, _ = Wallet.objects.get_or_create(user=current)
-        wallet.balance += share
-        wallet.save()
-        log_wallet_transaction(
-            user=current,
-            amount=share,
-            description=f"commission"
-        )
-        current = current.parent_node
-        uplines_paid += 1
-
-    # 2️⃣ Sponsor (if exists)
-    sponsor_paid = False
-    if user.parent_sponsor:
-        sponsor = user.parent_sponsor
-        wallet, _ = Wallet.objects.get_or_create(user=sponsor)
-        wallet.balance += share
-        wallet.save()
-        log_wallet_transaction(
-            user=sponsor,
-            amount=share,
-            description=f"Sponsor commission"
+
+def distribute_order_commission(order, items=None):
+    """
+    Distributes commission for every unit of an order in one pass.
+    `items` defaults to the order's OrderItems; pass the freshly created
+    ones to avoid re-reading them.
+    """
+    if items is None:
+        items = order.items.select_related('product')
+    return apply_commission(order.user, [(item.product, item.quantity) for item in items], order=order)
+
+
+def apply_commission(buyer, lines, order=None):
+    """
+    Credits the commission for `lines` ((product, quantity) pairs) bought by `buyer`.
+
+    The upline chain is resolved once, every beneficiary's share is summed in
+    memory and the result is written with one wallet UPDATE and one
+    bulk_create of WalletTransaction rows. Each unit is rounded to cents
+    exactly as the old per-unit credits were, so ledger totals are unchanged.
+    Returns {user_id: credited amount}.
+    """
+    shares = []
+    for product, quantity in lines:
+        if product.special_commission_amount and quantity > 0:
+            shares.append((Decimal(product.special_commission_amount) / Decimal(COMMISSION_SHARES), quantity))
+    if not shares:
+        return {}
+
+    upline_ids = get_upline_ids(buyer)
+    sponsor_id = buyer.parent_sponsor_id
+    company_id = CustomUser.objects.filter(is_superuser=True).order_by('pk').values_list('pk', flat=True).first()
+    remaining_shares = (UPLINE_LEVELS - len(upline_ids)) + (0 if sponsor_id else 1) + 1
+
+    # (user_id, category, level) -> amount, in the order the old loop logged them
+    credits = defaultdict(Decimal)
+    for share, quantity in shares:
+        unit_share = _to_cents(share) * quantity
+        for level, upline_id in enumerate(upline_ids, start=1):
+            credits[(upline_id, 'commission', level)] += unit_share
+        if sponsor_id:
+            credits[(sponsor_id, 'sponsor_commission', None)] += unit_share
+        if company_id:
+            credits[(company_id, 'company_share', None)] += _to_cents(share * remaining_shares) * quantity
+
+    return credit_wallets(credits, order=order)
+
+
+# Ledger descriptions of commission credits, as they've always been written
+CREDIT_DESCRIPTIONS = {
+    'commission': 'commission',
+    'sponsor_commission': 'Sponsor commission',
+    'company_share': 'Company share of commission',
+}
+
+
+def credit_wallets(credits, order=None):
+    """
+    Applies {(user_id, category, level): amount} credits with one bulk
+    wallet update, one bulk insert of ledger rows and one update of the
+    beneficiaries' earnings summaries.
+    """
+    totals = defaultdict(Decimal)
+    for (user_id, _, _), amount in credits.items():
+        totals[user_id] += amount
+
+    with transaction.atomic():
+        # Lock in pk order so concurrent orders sharing uplines can't deadlock
+        wallets = {
+            wallet.user_id: wallet
+            for wallet in Wallet.objects.select_for_update().filter(user_id__in=totals).order_by('pk')
+        }
+        missing = [Wallet(user_id=user_id) for user_id in totals if user_id not in wallets]
+        if missing:
+            Wallet.objects.bulk_create(missing, ignore_conflicts=True)
+            wallets = {
+                wallet.user_id: wallet
+                for wallet in Wallet.objects.select_for_update().filter(user_id__in=totals).order_by('pk')
+            }
+
+        Wallet.objects.filter(pk__in=[wallet.pk for wallet in wallets.values()]).update(
+            balance=F('balance') + Case(
+                *[When(pk=wallets[user_id].pk, then=Value(amount)) for user_id, amount in totals.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=timezone.now(),
         )
-        sponsor_paid = True
-
-    # 3️⃣ Company gets remaining shares
-    remaining_shares = (10 - uplines_paid) + (0 if sponsor_paid else 1) + 1
-    if company:
-        wallet, _ = Wallet.objects.get_or_create(user=company)
-        wallet.balance += share * remaining_shares
-        wallet.save()
-        log_wallet_transaction(
-            user=company,
-            amount=share * remaining_shares,
-            description=f"Company share of commission"
-        )
\ No newline at end of file
+        # Each row's running balance, from the balances read under the lock
+        balances = {user_id: wallet.balance for user_id, wallet in wallets.items()}
+        rows = []
+        for (user_id, category, level), amount in credits.items():
+            balances[user_id] += amount
+            rows.append(WalletTransaction(
+                wallet=wallets[user_id],
+                transaction_type='credit',
+                category=category,
+                level=level,
+                amount=amount,
+                balance_after=balances[user_id],
+                description=CREDIT_DESCRIPTIONS.get(category, category),
+                order=order,
+            ))
+        WalletTransaction.objects.bulk_create(rows)
+        record_earnings({
+            (wallets[user_id].pk, category, level): amount
+            for (user_id, category, level), amount in credits.items()
+            if category in WalletTransaction.EARNING_CATEGORIES
+        })
+
+    return dict(totals)
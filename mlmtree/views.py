@@ -1,20 +1,107 @@
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.db.models import Q
+from ecommerce.db_routers import replica_reads
 from .models import MLMTree
 
+DEFAULT_TREE_DEPTH = 2
+MAX_TREE_DEPTH = 6
+DEFAULT_TREE_PAGE_SIZE = 500
+MAX_TREE_PAGE_SIZE = 2000
+
+
 def mlm_tree_view(request):
     """Renders the HTML page for MLM tree visualization in Django Admin."""
     return render(request, "admin/mlm_tree_view.html")
 
+
+def _int_param(request, name, default, maximum=None):
+    value = int(request.GET.get(name, default))
+    if value < 0:
+        raise ValueError(name)
+    return min(value, maximum) if maximum is not None else value
+
+
+def _serialize_node(node):
+    # "id" is the user id, as it always was; node_id is the MLMTree row
+    return {
+        "id": node["user_id"],
+        "node_id": node["pk"],
+        "name": f"{node['user__first_name']} {node['user__last_name']}",
+        "child_count": node["child_count"],
+    }
+
+
+def _nested_tree(nodes):
+    """The whole forest as nested {..., children: [...]} dicts, from one query."""
+    by_pk = {}
+    roots = []
+    for node in nodes.order_by("tree_id", "lft"):
+        item = by_pk[node["pk"]] = dict(_serialize_node(node), children=[])
+        parent = by_pk.get(node["parent_id"])
+        (parent["children"] if parent else roots).append(item)
+    return roots
+
+
+@replica_reads
 def get_mlm_tree(request):
-    """Returns the MLM tree as JSON for visualization."""
-    def serialize_tree(node):
-        return {
-            "id": node.user.id,
-            "name": f"{node.user.first_name} {node.user.last_name}",
-            "children": [serialize_tree(child) for child in node.get_children()]
-        }
-
-    root_nodes = MLMTree.objects.filter(parent=None)
-    tree_data = [serialize_tree(node) for node in root_nodes]
-    return JsonResponse(tree_data, safe=False)
+    """
+    Returns the MLM tree as JSON for visualization.
+
+    Without query params this is the whole tree, nested, as before. Any of
+    these switches to one flat page of a depth-limited slice for lazy
+    rendering, returned as {"nodes": [...], "next_cursor": ...}:
+    - root:   user id to start from (default: every top-level node)
+    - depth:  levels below the root to include (default 2)
+    - cursor: `next_cursor` from the previous page
+    - limit:  page size
+
+    Each subtree page is a single MPTT range query with users joined in.
+    `child_count` lets the client expand nodes below the depth limit on click.
+    """
+    fields = ("pk", "parent_id", "child_count", "user_id", "user__first_name", "user__last_name")
+    if not request.GET.keys() & {"root", "depth", "cursor", "limit"}:
+        return JsonResponse(_nested_tree(MLMTree.objects.values(*fields)), safe=False)
+
+    try:
+        depth = _int_param(request, "depth", DEFAULT_TREE_DEPTH, MAX_TREE_DEPTH)
+        limit = _int_param(request, "limit", DEFAULT_TREE_PAGE_SIZE, MAX_TREE_PAGE_SIZE) or 1
+        root_id = request.GET.get("root")
+        root_id = int(root_id) if root_id else None
+        cursor = request.GET.get("cursor")
+        after = tuple(int(part) for part in cursor.split(":")) if cursor else None
+        if after is not None and len(after) != 2:
+            raise ValueError("cursor")
+    except ValueError:
+        return JsonResponse({"error": "Invalid tree parameters."}, status=400)
+
+    nodes = MLMTree.objects.all()
+    if root_id:
+        root = MLMTree.objects.filter(user_id=root_id).values("tree_id", "lft", "rght", "level").first()
+        if root is None:
+            return JsonResponse({"error": "Node not found."}, status=404)
+        nodes = nodes.filter(
+            tree_id=root["tree_id"],
+            lft__gte=root["lft"],
+            rght__lte=root["rght"],
+            level__lte=root["level"] + depth,
+        )
+    else:
+        nodes = nodes.filter(level__lte=depth)
+
+    if after:
+        nodes = nodes.filter(Q(tree_id__gt=after[0]) | Q(tree_id=after[0], lft__gt=after[1]))
+
+    page = list(
+        nodes.order_by("tree_id", "lft").values(*fields, "parent__user_id", "level", "tree_id", "lft")[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return JsonResponse({
+        "nodes": [
+            dict(_serialize_node(node), parent=node["parent__user_id"], level=node["level"])
+            for node in page
+        ],
+        "next_cursor": f"{page[-1]['tree_id']}:{page[-1]['lft']}" if has_more else None,
+    })
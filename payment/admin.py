@@ -38,8 +38,7 @@ class PaymentAdmin(admin.ModelAdmin):
         update related orders as 'Paid',
         and distribute commissions automatically.
         """
-        from mlmtree.utils import distribute_commission
-        from cart.models import OrderItem
+        from mlmtree.utils import distribute_order_commission
 
         updated = 0
         for payment in queryset.filter(status='pending'):
@@ -51,10 +50,7 @@ class PaymentAdmin(admin.ModelAdmin):
             order.save()
 
             # Distribute commissions for all products in this order
-            order_items = OrderItem.objects.filter(order=order)
-            for item in order_items:
-                for _ in range(item.quantity):
-                    distribute_commission(order.user, item.product)
+            distribute_order_commission(order)
 
             updated += 1
 
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0005_alter_payment_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['order', 'status'], name='payment_order_status_idx'),
+        ),
+    ]
@@ -32,6 +32,11 @@ class Payment(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'status'], name='payment_order_status_idx'),
+        ]
+
     def __str__(self):
         return f"Payment {self.user.email} | {self.amount} | {self.payment_method}"
 
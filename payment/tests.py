@@ -1,3 +1,140 @@
-from django.test import TestCase
+import os
+import threading
+import time
+from decimal import Decimal
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TransactionTestCase
+
+from cart.models import Order, OrderItem
+from store.models import Product
+from users.models import CustomUser
+from wallet.models import Wallet, WalletTransaction
+from payment.utils import CheckoutError, place_order
+
+# Parallel checkouts per scenario; raise it when running against Postgres
+CHECKOUT_THREADS = int(os.environ.get('CHECKOUT_THREADS', 8))
+LOCK_RETRIES = 50
+
+
+def run_concurrently(jobs):
+    """
+    Runs every job in its own thread (and DB connection), released together.
+    Returns (placed, rejected) counts; a job that never got the write lock
+    fails the test rather than counting as rejected.
+    """
+    barrier = threading.Barrier(len(jobs))
+    results = []
+    starved = []
+
+    def worker(job):
+        try:
+            barrier.wait()
+            for attempt in range(LOCK_RETRIES):
+                try:
+                    job()
+                    results.append(True)
+                    return
+                except OperationalError:
+                    # SQLite refuses a second writer instead of waiting: retry
+                    time.sleep(0.01 * (attempt + 1))
+            starved.append(job)
+        except CheckoutError:
+            results.append(False)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if starved:
+        raise AssertionError(f"{len(starved)} job(s) still locked out after {LOCK_RETRIES} retries")
+    return results.count(True), results.count(False)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Fires parallel checkouts at place_order and checks stock and balances afterwards."""
+
+    def setUp(self):
+        CustomUser.objects.create_superuser(email='company@example.com', password='x')
+        self.product = Product.objects.create(
+            name='Widget', price=Decimal('100.00'), stock_quantity=3,
+            special_commission_amount=Decimal('12.00'), profile_image=None,
+        )
+
+    def make_buyer(self, n, balance):
+        user = CustomUser.objects.create_user(
+            email=f'buyer{n}@example.com', password='x', first_name='Buyer', last_name=str(n)
+        )
+        Wallet.objects.filter(user=user).update(balance=balance)
+        return user
+
+    def checkout(self, user, quantity=1):
+        return lambda: place_order(
+            user, [(self.product.pk, quantity)],
+            payment_method='wallet', shipping_address='Test address',
+        )
+
+    def assert_ledger_matches(self, user, starting_balance):
+        wallet = Wallet.objects.get(user=user)
+        paid = Order.objects.filter(user=user).aggregate(total=Sum('amount_paid'))['total'] or 0
+        debited = WalletTransaction.objects.filter(
+            wallet=wallet, transaction_type='debit'
+        ).aggregate(total=Sum('amount'))['total'] or 0
+        credited = WalletTransaction.objects.filter(
+            wallet=wallet, transaction_type='credit'
+        ).aggregate(total=Sum('amount'))['total'] or 0
+        self.assertGreaterEqual(wallet.balance, 0)
+        self.assertEqual(debited, paid)
+        # One debit per order, for exactly what it cost
+        self.assertEqual(
+            sorted(WalletTransaction.objects.filter(wallet=wallet, transaction_type='debit').values_list('order_id', 'amount')),
+            sorted(Order.objects.filter(user=user).values_list('pk', 'amount_paid')),
+        )
+        self.assertEqual(wallet.balance, starting_balance - paid + credited)
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        starting_balance = Decimal('1000.00')
+        buyers = [self.make_buyer(n, starting_balance) for n in range(CHECKOUT_THREADS)]
+
+        placed, rejected = run_concurrently([self.checkout(buyer) for buyer in buyers])
+
+        self.product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=self.product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(placed + rejected, CHECKOUT_THREADS)
+        self.assertEqual(placed, min(3, CHECKOUT_THREADS))
+        self.assertEqual(Order.objects.count(), placed)
+        self.assertEqual(sold, placed)
+        self.assertGreaterEqual(self.product.stock_quantity, 0)
+        self.assertEqual(self.product.stock_quantity + sold, 3)
+        self.assertEqual(self.product.is_listed, self.product.stock_quantity > 0)
+        for buyer in buyers:
+            self.assert_ledger_matches(buyer, starting_balance)
+
+    def test_parallel_checkouts_do_not_double_spend(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_quantity=100)
+        starting_balance = Decimal('250.00')  # enough for two units
+        buyer = self.make_buyer(0, starting_balance)
+
+        placed, rejected = run_concurrently([self.checkout(buyer) for _ in range(CHECKOUT_THREADS)])
+
+        self.product.refresh_from_db()
+        self.assertEqual(placed, min(2, CHECKOUT_THREADS))
+        self.assertEqual(rejected, CHECKOUT_THREADS - placed)
+        self.assertGreaterEqual(self.product.stock_quantity, 0)
+        self.assertEqual(self.product.stock_quantity, 100 - placed)
+        self.assert_ledger_matches(buyer, starting_balance)
+
+    def test_rejected_checkout_leaves_no_trace(self):
+        buyer = self.make_buyer(0, Decimal('50.00'))
+
+        with self.assertRaises(CheckoutError):
+            self.checkout(buyer)()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Wallet.objects.get(user=buyer).balance, Decimal('50.00'))
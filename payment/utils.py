@@ -0,0 +1,170 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from cart.models import Order, OrderItem
+from mlmtree.utils import distribute_order_commission
+from payment.models import Payment
+from store.models import Product
+from store.utils import bump_catalog_version, log_catalog_changes
+from users.models import Profile
+from wallet.models import Wallet, WalletTransaction
+
+
+class CheckoutError(ValueError):
+    """Raised when an order can't be placed (stock, balance, empty cart)."""
+
+
+def format_shipping_address(shipping):
+    """Turns the shipping dict kept in the session into the Order text block."""
+    return (
+        f"{shipping['phone']}\n"
+        f"{shipping['shipping_address1']}\n"
+        f"{shipping['shipping_address2']}\n"
+        f"{shipping['city']}\n"
+        f"{shipping['state']}\n"
+        f"{shipping['zipcode']}\n"
+        f"{shipping['country']}"
+    )
+
+
+def cart_lines(cart):
+    """(product_id, quantity) pairs for everything in a cart."""
+    return list(cart.items.values_list('product_id', 'quantity'))
+
+
+def place_order(user, lines, *, payment_method, shipping_address, full_name=None,
+                transaction_id='', payment_proof=None, cart=None):
+    """
+    Places an order for `lines` ((product_id, quantity) pairs) in one short transaction.
+
+    Product rows are locked in pk order, then the buyer's wallet, so
+    concurrent checkouts can't oversell stock or spend the same balance twice.
+    Prices come from the locked rows, stock and balance are decremented with
+    guarded F() updates and the OrderItems are bulk inserted.
+
+    - payment_method 'wallet': debits the wallet, marks the order Paid and
+      distributes commission
+    - anything else: order stays Pending (commission on confirmation)
+
+    If `cart` is given it is emptied in the same transaction.
+    Raises CheckoutError when the order can't be placed.
+    """
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        if quantity > 0:
+            quantities[int(product_id)] += int(quantity)
+    if not quantities:
+        raise CheckoutError("Your cart is empty.")
+
+    paid = payment_method == 'wallet'
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=quantities)
+            .order_by('pk')
+            .only('pk', 'name', 'price', 'is_sale', 'sale_price', 'stock_quantity', 'special_commission_amount')
+        )
+        if len(products) != len(quantities):
+            raise CheckoutError("Some products in your cart are no longer available.")
+
+        order_total = Decimal('0.00')
+        for product in products:
+            if product.stock_quantity < quantities[product.pk]:
+                raise CheckoutError(f"Insufficient stock for {product.name}.")
+            product.unit_price = product.sale_price if product.is_sale else product.price
+            order_total += product.unit_price * quantities[product.pk]
+
+        wallet = None
+        if paid:
+            wallet, _ = Wallet.objects.get_or_create(user=user)
+            debited = Wallet.objects.filter(pk=wallet.pk, balance__gte=order_total).update(
+                balance=F('balance') - order_total,
+                updated_at=timezone.now(),
+            )
+            if not debited:
+                raise CheckoutError("Insufficient wallet balance.")
+            # The UPDATE holds the row lock, so this is the balance the debit left
+            balance_after = Wallet.objects.filter(pk=wallet.pk).values_list('balance', flat=True).get()
+
+        # One UPDATE for all stock; the per-row guards make it safe even where
+        # SELECT ... FOR UPDATE is a no-op (SQLite)
+        in_stock = Q()
+        for product_id, quantity in quantities.items():
+            in_stock |= Q(pk=product_id, stock_quantity__gte=quantity)
+        updated = Product.objects.filter(in_stock).update(
+            stock_quantity=F('stock_quantity') - Case(
+                *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()]
+            ),
+            is_listed=Case(
+                *[When(pk=product_id, stock_quantity__gt=quantity, then=Value(True))
+                  for product_id, quantity in quantities.items()],
+                default=Value(False),
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise CheckoutError("Some products just went out of stock.")
+        # Stock changed without a save(). Only products that sold out change
+        # what the catalog shows (they drop out of listings), so only they
+        # refresh the catalog caches and reach the apps' catalog sync
+        sold_out = [product.pk for product in products if product.stock_quantity <= quantities[product.pk]]
+        if sold_out:
+            bump_catalog_version()
+            log_catalog_changes(Product, sold_out, 'delisted')
+
+        order = Order.objects.create(
+            user=user,
+            full_name=full_name if full_name is not None else f"{user.first_name} {user.last_name}",
+            email=user.email,
+            amount_paid=order_total,
+            shipping_address=shipping_address,
+            payment_method=payment_method,
+            payment_status='Paid' if paid else 'Pending',
+            transaction_id=transaction_id or None,
+        )
+        if payment_method in dict(Payment.PAYMENT_METHOD):
+            Payment.objects.create(
+                user=user,
+                order=order,
+                status='captured' if paid else 'pending',
+                amount=order_total,
+                payment_method=payment_method,
+                transaction_id=transaction_id or '',
+                payment_proof=payment_proof,
+            )
+        if wallet is not None:
+            WalletTransaction.objects.create(
+                wallet=wallet,
+                transaction_type='debit',
+                category='purchase',
+                amount=order_total,
+                balance_after=balance_after,
+                description=f"Order {order.id} placed with Wallet",
+                order=order,
+            )
+
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                user=user,
+                quantity=quantities[product.pk],
+                price=product.unit_price,
+            )
+            for product in products
+        ])
+
+        if paid:
+            distribute_order_commission(order, order_items)
+
+        if cart is not None:
+            cart.items.all().delete()
+            cart.delete()
+            Profile.objects.filter(user=user).update(old_cart="")
+
+    return order
@@ -3,12 +3,9 @@ from django.contrib import messages
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 
-from wallet.models import Wallet, WalletTransaction
-from cart.models import Cart, Order, OrderItem
-from store.models import Product
-from users.models import ShippingAddress, Profile
-from payment.models import Payment
-from mlmtree.utils import distribute_commission
+from cart.models import Cart
+from users.models import ShippingAddress
+from payment.utils import CheckoutError, cart_lines, format_shipping_address, place_order
 
 
 @csrf_exempt
@@ -20,10 +17,7 @@ def payment(request):
         messages.error(request, "Your cart is empty.")
         return redirect('store')
 
-    cart_items = cart_instance.get_prods()
-    cart_quantities = cart_instance.get_quants()
-    total_quantity = sum(cart_quantities.values())
-    order_total = cart_instance.order_total()
+    pricing = cart_instance.get_pricing()
 
     try:
         shipping = ShippingAddress.objects.get(user=request.user)
@@ -43,9 +37,9 @@ def payment(request):
     }
 
     context = {
-        'cart_items': cart_items,
-        'order_total': order_total,
-        'total_quantity': total_quantity,
+        'cart_items': pricing['items'],
+        'order_total': pricing['order_total'],
+        'total_quantity': pricing['total_quantity'],
         'shipping': request.session['shipping'],
         'currency': 'INR'
     }
@@ -109,79 +103,19 @@ def payment_execute(request):
             messages.error(request, "Cart not found.")
             return redirect('store')
 
-        cart_items = cart_instance.get_prods()
-        cart_quantities = cart_instance.get_quants()
-        order_total = cart_instance.order_total()
-
-        wallet, _ = Wallet.objects.get_or_create(user=user)
-        if wallet.balance < order_total:
-            messages.error(request, "Insufficient wallet balance.")
+        try:
+            place_order(
+                user,
+                cart_lines(cart_instance),
+                payment_method='wallet',
+                shipping_address=format_shipping_address(shipping),
+                cart=cart_instance,
+            )
+        except CheckoutError as e:
+            messages.error(request, str(e))
             return redirect('payment')
 
-        # Create order and payment
-        full_name = f"{user.first_name} {user.last_name}"
-        shipping_address = (
-            f"{shipping['phone']}\n"
-            f"{shipping['shipping_address1']}\n"
-            f"{shipping['shipping_address2']}\n"
-            f"{shipping['city']}\n"
-            f"{shipping['state']}\n"
-            f"{shipping['zipcode']}\n"
-            f"{shipping['country']}"
-        )
-
-        order = Order.objects.create(
-            user=user,
-            full_name=full_name,
-            email=user.email,
-            amount_paid=order_total,
-            shipping_address=shipping_address,
-            payment_method='wallet',
-            payment_status='Paid',
-            transaction_id=''  # optional
-        )
-
-        Payment.objects.create(
-            user=user,
-            order=order,
-            status='captured',
-            amount=order_total,
-            payment_method='wallet'
-        )
-
-        WalletTransaction.objects.create(
-            wallet=wallet,
-            transaction_type='debit',
-            amount=order_total,
-            description=f"Order {order.id} placed with Wallet",
-            order=order
-        )
-
-        wallet.balance -= order_total
-        wallet.save()
-
-        # Save order items, update stock, distribute commission
-        for item in cart_items:
-            product = item.product
-            quantity = cart_quantities.get(str(product.id), item.quantity)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                user=user,
-                quantity=quantity,
-                price=item.price
-            )
-            for _ in range(quantity):
-                distribute_commission(user, product)
-            product.stock_quantity -= quantity
-            product.save()
-
-        # Clear cart
-        cart_instance.items.all().delete()
-        cart_instance.delete()
-        Profile.objects.filter(user=user).update(old_cart="")
         request.session.pop('payment_method', None)
-
         messages.success(request, 'Payment successful via Wallet!')
         return redirect('order_success')
 
@@ -197,66 +131,22 @@ def payment_execute(request):
             messages.error(request, "No active cart found.")
             return redirect('store')
 
-        cart_items = cart_instance.get_prods()
-        cart_quantities = cart_instance.get_quants()
-        order_total = cart_instance.order_total()
-
-        full_name = f"{user.first_name} {user.last_name}"
-        shipping_address = (
-            f"{shipping['phone']}\n"
-            f"{shipping['shipping_address1']}\n"
-            f"{shipping['shipping_address2']}\n"
-            f"{shipping['city']}\n"
-            f"{shipping['state']}\n"
-            f"{shipping['zipcode']}\n"
-            f"{shipping['country']}"
-        )
-
-        # Create order with Pending payment
-        order = Order.objects.create(
-            user=user,
-            full_name=full_name,
-            email=user.email,
-            amount_paid=order_total,
-            shipping_address=shipping_address,
-            payment_method='qr',
-            payment_status='Pending',
-            transaction_id=transaction_id if transaction_id else None
-        )
-
-        payment = Payment.objects.create(
-            user=user,
-            order=order,
-            status='pending',
-            amount=order_total,
-            payment_method='qr',
-            transaction_id=transaction_id if transaction_id else ''
-        )
-
-        if payment_proof:
-            payment.payment_proof = payment_proof
-            payment.save()
-
-        # Save order items and update stock (commission deferred)
-        for item in cart_items:
-            product = item.product
-            quantity = cart_quantities.get(str(product.id), item.quantity)
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                user=user,
-                quantity=quantity,
-                price=item.price
+        # Order stays Pending; commission is distributed once the admin confirms
+        try:
+            place_order(
+                user,
+                cart_lines(cart_instance),
+                payment_method='qr',
+                shipping_address=format_shipping_address(shipping),
+                transaction_id=transaction_id,
+                payment_proof=payment_proof,
+                cart=cart_instance,
             )
-            product.stock_quantity -= quantity
-            product.save()
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('payment')
 
-        # Clear cart
-        cart_instance.items.all().delete()
-        cart_instance.delete()
-        Profile.objects.filter(user=user).update(old_cart="")
         request.session.pop('payment_method', None)
-
         messages.success(request, 'Payment proof submitted. Your order is pending verification.')
         return redirect('order_success')
 
@@ -266,8 +156,8 @@ def payment_execute(request):
 
 
 # utils or views
-from cart.models import Order, OrderItem
-from mlmtree.utils import distribute_commission
+from cart.models import Order
+from mlmtree.utils import distribute_order_commission
 
 def confirm_qr_payment(order: Order):
     """Call this after admin verifies QR payment"""
@@ -284,10 +174,7 @@ def confirm_qr_payment(order: Order):
         payment.status = 'captured'
         payment.save()
 
-    order_items = OrderItem.objects.filter(order=order)
-    for item in order_items:
-        for _ in range(item.quantity):
-            distribute_commission(order.user, item.product)
+    distribute_order_commission(order)
 
     print(f"✅ Commissions distributed for order {order.id}")
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Category, Product, ProductImage, WebBanner, MobileBanner
+from .models import Category, Product, ProductImage, WebBanner, MobileBanner, ImageTask, MediaBlob, CatalogChange
 
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
@@ -33,3 +33,24 @@ admin.site.register(MobileBanner)
 
 
 
+
+
+@admin.register(ImageTask)
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'model_label', 'object_id', 'field_name', 'status', 'attempts', 'updated_at')
+    list_filter = ('status', 'model_label')
+    readonly_fields = [field.name for field in ImageTask._meta.fields]
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'size', 'refcount', 'created_at')
+    search_fields = ('digest', 'name')
+    readonly_fields = [field.name for field in MediaBlob._meta.fields]
+
+
+@admin.register(CatalogChange)
+class CatalogChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'object_id', 'action', 'created_at')
+    list_filter = ('kind', 'action')
+    readonly_fields = [field.name for field in CatalogChange._meta.fields]
@@ -0,0 +1,9 @@
+from django.conf import settings
+from .utils import get_catalog_version
+
+def catalog_version(request):
+    # Part of every catalog fragment cache key ({% cache ... catalog_version %})
+    return {
+        'catalog_version': get_catalog_version(),
+        'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT,
+    }
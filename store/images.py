@@ -0,0 +1,389 @@
+"""
+Out-of-request image pipeline.
+
+Model saves only call enqueue_image(), which records an ImageTask for the
+file currently in the field. `manage.py process_images` claims pending
+tasks, runs resize_image_bytes() in a process pool and writes the result
+back to storage and to the row with an UPDATE - no save(), so nothing is
+re-enqueued. A file that was already processed (or queued) is never queued
+again, so re-saving a product is free.
+
+Models with an `image_variants` field (Product, ProductImage) also get
+thumb/card/full renditions in WebP (and AVIF when Pillow can write it) plus a
+JPEG/PNG fallback, stored next to the image as `<name>.<variant>.<ext>` and
+listed in that field; the `responsive_image` template tag turns them into a
+<picture> with srcset.
+
+With the content-addressed media storage an upload that matches a file some
+other row already had processed is pointed straight at that result (and its
+variants) instead of being queued again.
+
+The Pillow functions have no Django imports at module level, so pool
+workers can run them without setting Django up.
+"""
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+MAX_IMAGE_SIZE = 1125
+IMAGE_QUALITY = 70
+MAX_ATTEMPTS = 3
+STALE_AFTER_MINUTES = 30
+OUTPUT_FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'AVIF': '.avif'}
+VARIANT_WIDTHS = {'thumb': 160, 'card': 480, 'full': MAX_IMAGE_SIZE}
+MIME_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'AVIF': 'image/avif'}
+
+
+def modern_formats():
+    """Formats worth a <source>, best first; AVIF only if this Pillow can encode it."""
+    Image.init()
+    return [image_format for image_format in ('AVIF', 'WEBP') if image_format in Image.SAVE]
+
+
+def resize_image_bytes(data):
+    """
+    Applies the EXIF orientation, caps the image at MAX_IMAGE_SIZE and
+    re-encodes it without metadata (the ICC profile is kept for colour).
+    Returns (bytes, format).
+    """
+    with Image.open(BytesIO(data)) as original:
+        image_format = original.format if original.format in OUTPUT_FORMATS else 'JPEG'
+        icc_profile = original.info.get('icc_profile')
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        options = {'optimize': True}
+        if image_format in ('JPEG', 'WEBP'):
+            options['quality'] = IMAGE_QUALITY
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+
+        output = BytesIO()
+        image.save(output, format=image_format, **options)
+    return output.getvalue(), image_format
+
+
+def build_variants(data):
+    """
+    Returns [(variant, width, height, format, bytes)] for every size in
+    VARIANT_WIDTHS, in the modern formats plus a JPEG (PNG if transparent) fallback.
+    """
+    variants = []
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        fallback = 'PNG' if has_alpha else 'JPEG'
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        for variant, width in VARIANT_WIDTHS.items():
+            resized = image.copy()
+            resized.thumbnail((width, MAX_IMAGE_SIZE * 4))
+            for image_format in modern_formats() + [fallback]:
+                output = BytesIO()
+                options = {} if image_format == 'PNG' else {'quality': IMAGE_QUALITY}
+                resized.save(output, format=image_format, **options)
+                variants.append((variant, resized.width, resized.height, image_format, output.getvalue()))
+    return variants
+
+
+def process_image_bytes(data, with_variants=False):
+    """Pool job: the resized image, plus its variants when asked for."""
+    output, image_format = resize_image_bytes(data)
+    return output, image_format, build_variants(output) if with_variants else []
+
+
+def save_variants(storage, name, variants):
+    """
+    Writes build_variants() output next to `name` under deterministic names
+    and returns the image_variants document for it. Existing files are kept,
+    so re-running is cheap.
+
+    A content-addressed storage files them by digest instead: a rendition
+    that is already stored (for this row or any other) is found through its
+    MediaBlob and not written again, and the document takes a reference to it.
+    """
+    from django.core.files.base import ContentFile
+
+    base, _ = os.path.splitext(name)
+    document = {'source': name, 'variants': {}}
+    for variant, width, height, image_format, data in variants:
+        variant_name = f"{base}.{variant}{OUTPUT_FORMATS[image_format]}"
+        if getattr(storage, 'content_addressed', False) or not storage.exists(variant_name):
+            saved_name = storage.save(variant_name, ContentFile(data))
+        else:
+            saved_name = variant_name
+        entry = document['variants'].setdefault(variant, {'width': width, 'height': height, 'files': {}})
+        entry['files'][image_format] = saved_name
+    return document
+
+
+def delete_variants(storage, document):
+    for entry in (document or {}).get('variants', {}).values():
+        for name in entry['files'].values():
+            storage.delete(name)
+
+
+def current_variants(instance, field_name):
+    """The image_variants document if it still describes the field's current file."""
+    document = getattr(instance, 'image_variants', None) or {}
+    file = getattr(instance, field_name)
+    if file and document.get('source') == file.name:
+        return document['variants']
+    return {}
+
+
+def variant_url(instance, field_name, size):
+    """URL of the fallback-format `size` variant, or the original image's URL."""
+    variants = current_variants(instance, field_name)
+    if size in variants:
+        files = variants[size]['files']
+        name = files.get('JPEG') or files.get('PNG')
+        return getattr(instance, field_name).storage.url(name)
+    try:
+        return getattr(instance, field_name).url
+    except ValueError:
+        return ''
+
+
+def release_image(instance, field_name):
+    """
+    Drops a deleted row's references to its image and variants once the
+    transaction commits; shared files stay until their last reference goes.
+    """
+    from django.db import transaction
+
+    file = getattr(instance, field_name)
+    storage = file.storage
+    if not file or not getattr(storage, 'content_addressed', False):
+        return
+    names = [file.name]
+    for entry in (getattr(instance, 'image_variants', None) or {}).get('variants', {}).values():
+        names += entry['files'].values()
+
+    def release():
+        for name in names:
+            storage.release(name)
+    transaction.on_commit(release)
+
+
+def release_replaced_image(instance, field_name, old_name):
+    """
+    Drops the row's reference to the image a new upload replaced, once the
+    transaction commits. Its variants are released when the pipeline swaps
+    in the new image's.
+    """
+    from django.db import transaction
+
+    storage = getattr(instance, field_name).storage
+    if not old_name or not getattr(storage, 'content_addressed', False):
+        return
+    transaction.on_commit(lambda: storage.release(old_name))
+
+
+def enqueue_image(instance, field_name):
+    """Queues the image in `instance.<field_name>` unless it's empty, the field default or already known."""
+    from django.db.models import Q
+    from store.models import ImageTask
+
+    file = getattr(instance, field_name)
+    if not file or not file.name or file.name == instance._meta.get_field(field_name).default:
+        return
+    label = instance._meta.label_lower
+    known = ImageTask.objects.filter(
+        model_label=label, object_id=instance.pk, field_name=field_name,
+    ).filter(Q(source_name=file.name) | Q(result_name=file.name))
+    if known.exists() or _reuse_processed(instance, field_name):
+        return
+    ImageTask.objects.bulk_create(
+        [ImageTask(model_label=label, object_id=instance.pk, field_name=field_name, source_name=file.name)],
+        ignore_conflicts=True,
+    )
+
+
+def _reuse_processed(instance, field_name):
+    """
+    Content-addressed storage gives identical uploads the same name, so if
+    this file was already processed for another row, take over that result
+    and its variants (adding a reference to each) rather than resizing again.
+    """
+    from django.db import transaction
+    from django.db.models import Q
+    from store.models import ImageTask
+    from store.utils import log_catalog_changes
+
+    file = getattr(instance, field_name)
+    storage = file.storage
+    if not getattr(storage, 'content_addressed', False):
+        return False
+    model = type(instance)
+    label = instance._meta.label_lower
+    result = (
+        ImageTask.objects.filter(model_label=label, field_name=field_name, status='done')
+        .filter(Q(source_name=file.name) | Q(result_name=file.name))
+        .exclude(result_name='')
+        .values_list('result_name', flat=True).first()
+    )
+    if not result:
+        return False
+
+    changes = {field_name: result}
+    names = [result]
+    if _has_variants(model):
+        document = (
+            model.objects.filter(**{field_name: result}).exclude(pk=instance.pk)
+            .values_list('image_variants', flat=True).first()
+        )
+        if not document or document.get('source') != result:
+            return False
+        changes['image_variants'] = document
+        names += [name for entry in document['variants'].values() for name in entry['files'].values()]
+
+    retained = []
+    for name in names:
+        if not storage.retain(name):
+            break
+        retained.append(name)
+    updated = False
+    if len(retained) == len(names):
+        with transaction.atomic():
+            updated = model.objects.filter(pk=instance.pk, **{field_name: file.name}).update(**touched(model, changes))
+            if updated:
+                log_catalog_changes(model, [instance.pk])
+    if not updated:
+        for name in retained:
+            storage.release(name)
+        return False
+
+    # The row's reference moves from the upload to the processed file
+    storage.release(file.name)
+    ImageTask.objects.bulk_create(
+        [ImageTask(model_label=label, object_id=instance.pk, field_name=field_name,
+                   source_name=file.name, result_name=result, status='done')],
+        ignore_conflicts=True,
+    )
+    file.name = result
+    if 'image_variants' in changes:
+        instance.image_variants = changes['image_variants']
+    return True
+
+
+def claim_tasks(limit, exclude=()):
+    """Marks up to `limit` pending tasks (other than the `exclude` ids) as processing and returns them."""
+    from datetime import timedelta
+    from django.db import connection, transaction
+    from django.db.models import F
+    from django.utils import timezone
+    from store.models import ImageTask
+
+    # Tasks left in processing by a crashed worker go back in the queue
+    ImageTask.objects.filter(
+        status='processing', updated_at__lt=timezone.now() - timedelta(minutes=STALE_AFTER_MINUTES),
+    ).update(status='pending')
+
+    with transaction.atomic():
+        pending = ImageTask.objects.filter(status='pending').exclude(pk__in=exclude).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        task_ids = list(pending.values_list('pk', flat=True)[:limit])
+        ImageTask.objects.filter(pk__in=task_ids).update(
+            status='processing', attempts=F('attempts') + 1, updated_at=timezone.now(),
+        )
+    return list(ImageTask.objects.filter(pk__in=task_ids).order_by('id'))
+
+
+def process_tasks(tasks, executor=None):
+    """
+    Resizes claimed tasks (in `executor` when given, inline otherwise) and
+    writes the results back. Returns the number of images written.
+    """
+    from django.apps import apps
+    from django.core.files.base import ContentFile
+    from django.db import transaction
+    from store.utils import bump_catalog_version, log_catalog_changes
+
+    jobs = []
+    for task in tasks:
+        model = apps.get_model(task.model_label)
+        storage = model._meta.get_field(task.field_name).storage
+        with_variants = _has_variants(model)
+        current = model.objects.filter(pk=task.object_id).values_list(task.field_name, flat=True).first()
+        if current != task.source_name:
+            _finish(task, 'done', error='Superseded: the row or its image changed.')
+            continue
+        try:
+            with storage.open(task.source_name, 'rb') as source:
+                data = source.read()
+        except Exception as e:
+            _fail(task, e)
+            continue
+        if executor:
+            result = executor.submit(process_image_bytes, data, with_variants)
+        else:
+            result = data
+        jobs.append((task, model, storage, with_variants, result))
+
+    written = 0
+    for task, model, storage, with_variants, result in jobs:
+        try:
+            if executor:
+                output, image_format, variants = result.result()
+            else:
+                output, image_format, variants = process_image_bytes(result, with_variants)
+            base, _ = os.path.splitext(task.source_name)
+            name = storage.save(base + OUTPUT_FORMATS[image_format], ContentFile(output))
+            changes = {task.field_name: name}
+            if with_variants:
+                changes['image_variants'] = save_variants(storage, name, variants)
+        except Exception as e:
+            _fail(task, e)
+            continue
+
+        # Only swap the file in if nobody replaced it while we worked
+        row = model.objects.filter(pk=task.object_id, **{task.field_name: task.source_name})
+        old_variants = row.values_list('image_variants', flat=True).first() if with_variants else None
+        with transaction.atomic():
+            updated = row.update(**touched(model, changes))
+            if updated:
+                log_catalog_changes(model, [task.object_id])
+        if updated:
+            # A content-addressed storage counted a reference for `name` even when it is the source
+            if name != task.source_name or getattr(storage, 'content_addressed', False):
+                storage.delete(task.source_name)
+            delete_variants(storage, old_variants)
+            _finish(task, 'done', result_name=name)
+            written += 1
+        else:
+            storage.delete(name)
+            delete_variants(storage, changes.get('image_variants'))
+            _finish(task, 'done', error='Superseded: the row or its image changed.')
+
+    if written:
+        bump_catalog_version()
+    return written
+
+
+def _has_variants(model):
+    return any(field.name == 'image_variants' for field in model._meta.get_fields())
+
+
+def touched(model, changes):
+    """`changes` plus updated_at for models that have one (.update() skips auto_now)."""
+    from django.utils import timezone
+
+    if any(field.name == 'updated_at' for field in model._meta.get_fields()):
+        return {**changes, 'updated_at': timezone.now()}
+    return changes
+
+
+def _finish(task, status, result_name='', error=''):
+    task.status = status
+    task.result_name = result_name
+    task.error = error
+    task.save(update_fields=['status', 'result_name', 'error', 'updated_at'])
+
+
+def _fail(task, error):
+    # Retried on the next run until MAX_ATTEMPTS
+    _finish(task, 'failed' if task.attempts >= MAX_ATTEMPTS else 'pending', error=str(error))
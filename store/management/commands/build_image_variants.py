@@ -0,0 +1,110 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.images import build_variants, delete_variants, save_variants, touched
+from store.models import Product, ProductImage
+from store.utils import bump_catalog_version, log_catalog_changes
+
+
+class Command(BaseCommand):
+    help = "Builds the thumb/card/full WebP/AVIF variants for product images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Pool size; 0 builds inline.")
+        parser.add_argument("--batch-size", type=int, default=200, help="Rows read from the database at a time.")
+
+    def handle(self, *args, **options):
+        executor = None
+        if options["workers"] > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn"),
+            )
+        # Keep a couple of images per worker in flight, not the whole catalog in memory
+        max_pending = max(options["workers"], 1) * 2
+        built = failed = 0
+        try:
+            for model in (Product, ProductImage):
+                pending = set()
+                for job in self._jobs(model, options["batch_size"]):
+                    if executor is None:
+                        ok = self._build_inline(model, job)
+                        built, failed = built + ok, failed + (not ok)
+                        continue
+                    future = executor.submit(build_variants, job[2])
+                    future.job = job
+                    pending.add(future)
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            ok = self._collect(model, future)
+                            built, failed = built + ok, failed + (not ok)
+                for future in pending:
+                    ok = self._collect(model, future)
+                    built, failed = built + ok, failed + (not ok)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if built:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} images ({failed} failed)."))
+
+    def _jobs(self, model, batch_size):
+        """(pk, name, bytes) for every row whose variants don't match its current image."""
+        field_name = model.IMAGE_FIELD
+        field = model._meta.get_field(field_name)
+        rows = model.objects.exclude(**{field_name: ""}).exclude(**{field_name: field.default or None})
+        last_pk = 0
+        while True:
+            batch = list(
+                rows.filter(pk__gt=last_pk).order_by("pk")
+                .values_list("pk", field_name, "image_variants")[:batch_size]
+            )
+            if not batch:
+                return
+            last_pk = batch[-1][0]
+            for pk, name, document in batch:
+                if not name or (document or {}).get("source") == name:
+                    continue
+                try:
+                    with field.storage.open(name, "rb") as source:
+                        yield pk, name, source.read()
+                except Exception as e:
+                    self.stderr.write(f"{model.__name__} {pk}: can't read {name}: {e}")
+
+    def _build_inline(self, model, job):
+        try:
+            variants = build_variants(job[2])
+        except Exception as e:
+            self.stderr.write(f"{model.__name__} {job[0]}: {job[1]}: {e}")
+            return False
+        return self._write(model, *job, variants)
+
+    def _collect(self, model, future):
+        try:
+            variants = future.result()
+        except Exception as e:
+            pk, name, _ = future.job
+            self.stderr.write(f"{model.__name__} {pk}: {name}: {e}")
+            return False
+        return self._write(model, *future.job, variants)
+
+    def _write(self, model, pk, name, data, variants):
+        storage = model._meta.get_field(model.IMAGE_FIELD).storage
+        document = save_variants(storage, name, variants)
+        # Skip rows whose image changed while we worked; the pipeline will cover those
+        row = model.objects.filter(pk=pk, **{model.IMAGE_FIELD: name})
+        old_document = row.values_list("image_variants", flat=True).first()
+        with transaction.atomic():
+            updated = row.update(**touched(model, {"image_variants": document}))
+            if updated:
+                log_catalog_changes(model, [pk])
+        if not updated:
+            delete_variants(storage, document)
+            return False
+        if old_document and old_document.get("source") != name:
+            delete_variants(storage, old_document)
+        return True
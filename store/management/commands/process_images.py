@@ -0,0 +1,50 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.images import claim_tasks, process_tasks
+from store.models import ImageTask
+
+
+class Command(BaseCommand):
+    help = "Processes queued product/category/banner images (resize, strip metadata) in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Pool size; 0 processes inline.")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--loop", action="store_true", help="Keep polling the queue instead of exiting when it is empty.")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds between polls with --loop.")
+        parser.add_argument("--retry-failed", action="store_true", help="Requeue failed tasks first.")
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            requeued = ImageTask.objects.filter(status="failed").update(status="pending", attempts=0)
+            self.stdout.write(f"Requeued {requeued} failed tasks.")
+
+        # Spawned workers only run Pillow: no Django setup, no inherited DB connections
+        executor = None
+        if options["workers"] > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn"),
+            )
+        total = 0
+        # A task that fails goes back to pending; it's retried on the next pass, not straight away
+        tried = set()
+        try:
+            while True:
+                tasks = claim_tasks(options["batch_size"], exclude=tried)
+                if tasks:
+                    tried.update(task.pk for task in tasks)
+                    total += process_tasks(tasks, executor)
+                    continue
+                if not options["loop"]:
+                    break
+                tried.clear()
+                time.sleep(options["sleep"])
+        finally:
+            if executor:
+                executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} images."))
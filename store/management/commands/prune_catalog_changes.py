@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import CatalogChange
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes catalog change log entries older than --days. Apps still holding a token "
+        "from before then get a 410 from /api/catalog/changes/ and fetch the full catalog again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+
+    def handle(self, *args, **options):
+        latest = CatalogChange.objects.order_by("-id").values_list("id", flat=True).first()
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        # The newest entry always stays, so the current token remains valid
+        deleted, _ = CatalogChange.objects.filter(created_at__lt=cutoff).exclude(pk=latest).delete()
+        self.stdout.write(f"Deleted {deleted} catalog change log entries.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Recomputes every product search document and refills the search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options["database"]):
+            count = rebuild_index(using=options["database"])
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {count} products."))
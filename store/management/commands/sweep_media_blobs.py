@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import MediaBlob
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes files in the content-addressed blob store that no MediaBlob row refers to "
+        "(written by a transaction that then rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--minutes", type=int, default=60,
+            help="Only files older than this, so blobs of transactions still in flight are left alone.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="List the orphans without deleting them.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not getattr(storage, "content_addressed", False):
+            self.stdout.write("The media storage isn't content-addressed; nothing to sweep.")
+            return
+
+        cutoff = timezone.now() - timedelta(minutes=options["minutes"])
+        swept = 0
+        for names in self._blob_batches(storage):
+            known = set(MediaBlob.objects.filter(name__in=names).values_list("name", flat=True))
+            for name in names:
+                if name in known or storage.get_modified_time(name) >= cutoff:
+                    continue
+                swept += 1
+                if options["dry_run"]:
+                    self.stdout.write(name)
+                else:
+                    storage.delete(name)
+
+        verb = "Found" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {swept} orphaned blobs.")
+
+    def _blob_batches(self, storage):
+        """File names under the blob prefix, one <aa>/ directory at a time."""
+        prefix = storage.blob_prefix
+        try:
+            directories, _ = storage.listdir(prefix)
+        except FileNotFoundError:
+            return  # nothing stored yet
+        for directory in sorted(directories):
+            _, files = storage.listdir(f"{prefix}/{directory}")
+            if files:
+                yield [f"{prefix}/{directory}/{name}" for name in sorted(files)]
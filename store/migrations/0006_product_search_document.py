@@ -0,0 +1,67 @@
+# Generated by Django 4.2.18 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+def build_search_documents(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    products = list(Product.objects.using(schema_editor.connection.alias).select_related('category'))
+    for product in products:
+        parts = [
+            product.name, product.key_words, product.brand, product.color, product.material,
+            product.category.name if product.category_id else None,
+            product.description,
+        ]
+        product.search_document = "\n".join(part for part in parts if part)
+    Product.objects.using(schema_editor.connection.alias).bulk_update(products, ['search_document'], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "ALTER TABLE store_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(search_document, '')), 'B')"
+            ") STORED"
+        )
+        schema_editor.execute(
+            "CREATE INDEX store_product_search_idx ON store_product USING gin (search_vector)"
+        )
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE store_product_fts USING fts5(name, search_document)"
+            )
+        except Exception:
+            return  # SQLite built without FTS5: search falls back to icontains
+        schema_editor.execute(
+            "INSERT INTO store_product_fts (rowid, name, search_document) "
+            "SELECT id, name, search_document FROM store_product"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS store_product_search_idx")
+        schema_editor.execute("ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_alter_product_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
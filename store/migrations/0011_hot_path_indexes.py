@@ -0,0 +1,25 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_media_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_listed', 'created_at', 'id'], name='store_product_listed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_listed', 'is_sale', 'created_at', 'id'], name='store_product_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_listed', 'is_featured', 'created_at', 'id'], name='store_product_featured_idx'),
+        ),
+    ]
@@ -1,17 +1,10 @@
 from datetime import timedelta
-from io import BytesIO
 from django.db import models
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from django.core.files.base import ContentFile
-from PIL import Image
 
-import os
-
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
+from .images import enqueue_image, variant_url
 
 
 class Category(models.Model):
@@ -20,6 +13,9 @@ class Category(models.Model):
     description = models.CharField(max_length=255, blank=True, null=True)
     image = models.ImageField(upload_to='uploads/categories/', blank=True, null=True)
     slug = models.SlugField(unique=True, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    CHANGE_KIND = 'category'
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -31,17 +27,7 @@ class Category(models.Model):
         if not self.slug and self.name:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
-        self.resize_image()
-
-    def resize_image(self):
-        if self.image:
-            self.image.seek(0)
-            img = Image.open(self.image)
-            if img.height > 1125 or img.width > 1125:
-                img.thumbnail((1125, 1125))
-                img_io = BytesIO()
-                img.save(img_io, format=img.format, quality=70, optimize=True)
-                self.image.save(self.image.name, ContentFile(img_io.getvalue()), save=False)
+        enqueue_image(self, 'image')
 
 
 class Product(models.Model):
@@ -64,6 +50,8 @@ class Product(models.Model):
     discount = models.DecimalField(default=0, max_digits=9, decimal_places=2, null=True, blank=True)
     percentage_discount = models.DecimalField(default=0, max_digits=5, decimal_places=0, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also set by the bulk .update()s that change a product (checkout stock, image pipeline)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     is_listed = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
     slug = models.SlugField(unique=True, blank=True, null=True)
@@ -74,10 +62,36 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', blank=True, null=True)
     color = models.CharField(max_length=255, blank=True)
     size = models.CharField(max_length=255, blank=True)
+    # Precomputed text for full-text search (see store/search.py)
+    search_document = models.TextField(blank=True, default='', editable=False)
+    # thumb/card/full renditions written by the image pipeline (store/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    IMAGE_FIELD = 'profile_image'
+    # Kind of entry in the catalog change log (CatalogChange below)
+    CHANGE_KIND = 'product'
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of listings (store/utils.py), and the
+            # listed / listed-on-sale / listed-featured slices of it
+            models.Index(fields=['created_at', 'id'], name='store_product_created_idx'),
+            models.Index(fields=['is_listed', 'created_at', 'id'], name='store_product_listed_idx'),
+            models.Index(fields=['is_listed', 'is_sale', 'created_at', 'id'], name='store_product_sale_idx'),
+            models.Index(fields=['is_listed', 'is_featured', 'created_at', 'id'], name='store_product_featured_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def build_search_document(self):
+        parts = [
+            self.name, self.key_words, self.brand, self.color, self.material,
+            self.category.name if self.category_id else None,
+            self.description,
+        ]
+        return "\n".join(part for part in parts if part)
+
     def clean(self):
         super().clean()
         if self.stock_quantity < 0:
@@ -103,28 +117,9 @@ class Product(models.Model):
                 counter += 1
             self.slug = slug
 
+        self.search_document = self.build_search_document()
         super().save(*args, **kwargs)
-        self.resize_image()
-
-   
-
-    def resize_image(self):
-        if self.profile_image:
-            img = Image.open(self.profile_image)
-
-            if img.height > 1125 or img.width > 1125:
-                img.thumbnail((1125, 1125))
-
-                img_io = BytesIO()
-                img.save(img_io, format=img.format, quality=70, optimize=True)
-
-                file_name = os.path.basename(self.profile_image.name)
-
-                self.profile_image.save(
-                    file_name,
-                    ContentFile(img_io.getvalue()),
-                    save=False   # 👈 IMPORTANT
-                )
+        enqueue_image(self, 'profile_image')
 
     @property
     def imageURL(self):
@@ -133,6 +128,9 @@ class Product(models.Model):
         except:
             return ''
 
+    def variant_url(self, size):
+        return variant_url(self, 'profile_image', size)
+
     @property
     def is_new(self):
         return (timezone.now() - self.created_at) <= timedelta(days=30)
@@ -145,6 +143,10 @@ class Product(models.Model):
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, default=None, on_delete=models.CASCADE, related_name='product_images')
     product_images = models.ImageField(upload_to='uploads/products', null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    IMAGE_FIELD = 'product_images'
+    CHANGE_KIND = 'image'
 
     class Meta:
         verbose_name_plural = 'Product Images'
@@ -154,28 +156,7 @@ class ProductImage(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        self.resize_image()
-
-
-
-    def resize_image(self):
-        if self.product_images and hasattr(self.product_images, 'path'):
-            img = Image.open(self.product_images.path)
-
-            if img.height > 1125 or img.width > 1125:
-                img.thumbnail((1125, 1125))
-
-                img_io = BytesIO()
-
-                # Always save as JPEG for safety
-                img.save(img_io, format='JPEG', quality=70)
-
-                new_image = ContentFile(
-                    img_io.getvalue(),
-                    name=self.product_images.name
-                )
-
-                self.product_images.save(self.product_images.name, new_image, save=False)
+        enqueue_image(self, 'product_images')
 
 
     @property
@@ -185,6 +166,9 @@ class ProductImage(models.Model):
         except:
             return ''
 
+    def variant_url(self, size):
+        return variant_url(self, 'product_images', size)
+
 
 class WebBanner(models.Model):
     image = models.ImageField(upload_to='uploads/banners/', verbose_name="Image")
@@ -194,17 +178,7 @@ class WebBanner(models.Model):
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        self.resize_image()
-
-    def resize_image(self):
-        if self.image:
-            self.image.seek(0)
-            img = Image.open(self.image)
-            if img.height > 1125 or img.width > 1125:
-                img.thumbnail((1125, 1125))
-                img_io = BytesIO()
-                img.save(img_io, format=img.format, quality=70, optimize=True)
-                self.image.save(self.image.name, ContentFile(img_io.getvalue()), save=False)
+        enqueue_image(self, 'image')
 
     @property
     def imageURL(self):
@@ -218,21 +192,14 @@ class MobileBanner(models.Model):
     image = models.ImageField(upload_to='uploads/banners/', verbose_name="Image")
     caption = models.CharField(max_length=255, blank=True, null=True, verbose_name="Caption")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    updated_at = models.DateTimeField(auto_now=True)
     in_use = models.BooleanField(default=False)
 
+    CHANGE_KIND = 'banner'
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        self.resize_image()
-
-    def resize_image(self):
-        if self.image:
-            self.image.seek(0)
-            img = Image.open(self.image)
-            if img.height > 1125 or img.width > 1125:
-                img.thumbnail((1125, 1125))
-                img_io = BytesIO()
-                img.save(img_io, format=img.format, quality=70, optimize=True)
-                self.image.save(self.image.name, ContentFile(img_io.getvalue()), save=False)
+        enqueue_image(self, 'image')
 
     @property
     def imageURL(self):
@@ -240,3 +207,89 @@ class MobileBanner(models.Model):
             return self.image.url
         except:
             return ''
+
+
+class CatalogChange(models.Model):
+    """
+    One entry in the catalog change log that /api/catalog/changes/ serves.
+    The id doubles as the sync token: a client that has applied every entry
+    up to N asks for the ones after it. Written by store/signals.py and by
+    the bulk updates that bypass save() (see store.utils.log_catalog_changes).
+    """
+    KIND_CHOICES = (
+        ('product', 'Product'),
+        ('category', 'Category'),
+        ('image', 'Product image'),
+        ('banner', 'Mobile banner'),
+    )
+    ACTION_CHOICES = (
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('delisted', 'Delisted'),
+        ('deleted', 'Deleted'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.object_id} {self.action}"
+
+
+class ImageTask(models.Model):
+    """
+    One queued resize of an uploaded image (see store/images.py).
+    Unique per file, so re-saving a model doesn't queue the same image twice.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    model_label = models.CharField(max_length=100)  # e.g. "store.product"
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=100)
+    source_name = models.CharField(max_length=255)
+    result_name = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['model_label', 'object_id', 'field_name', 'source_name'],
+                name='store_imagetask_unique_source',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='store_imagetask_status_idx'),
+            # enqueue_image() looks up earlier results for the same (deduplicated) file
+            models.Index(fields=['source_name'], name='store_imagetask_source_idx'),
+            models.Index(fields=['result_name'], name='store_imagetask_result_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label}#{self.object_id}.{self.field_name} ({self.status})"
+
+
+class MediaBlob(models.Model):
+    """
+    One stored media file per distinct content (sha256), shared by every
+    field that uploaded it. See ecommerce/storage_backends.py.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
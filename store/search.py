@@ -0,0 +1,123 @@
+"""
+Full-text product search over Product.search_document.
+
+- Postgres: a generated, weighted `search_vector` tsvector column with a GIN
+  index, queried with websearch_to_tsquery and ranked with ts_rank
+- SQLite: an FTS5 table (`store_product_fts`, rowid = product id) kept in sync
+  from store/signals.py and ranked with bm25
+- anything else: the old icontains filters, unranked
+
+The column, index and FTS table are created by migration 0006.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'store_product_fts'
+# bm25 column weights: name, search_document
+FTS_WEIGHTS = (10.0, 1.0)
+
+
+def _fts_query(query):
+    """Quotes every word (FTS5 syntax can't leak in) and prefix-matches them all."""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _has_fts_table(connection):
+    # Looked up once per connection; missing if SQLite was built without FTS5
+    if not hasattr(connection, '_store_fts_table'):
+        connection._store_fts_table = FTS_TABLE in connection.introspection.table_names()
+    return connection._store_fts_table
+
+
+def search_products(query, queryset=None):
+    """
+    Filters `queryset` (default: listed products) down to matches for `query`,
+    annotated with `rank` (higher is better) and ordered best first.
+    """
+    from store.models import Product
+
+    if queryset is None:
+        queryset = Product.objects.filter(is_listed=True)
+    query = (query or '').strip()
+    if not query:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+    table = Product._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        ts_query = "websearch_to_tsquery('english', %s)"
+        return queryset.filter(
+            RawSQL(f'"{table}"."search_vector" @@ {ts_query}', [query], output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'ts_rank("{table}"."search_vector", {ts_query})', [query], output_field=FloatField())
+        ).order_by('-rank', 'pk')
+
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        match = _fts_query(query)
+        if not match:
+            return queryset.none()
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.filter(
+            RawSQL(
+                f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+                [match], output_field=BooleanField(),
+            )
+        ).annotate(
+            rank=RawSQL(
+                f'(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+                [match], output_field=FloatField(),
+            )
+        ).order_by('-rank', 'pk')
+
+    return queryset.filter(
+        Q(name__icontains=query) |
+        Q(key_words__icontains=query) |
+        Q(description__icontains=query) |
+        Q(category__name__icontains=query)
+    ).annotate(rank=Value(0.0, output_field=FloatField())).order_by('pk')
+
+
+def index_products(products, using='default'):
+    """Writes products' current name/search_document into the SQLite FTS table."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not _has_fts_table(connection):
+        return  # Postgres keeps its generated column up to date itself
+    rows = [(product.pk, product.name, product.search_document) for product in products]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, search_document) VALUES (%s, %s, %s)', rows
+        )
+
+
+def unindex_products(product_ids, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not _has_fts_table(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(using='default'):
+    """Recomputes every search_document and refills the FTS table. Returns the product count."""
+    from store.models import Product
+
+    products = list(Product.objects.using(using).select_related('category'))
+    for product in products:
+        product.search_document = product.build_search_document()
+    Product.objects.using(using).bulk_update(products, ['search_document'], batch_size=500)
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        index_products(products, using=using)
+    return len(products)
@@ -0,0 +1,110 @@
+# store/signals.py
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .images import release_image, release_replaced_image
+from .models import Category, MobileBanner, Product, ProductImage, WebBanner
+from .search import index_products, unindex_products
+from .utils import bump_catalog_version, log_catalog_changes
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    index_products([instance], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    unindex_products([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+def release_product_images(sender, instance, **kwargs):
+    release_image(instance, sender.IMAGE_FIELD)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, using, **kwargs):
+    # The category name is part of each product's search document
+    if created:
+        return
+    products = list(instance.products.using(using).all())
+    for product in products:
+        product.category = instance
+        product.search_document = product.build_search_document()
+    Product.objects.using(using).bulk_update(products, ['search_document'])
+    index_products(products, using=using)
+    # ...and of each product card in the catalog sync feed
+    log_catalog_changes(Product, [product.pk for product in products])
+
+
+# A row holds one blob reference for its image and a new upload takes
+# another, so the replaced image's goes
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def note_replaced_image(sender, instance, **kwargs):
+    file = getattr(instance, sender.IMAGE_FIELD)
+    instance._replaced_image_name = None
+    if instance.pk and file and not file._committed:
+        # Read from the row: the image pipeline swaps names in with update()
+        instance._replaced_image_name = (
+            sender.objects.filter(pk=instance.pk).values_list(sender.IMAGE_FIELD, flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def release_replaced_images(sender, instance, created, **kwargs):
+    if not created:
+        release_replaced_image(instance, sender.IMAGE_FIELD, getattr(instance, '_replaced_image_name', None))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=WebBanner)
+@receiver(post_delete, sender=WebBanner)
+@receiver(post_save, sender=MobileBanner)
+@receiver(post_delete, sender=MobileBanner)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_product(sender, instance, using, **kwargs):
+    # A product's images are part of it as far as Last-Modified goes
+    if instance.product_id:
+        Product.objects.using(using).filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+# Flags that hide a row from the apps without deleting it
+LISTED_FIELDS = {Product: 'is_listed', MobileBanner: 'in_use'}
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=MobileBanner)
+def log_catalog_save(sender, instance, created, **kwargs):
+    field = LISTED_FIELDS.get(sender)
+    if created:
+        action = 'created'
+    elif field and not getattr(instance, field):
+        action = 'delisted'
+    else:
+        action = 'updated'
+    log_catalog_changes(sender, [instance.pk], action)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=MobileBanner)
+def log_catalog_delete(sender, instance, **kwargs):
+    log_catalog_changes(sender, [instance.pk], 'deleted')
@@ -0,0 +1,60 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from store.images import MIME_TYPES, current_variants, modern_formats
+
+register = template.Library()
+
+# What each variant is laid out at, for the `sizes` attribute
+DEFAULT_SIZES = {
+    'thumb': '80px',
+    'card': '(max-width: 600px) 50vw, 300px',
+    'full': '(max-width: 1125px) 100vw, 1125px',
+}
+
+
+@register.simple_tag
+def responsive_image(obj, size='card', alt='', sizes=None, **attrs):
+    """
+    Renders obj's image (Product, ProductImage) as a <picture> with AVIF/WebP
+    sources and a srcset over the thumb/card/full variants. Falls back to a
+    plain <img> of the original until the image pipeline has made variants.
+
+        {% responsive_image product 'card' alt=product.name width='100%' %}
+    """
+    field_name = obj.IMAGE_FIELD
+    variants = current_variants(obj, field_name)
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    if size not in variants:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', obj.imageURL, alt, extra)
+
+    storage = getattr(obj, field_name).storage
+    sizes = sizes or DEFAULT_SIZES.get(size, '100vw')
+
+    def srcset(image_format):
+        return ', '.join(
+            f"{storage.url(entry['files'][image_format])} {entry['width']}w"
+            for entry in variants.values()
+            if image_format in entry['files']
+        )
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[image_format], srcset(image_format), sizes)
+         for image_format in modern_formats() if image_format in variants[size]['files']),
+    )
+    chosen = variants[size]
+    fallback = 'JPEG' if 'JPEG' in chosen['files'] else 'PNG'
+    if 'width' not in attrs and 'height' not in attrs:
+        # Intrinsic size lets the browser reserve the space before loading
+        extra = format_html(' width="{}" height="{}"{}', chosen['width'], chosen['height'], extra)
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"{}></picture>',
+        sources, storage.url(chosen['files'][fallback]), srcset(fallback), sizes, alt, extra,
+    )
+
+
+@register.filter
+def variant_url(obj, size):
+    """{{ product|variant_url:'thumb' }} - a single variant's URL, for plain <img> tags."""
+    return obj.variant_url(size)
@@ -1,3 +1,557 @@
-from django.test import TestCase
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+
+from ecommerce.testing import QueryBudgetMixin, TempMediaMixin
+from store.images import (
+    MAX_ATTEMPTS, MAX_IMAGE_SIZE, VARIANT_WIDTHS, build_variants, delete_variants, enqueue_image, modern_formats,
+    save_variants,
+)
+from store.models import Category, ImageTask, MediaBlob, Product
+from store.search import _has_fts_table, search_products
+from store.templatetags.store_images import responsive_image
+from store.utils import decode_cursor, encode_cursor, get_catalog_version, paginate_products
+from users.models import CustomUser
+
+
+class StorefrontQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Cold-cache query budgets for the storefront pages. Thirty products over
+    two categories, so anything done per product shows up as repeated queries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [Category.objects.create(name=f"Category {i}") for i in range(2)]
+        for i in range(30):
+            Product.objects.create(
+                name=f"Product {i}", price=Decimal("10.00"), sale_price=Decimal("8.00"),
+                category=cls.categories[i % 2], stock_quantity=5,
+                is_sale=i % 3 == 0, is_featured=i % 4 == 0,
+            )
+        cls.product = Product.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_pages(self):
+        for url in ("/products/", "/sale/", "/new/", "/featured/", "/categories/", "/"):
+            with self.subTest(url=url):
+                self.assertQueryBudget(url, 6, max_duplicates=0)
+
+    def test_category_page(self):
+        self.assertQueryBudget(f"/category/{self.categories[0].slug}/", 6, max_duplicates=0)
+
+    def test_product_page(self):
+        self.assertQueryBudget(f"/product/{self.product.slug}", 6, max_duplicates=0)
+
+    def test_search(self):
+        self.assertQueryBudget("/search/", 6, max_duplicates=0, data={"query": "product"})
+
+    def test_products_signed_in(self):
+        user = CustomUser.objects.create_user("shopper@example.com", "pw")
+        self.client.force_login(user)
+        self.assertQueryBudget("/products/", 6, max_duplicates=0)
+
+    def test_warm_cache_products(self):
+        self.client.get("/products/")
+        self.assertQueryBudget("/products/", 2)
+
+    @override_settings(REQUEST_INSTRUMENTATION_HEADERS=True)
+    def test_instrumentation_headers(self):
+        response = self.client.get("/products/")
+        self.assertIn("X-DB-Queries", response)
+        self.assertIn("Server-Timing", response)
+
+
+class ProductSearchTests(TestCase):
+    """search_products on the SQLite FTS5 index, kept in step by store.signals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Footwear")
+        cls.runner = Product.objects.create(
+            name="Trail Runner", price=Decimal("50.00"), category=cls.category, stock_quantity=5,
+            description="Grippy sole",
+        )
+        cls.sock = Product.objects.create(
+            name="Wool Sock", price=Decimal("5.00"), category=cls.category, stock_quantity=5,
+            description="Goes well with a runner",
+        )
+        cls.mug = Product.objects.create(name="Coffee Mug", price=Decimal("8.00"), stock_quantity=5)
+
+    def setUp(self):
+        if connection.vendor != "sqlite" or not _has_fts_table(connection):
+            self.skipTest("needs SQLite with FTS5")
+
+    def search(self, query):
+        return list(search_products(query).values_list("pk", flat=True))
+
+    def test_matches(self):
+        self.assertEqual(self.search("mug"), [self.mug.pk])
+        self.assertEqual(self.search("coff"), [self.mug.pk])  # prefix
+        self.assertEqual(set(self.search("footwear")), {self.runner.pk, self.sock.pk})  # category name
+        self.assertEqual(self.search("wool runner"), [self.sock.pk])  # every word must match
+        self.assertEqual(self.search("teapot"), [])
+        self.assertEqual(self.search("   "), [])
+        # FTS5 syntax is quoted away rather than parsed
+        self.assertEqual(self.search('"mug*) ^'), [self.mug.pk])
+        self.assertEqual(self.search("mug OR teapot"), [])
+
+    def test_ranked_by_name_first(self):
+        results = list(search_products("runner"))
+        self.assertEqual([product.pk for product in results], [self.runner.pk, self.sock.pk])
+        self.assertGreater(results[0].rank, results[1].rank)
+
+    def test_save_reindexes(self):
+        self.mug.name = "Tea Cup"
+        self.mug.save()
+        self.assertEqual(self.search("mug"), [])
+        self.assertEqual(self.search("cup"), [self.mug.pk])
+
+        self.category.name = "Shoes"
+        self.category.save()
+        self.assertEqual(self.search("footwear"), [])
+        self.assertEqual(set(self.search("shoes")), {self.runner.pk, self.sock.pk})
+
+    def test_delete_unindexes(self):
+        pk = self.mug.pk
+        self.mug.delete()
+        self.assertEqual(self.search("mug"), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM store_product_fts WHERE rowid = %s", [pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_search_page(self):
+        response = self.client.get("/search/", {"query": "runner"})
+        self.assertEqual([product.pk for product in response.context["products"]], [self.runner.pk, self.sock.pk])
+
+
+class KeysetPaginationTests(TestCase):
+    """paginate_products walks newest-first by (created_at, id) in both directions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            Product.objects.create(name=f"Product {i}", price=Decimal("10.00"), stock_quantity=5)
+        # Three share a timestamp, so only the id can order them
+        cls.tie = datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        pks = sorted(Product.objects.values_list("pk", flat=True))
+        Product.objects.filter(pk__in=pks[2:5]).update(created_at=cls.tie)
+        cls.expected = list(Product.objects.order_by("-created_at", "-pk").values_list("pk", flat=True))
+
+    def page(self, **params):
+        request = RequestFactory().get("/products/", params)
+        return paginate_products(request, Product.objects.all(), page_size=3)
+
+    def pks(self, page):
+        return [product.pk for product in page]
+
+    def test_forward_and_back(self):
+        first = self.page()
+        self.assertEqual(self.pks(first), self.expected[:3])
+        self.assertFalse(first.has_previous)
+
+        second = self.page(after=first.next_cursor)
+        self.assertEqual(self.pks(second), self.expected[3:6])
+        self.assertEqual(second.next_url, f"?after={second.next_cursor}")
+
+        last = self.page(after=second.next_cursor)
+        self.assertEqual(self.pks(last), self.expected[6:])
+        self.assertFalse(last.has_next)
+
+        # Back again from the last page, then from the middle one
+        back = self.page(before=last.previous_cursor)
+        self.assertEqual(self.pks(back), self.expected[3:6])
+        self.assertTrue(back.has_previous)
+        self.assertEqual(self.pks(self.page(before=back.previous_cursor)), self.expected[:3])
+        self.assertFalse(self.page(before=back.previous_cursor).has_previous)
+
+    def test_ties_broken_by_id(self):
+        tied = list(Product.objects.filter(created_at=self.tie).order_by("-pk").values_list("pk", flat=True))
+        seen = []
+        page = self.page()
+        while True:
+            seen += self.pks(page)
+            if not page.has_next:
+                break
+            page = self.page(after=page.next_cursor)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([pk for pk in seen if pk in tied], tied)
+
+        # A cursor on the middle of the tie continues with the rest of it
+        middle = Product.objects.get(pk=tied[1])
+        self.assertEqual(decode_cursor(encode_cursor(middle)), (self.tie, middle.pk))
+        self.assertEqual(self.pks(self.page(after=encode_cursor(middle)))[0], tied[2])
+
+    def test_invalid_cursors(self):
+        for cursor in ("", "garbage", "1-2-3", "12-x", "-1-5", f"{10**30}-1"):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                # Falls back to the first page rather than failing
+                self.assertEqual(self.pks(self.page(after=cursor)), self.expected[:3])
+                self.assertEqual(self.pks(self.page(before=cursor)), self.expected[:3])
+        self.assertIsNone(decode_cursor(None))
+
+
+class CatalogVersionTests(TestCase):
+    """Catalog changes bump the catalog version, which keys the cached pages and card fragments."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name="Trail Runner", price=Decimal("50.00"), stock_quantity=5)
+
+    def setUp(self):
+        cache.clear()
+
+    def card(self, product):
+        return render_to_string("store/include/product_card.html", {
+            "product": product,
+            "catalog_version": get_catalog_version(),
+            "catalog_cache_timeout": 900,
+        })
+
+    def test_save_bumps_on_commit(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = Decimal("45.00")
+            self.product.save()
+        self.assertEqual(get_catalog_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_card_fragment_busted(self):
+        self.assertIn("Trail Runner", self.card(self.product))
+
+        # Same version: the cached fragment is served, whatever the product says now
+        self.product.name = "Road Runner"
+        self.assertIn("Trail Runner", self.card(self.product))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        card = self.card(self.product)
+        self.assertIn("Road Runner", card)
+        self.assertNotIn("Trail Runner", card)
+
+    def test_listing_page_refreshed(self):
+        self.assertContains(self.client.get("/products/"), "Trail Runner")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Road Runner"
+            self.product.save()
+        response = self.client.get("/products/")
+        self.assertContains(response, "Road Runner")
+        self.assertNotContains(response, "Trail Runner")
+
+
+def image_upload(name="photo.jpg", size=(2250, 1000), color="red", image_format="JPEG"):
+    output = BytesIO()
+    Image.new("RGB", size, color).save(output, format=image_format)
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+class MediaTestCase(TempMediaMixin, TestCase):
+    def process_images(self):
+        call_command("process_images", workers=0, stdout=StringIO())
+
+
+class ImageQueueTests(MediaTestCase):
+    """enqueue_image and process_images: queueing, resizing, retries and skips."""
+
+    def make_product(self, upload):
+        return Product.objects.create(name="Runner", price=Decimal("10.00"), stock_quantity=5, profile_image=upload)
+
+    def test_processed(self):
+        product = self.make_product(image_upload())
+        task = ImageTask.objects.get()
+        self.assertEqual((task.status, task.source_name), ("pending", product.profile_image.name))
+
+        self.process_images()
+
+        task.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual(task.status, "done")
+        self.assertEqual(task.error, "")
+        self.assertEqual(task.attempts, 1)
+        self.assertEqual(product.profile_image.name, task.result_name)
+        with Image.open(product.profile_image.open("rb")) as image:
+            self.assertEqual(image.size, (MAX_IMAGE_SIZE, 500))
+
+    def test_failed_task_retried_then_given_up(self):
+        product = self.make_product(SimpleUploadedFile("broken.jpg", b"not an image"))
+        task = ImageTask.objects.get()
+
+        self.process_images()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("pending", 1))
+        self.assertIn("cannot identify image", task.error)
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            self.process_images()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("failed", MAX_ATTEMPTS))
+        self.assertTrue(task.error)
+        # The row keeps the upload it had
+        product.refresh_from_db()
+        self.assertEqual(product.profile_image.name, task.source_name)
+
+    def test_known_source_skipped(self):
+        product = self.make_product(image_upload())
+        # Saving again, or enqueueing by hand, doesn't queue the same file twice
+        product.save()
+        enqueue_image(product, "profile_image")
+        self.assertEqual(ImageTask.objects.count(), 1)
+
+        self.process_images()
+        product.refresh_from_db()
+        # ...nor does saving the processed result
+        product.save()
+        self.assertEqual(ImageTask.objects.count(), 1)
+
+    def test_default_image_not_queued(self):
+        Product.objects.create(name="Plain", price=Decimal("10.00"), stock_quantity=5)
+        self.assertFalse(ImageTask.objects.exists())
+
+
+class ImageVariantTests(MediaTestCase):
+    """thumb/card/full renditions: written, recorded in image_variants, used for URLs."""
+
+    def test_variants_written_and_recorded(self):
+        product = Product.objects.create(
+            name="Runner", price=Decimal("10.00"), stock_quantity=5, profile_image=image_upload(),
+        )
+        self.process_images()
+        product.refresh_from_db()
+
+        document = product.image_variants
+        self.assertEqual(document["source"], product.profile_image.name)
+        self.assertEqual(set(document["variants"]), set(VARIANT_WIDTHS))
+        storage = product.profile_image.storage
+        for variant, width in VARIANT_WIDTHS.items():
+            entry = document["variants"][variant]
+            self.assertEqual(entry["width"], width)
+            self.assertEqual(set(entry["files"]), set(modern_formats()) | {"JPEG"})
+            for image_format, name in entry["files"].items():
+                self.assertTrue(storage.exists(name), name)
+                with Image.open(storage.open(name, "rb")) as image:
+                    self.assertEqual((image.format, image.width), (image_format, width))
+
+        self.assertEqual(product.variant_url("thumb"), storage.url(document["variants"]["thumb"]["files"]["JPEG"]))
+        self.assertIn("<picture>", responsive_image(product, "card"))
+
+    def test_transparent_image_falls_back_to_png(self):
+        output = BytesIO()
+        Image.new("RGBA", (400, 400), (0, 0, 0, 0)).save(output, format="PNG")
+        product = Product.objects.create(
+            name="Logo", price=Decimal("10.00"), stock_quantity=5,
+            profile_image=SimpleUploadedFile("logo.png", output.getvalue()),
+        )
+        self.process_images()
+        product.refresh_from_db()
+        self.assertIn("PNG", product.image_variants["variants"]["thumb"]["files"])
+        self.assertNotIn("JPEG", product.image_variants["variants"]["thumb"]["files"])
+
+    def test_variant_url_falls_back_to_original(self):
+        product = Product.objects.create(
+            name="Runner", price=Decimal("10.00"), stock_quantity=5, profile_image=image_upload(),
+        )
+        # Not processed yet: no variants at all
+        self.assertEqual(product.variant_url("thumb"), product.profile_image.url)
+        self.assertTrue(responsive_image(product, "thumb").startswith("<img "))
+
+        self.process_images()
+        product.refresh_from_db()
+        # A size the document doesn't have
+        del product.image_variants["variants"]["thumb"]
+        self.assertEqual(product.variant_url("thumb"), product.profile_image.url)
+        # Variants made for a file the field no longer holds
+        product.image_variants["source"] = "uploads/products/other.jpg"
+        self.assertEqual(product.variant_url("card"), product.profile_image.url)
+        # No image at all
+        self.assertEqual(Product(name="Empty", profile_image=None).variant_url("card"), "")
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    """The blob store: one file per content, reference counted through MediaBlob."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = default_storage
+
+    def blob(self, name):
+        return MediaBlob.objects.get(name=name)
+
+    def test_dedup_and_refcount(self):
+        first = self.storage.save("uploads/a.png", ContentFile(b"same bytes"))
+        second = self.storage.save("uploads/b.PNG", ContentFile(b"same bytes"))
+        other = self.storage.save("uploads/c.png", ContentFile(b"other bytes"))
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("blobs/"))
+        self.assertNotEqual(first, other)
+        self.assertEqual(self.blob(first).refcount, 2)
+        self.assertEqual(self.blob(first).size, len(b"same bytes"))
+        self.assertEqual(MediaBlob.objects.count(), 2)
+
+        self.assertTrue(self.storage.retain(first))
+        self.assertEqual(self.blob(first).refcount, 3)
+        self.assertFalse(self.storage.retain("uploads/not-a-blob.png"))
+
+    def test_release(self):
+        name = self.storage.save("uploads/a.png", ContentFile(b"same bytes"))
+        self.storage.save("uploads/b.png", ContentFile(b"same bytes"))
+
+        self.storage.release(name)
+        self.assertEqual(self.blob(name).refcount, 1)
+        self.assertTrue(self.storage.exists(name))
+
+        # delete() is a release too; the last one removes the file
+        self.storage.delete(name)
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+        # Saving it again after that writes it afresh
+        again = self.storage.save("uploads/c.png", ContentFile(b"same bytes"))
+        self.assertEqual(self.blob(again).refcount, 1)
+        self.assertTrue(self.storage.exists(again))
+
+    def test_released_when_product_deleted(self):
+        product = Product.objects.create(
+            name="Runner", price=Decimal("10.00"), stock_quantity=5, profile_image=image_upload(),
+        )
+        self.process_images()
+        product.refresh_from_db()
+        copy = Product.objects.create(
+            name="Runner copy", price=Decimal("10.00"), stock_quantity=5, profile_image=image_upload(),
+        )
+        copy.refresh_from_db()
+        # The identical upload took over the first one's result and variants without being queued
+        self.assertFalse(ImageTask.objects.exclude(status="done").exists())
+        self.assertEqual(copy.profile_image.name, product.profile_image.name)
+        self.assertEqual(copy.image_variants, product.image_variants)
+        names = [product.profile_image.name] + [
+            name for entry in product.image_variants["variants"].values() for name in entry["files"].values()
+        ]
+        self.assertTrue(all(self.blob(name).refcount >= 2 for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertTrue(all(self.storage.exists(name) for name in names))
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.delete()
+        self.assertFalse(MediaBlob.objects.filter(name__in=names).exists())
+        self.assertFalse(any(self.storage.exists(name) for name in names))
+
+    def test_uploads_before_touching_the_row(self):
+        digest = hashlib.sha256(b"fresh bytes").hexdigest()
+        upload = self.storage._save
+
+        def checked_upload(name, content):
+            # Nothing is locked or created for the digest until the bytes are stored
+            self.assertFalse(MediaBlob.objects.filter(digest=digest).exists())
+            return upload(name, content)
+
+        with mock.patch.object(self.storage, "_save", side_effect=checked_upload) as saved:
+            name = self.storage.save("uploads/a.png", ContentFile(b"fresh bytes"))
+            self.assertEqual(self.storage.save("uploads/b.png", ContentFile(b"fresh bytes")), name)
+        self.assertEqual(saved.call_count, 1)
+        self.assertEqual(self.blob(name).refcount, 2)
+
+    def test_racing_upload_keeps_one_copy(self):
+        digest = hashlib.sha256(b"same bytes").hexdigest()
+        upload = self.storage._save
+
+        def racing_upload(name, content):
+            saved = upload(name, content)
+            # Another upload of the same content recorded its copy meanwhile
+            other = upload(name, ContentFile(b"same bytes"))
+            MediaBlob.objects.create(digest=digest, name=other, size=10, refcount=1)
+            racing_upload.copies = (saved, other)
+            return saved
+
+        with mock.patch.object(self.storage, "_save", side_effect=racing_upload):
+            name = self.storage.save("uploads/a.png", ContentFile(b"same bytes"))
+        saved, other = racing_upload.copies
+        self.assertEqual(name, other)
+        self.assertEqual(self.blob(name).refcount, 2)
+        self.assertTrue(self.storage.exists(other))
+        self.assertFalse(self.storage.exists(saved))
+
+    def test_replaced_image_released(self):
+        product = Product.objects.create(
+            name="Runner", price=Decimal("10.00"), stock_quantity=5, profile_image=image_upload(),
+        )
+        self.process_images()
+        product = Product.objects.get(pk=product.pk)
+        old = [product.profile_image.name] + [
+            name for entry in product.image_variants["variants"].values() for name in entry["files"].values()
+        ]
+
+        product.profile_image = image_upload(color="blue")
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertFalse(MediaBlob.objects.filter(name=old[0]).exists())
+        self.assertFalse(self.storage.exists(old[0]))
+        # The old variants go when the new image's are swapped in
+        self.process_images()
+        self.assertFalse(MediaBlob.objects.filter(name__in=old).exists())
+        product.refresh_from_db()
+        self.assertEqual(self.blob(product.profile_image.name).refcount, 1)
+
+        # Saving without a new upload keeps the image
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.blob(product.profile_image.name).refcount, 1)
+
+    def test_variants_found_by_digest(self):
+        variants = build_variants(image_upload().read())
+        document = save_variants(self.storage, "uploads/runner.jpg", variants)
+        names = [name for entry in document["variants"].values() for name in entry["files"].values()]
+        self.assertTrue(all(name.startswith("blobs/") for name in names))
+        written = {name: self.storage.get_modified_time(name) for name in names}
+
+        # A second document over the same renditions reuses every file and references it
+        self.assertEqual(save_variants(self.storage, "uploads/runner.jpg", variants), document)
+        self.assertEqual({name: self.storage.get_modified_time(name) for name in names}, written)
+        self.assertEqual({self.blob(name).refcount for name in names}, {2})
+
+        delete_variants(self.storage, document)
+        self.assertEqual({self.blob(name).refcount for name in names}, {1})
+
+    def test_rollback_orphan_swept(self):
+        try:
+            with transaction.atomic():
+                name = self.storage.save("uploads/a.png", ContentFile(b"rolled back"))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        kept = self.storage.save("uploads/b.png", ContentFile(b"committed"))
+        # The file outlived its MediaBlob row
+        self.assertTrue(self.storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+        out = StringIO()
+        call_command("sweep_media_blobs", stdout=out)
+        self.assertIn("Deleted 0", out.getvalue())  # too recent: could still be in flight
+
+        out = StringIO()
+        call_command("sweep_media_blobs", "--minutes=0", "--dry-run", stdout=out)
+        self.assertIn(name, out.getvalue())
+        self.assertTrue(self.storage.exists(name))
+
+        call_command("sweep_media_blobs", "--minutes=0", stdout=StringIO())
+        self.assertFalse(self.storage.exists(name))
+        self.assertTrue(self.storage.exists(kept))
@@ -0,0 +1,169 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+PRODUCT_PAGE_SIZE = 24
+HOME_SECTION_SIZE = 8
+CATALOG_VERSION_KEY = "catalog-version"
+# Postgres advisory lock key serialising catalog change log writers
+CATALOG_LOG_LOCK = 7_468_232_016
+
+
+def get_catalog_version():
+    # Seeded from the clock so an evicted counter never restarts at an old value
+    cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+    return cache.get(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Makes every cached catalog page and fragment stale once the transaction commits."""
+    def bump():
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            pass  # no version yet, so nothing cached either
+    transaction.on_commit(bump)
+
+
+def log_catalog_changes(model, ids, action='updated'):
+    """
+    Adds change log entries for `model` rows. Call it inside the transaction
+    that makes the change, so the entries commit or roll back with it.
+    Models without a CHANGE_KIND aren't part of the feed.
+    """
+    from store.models import CatalogChange
+
+    kind = getattr(model, 'CHANGE_KIND', None)
+    ids = sorted(set(ids))
+    if kind is None or not ids:
+        return
+    with transaction.atomic():
+        connection = transaction.get_connection()
+        if connection.vendor == 'postgresql':
+            # Entry ids (the sync tokens) are handed out on insert but show up
+            # on commit. Holding this lock until the transaction ends keeps the
+            # two in the same order, so a client never syncs past a change that
+            # is still in flight. SQLite serialises writers by itself.
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CATALOG_LOG_LOCK])
+        CatalogChange.objects.bulk_create(
+            [CatalogChange(kind=kind, object_id=pk, action=action) for pk in ids]
+        )
+
+
+def cached_catalog(key, compute):
+    """
+    Returns compute() cached under `key` for the current catalog version.
+    Only cache shared catalog data here - never per-user state.
+    """
+    versioned_key = f"catalog:{get_catalog_version()}:{key}"
+    value = cache.get(versioned_key)
+    if value is None:
+        value = compute()
+        cache.set(versioned_key, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def encode_cursor(product):
+    micros = int(product.created_at.timestamp()) * 10**6 + product.created_at.microsecond
+    return f"{micros}-{product.pk}"
+
+
+def decode_cursor(cursor):
+    """Returns (created_at, id) or None for a missing/garbled cursor."""
+    try:
+        micros, pk = (int(part) for part in cursor.split("-"))
+        created_at = datetime.fromtimestamp(micros // 10**6, tz=dt_timezone.utc) + timedelta(microseconds=micros % 10**6)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None  # OverflowError/OSError: a timestamp out of datetime's range
+    return created_at, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, request, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._request = request
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _url(self, param, cursor):
+        params = self._request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[param] = cursor
+        return f"?{params.urlencode()}"
+
+    @property
+    def next_url(self):
+        return self._url("after", self.next_cursor) if self.has_next else None
+
+    @property
+    def previous_url(self):
+        return self._url("before", self.previous_cursor) if self.has_previous else None
+
+
+def paginate_products(request, queryset, page_size=PRODUCT_PAGE_SIZE, cache_key=None):
+    """
+    Newest-first page of `queryset` using a (created_at, id) keyset cursor
+    from ?after= / ?before=, so deep pages cost the same as the first one.
+    With `cache_key` the page is cached per cursor for the catalog version.
+    """
+    after = decode_cursor(request.GET.get("after"))
+    before = None if after else decode_cursor(request.GET.get("before"))
+
+    if cache_key:
+        cursor = f"a{request.GET['after']}" if after else f"b{request.GET['before']}" if before else ""
+        rows, next_cursor, previous_cursor = cached_catalog(
+            f"{cache_key}:{page_size}:{cursor}",
+            lambda: _keyset_rows(queryset, after, before, page_size),
+        )
+    else:
+        rows, next_cursor, previous_cursor = _keyset_rows(queryset, after, before, page_size)
+    return KeysetPage(rows, request, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def _keyset_rows(queryset, after, before, page_size):
+    """(rows, next_cursor, previous_cursor) for one keyset page."""
+    if before:
+        created_at, pk = before
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+            .order_by("created_at", "pk")[:page_size + 1]
+        )
+        more_before = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return (
+            rows,
+            encode_cursor(rows[-1]) if rows else None,
+            encode_cursor(rows[0]) if rows and more_before else None,
+        )
+
+    if after:
+        created_at, pk = after
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(queryset.order_by("-created_at", "-pk")[:page_size + 1])
+    more_after = len(rows) > page_size
+    rows = rows[:page_size]
+    return (
+        rows,
+        encode_cursor(rows[-1]) if more_after else None,
+        encode_cursor(rows[0]) if rows and after else None,
+    )
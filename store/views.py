@@ -1,16 +1,27 @@
 from datetime import datetime, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404
 from .models import Product, Category, WebBanner
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q
+from django.core.paginator import Paginator
+from ecommerce.db_routers import replica_reads
+from .search import search_products
+from .utils import HOME_SECTION_SIZE, cached_catalog, paginate_products
 
 
+@replica_reads
 def product(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    product_images = product.product_images.all() 
-    stock_quantity = product.stock_quantity
-    
+    def load():
+        product = Product.objects.filter(slug=slug).first()
+        return product, list(product.product_images.all()) if product else []
+
+    product, product_images = cached_catalog(f"product:{slug}", load)
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    # Orders move stock without bumping the catalog version, so read it fresh
+    stock_quantity = Product.objects.filter(pk=product.pk).values_list('stock_quantity', flat=True).first() or 0
+
     # Add stock status for better UX
     is_out_of_stock = stock_quantity <= 0
     is_low_stock = stock_quantity <= 5 and stock_quantity > 0
@@ -25,15 +36,18 @@ def product(request, slug):
     return render(request, 'store/product.html', context)
 
 
+@replica_reads
 def category(request, slug):
     category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category)
+    page = paginate_products(request, Product.objects.filter(category=category), cache_key=f"category:{category.pk}")
     context = {
         'category': category,
-        'products': products,
+        'products': page,
+        'page': page,
     }
     return render(request, 'store/category.html', context)
 
+@replica_reads
 def categories(request):
     categories = Category.objects.all()
     products = Product.objects.select_related('category').all()  # Use select_related for optimization
@@ -54,18 +68,22 @@ def categories(request):
 #     return render(request, 'store/all_categories.html', context)
     
 
+@replica_reads
 def sale(request):
-    products = Product.objects.filter(is_sale=True)
+    page = paginate_products(request, Product.objects.filter(is_sale=True), cache_key="sale")
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
     }
     return render(request, 'store/sale.html', context)
 
+@replica_reads
 def new(request):
     thirty_days_ago = timezone.now() - timedelta(days=30)
-    products = Product.objects.filter(created_at__gte=thirty_days_ago)
+    page = paginate_products(request, Product.objects.filter(created_at__gte=thirty_days_ago), cache_key="new")
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
     }
     return render(request, 'store/new.html', context)
 
@@ -79,10 +97,13 @@ def new(request):
     
 
 
+@replica_reads
 def featured(request):
-    products = Product.objects.filter(is_featured=True)
+    page = paginate_products(request, Product.objects.filter(is_featured=True), cache_key="featured")
     context = {
-        'products': products, }
+        'products': page,
+        'page': page,
+    }
     return render(request, 'store/featured.html', context)
 
 # def products(request):
@@ -100,14 +121,17 @@ def featured(request):
 #     }
 #     return render(request, 'store/all_products.html', context)
 
+@replica_reads
 def products(request):
-    products = Product.objects.filter(is_listed=True).select_related('category')
+    products = Product.objects.filter(is_listed=True)
+    page = paginate_products(request, products, cache_key="products")
     banners = WebBanner.objects.filter(in_use=True)
-    sale_products = products.filter(is_sale=True)
-    featured_products = products.filter(is_featured=True)
+    sale_products = products.filter(is_sale=True).order_by('-created_at', '-pk')[:HOME_SECTION_SIZE]
+    featured_products = products.filter(is_featured=True).order_by('-created_at', '-pk')[:HOME_SECTION_SIZE]
 
     context = {
-        'products': products,
+        'products': page,
+        'page': page,
         'sale_products': sale_products,
         'featured_products': featured_products,
         'banners': banners,
@@ -115,21 +139,20 @@ def products(request):
     return render(request, 'store/all_products.html', context)
 
 
+SEARCH_PAGE_SIZE = 24
+
+
+@replica_reads
 def search(request):
     query = request.GET.get('query')
-    if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) |
-            Q(key_words__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        ).select_related('category')
-    else:
-        products = Product.objects.none() 
+    # Ranked full-text match on the product search index (store/search.py)
+    results = search_products(query, Product.objects.select_related('category'))
+    page = Paginator(results, SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
 
     context = {
         'query': query,
-        'products': products,
+        'products': page.object_list,
+        'page': page,
     }
     return render(request, 'store/search.html', context)
 
@@ -1,8 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.apps import apps
-from collections import deque
+from django.db import transaction
+from django.db.models import F
 from users.models import CustomUser
+from mlmtree.utils import claim_open_slot, move_upline_links, record_placement
 
 @receiver(post_save, sender=CustomUser)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -25,43 +27,92 @@ def create_user_profile(sender, instance, created, **kwargs):
     if instance.is_superuser:
         instance.parent_sponsor = None
         instance.parent_node = None
+        instance._counted_parent_node_id = None
         instance.save()
         MLMTree.objects.create(user=instance, parent=None)
         return
 
-    # Set parent_sponsor if not already set
-    if not instance.parent_sponsor:
-        root_user = CustomUser.objects.filter(is_superuser=True).first()
-        instance.parent_sponsor = root_user
-
-    # BFS traversal to assign parent_node with < 5 children
-    # 🔁 Assign parent_node as parent_sponsor if sponsor has < 5 children
-    if not instance.parent_node and instance.parent_sponsor:
-        if instance.parent_sponsor.child_nodes.count() < 5:
-            instance.parent_node = instance.parent_sponsor
-        else:
-            # Optional fallback: find another spot via BFS if sponsor is full
+    with transaction.atomic():
+        # Set parent_sponsor if not already set
+        if not instance.parent_sponsor:
             root_user = CustomUser.objects.filter(is_superuser=True).first()
-            queue = deque([instance.parent_sponsor])
-
-            while queue:
-                current = queue.popleft()
-                if current.child_nodes.count() < 5:
-                    instance.parent_node = current
-                    break
-                queue.extend(current.child_nodes.all())
-
-    instance.save()
-
-    # Ensure parent_node has MLMTree record
-    if instance.parent_node and not hasattr(instance.parent_node, 'mlm_tree'):
-        MLMTree.objects.create(
-            user=instance.parent_node,
-            parent=instance.parent_node.parent_node.mlm_tree if instance.parent_node.parent_node else None
-        )
+            instance.parent_sponsor = root_user
+
+        # 🔁 First node in BFS order from the sponsor with < 5 children (slot is claimed)
+        if not instance.parent_node and instance.parent_sponsor:
+            instance.parent_node_id = claim_open_slot(instance.parent_sponsor)
+        elif instance.parent_node:
+            # Placed explicitly (e.g. from the admin): still count the child
+            MLMTree.objects.filter(user_id=instance.parent_node_id).update(child_count=F('child_count') + 1)
+
+        # Counted above, so the save below isn't a move (see move_placement)
+        instance._counted_parent_node_id = instance.parent_node_id
+        instance.save()
+
+        # Keep the upline closure table in step with the placement
+        record_placement(instance)
+
+        parent_tree = None
+        if instance.parent_node_id:
+            parent_tree = MLMTree.objects.filter(user_id=instance.parent_node_id).first()
+            if parent_tree is None:
+                # Ensure parent_node has MLMTree record
+                parent_node = instance.parent_node
+                parent_tree = MLMTree.objects.create(
+                    user=parent_node,
+                    parent=parent_node.parent_node.mlm_tree if parent_node.parent_node else None,
+                    child_count=parent_node.child_nodes.count(),
+                )
+
+        # Create MLMTree node for new user
+        MLMTree.objects.create(user=instance, parent=parent_tree)
+
+
+# child_count, the MLMTree node and the upline links follow parent_node
+# when a user is moved or deleted
+
+@receiver(post_init, sender=CustomUser)
+def remember_parent_node(sender, instance, **kwargs):
+    # Only when loaded: reading a deferred parent_node_id would cost a query
+    if 'parent_node_id' in instance.__dict__:
+        instance._counted_parent_node_id = instance.parent_node_id
 
-    # Create MLMTree node for new user
-    MLMTree.objects.create(
-        user=instance,
-        parent=instance.parent_node.mlm_tree if instance.parent_node else None
-    )
+
+@receiver(post_save, sender=CustomUser)
+def move_placement(sender, instance, created, **kwargs):
+    if created or not hasattr(instance, '_counted_parent_node_id'):
+        return
+    old_parent_id = instance._counted_parent_node_id
+    if old_parent_id == instance.parent_node_id:
+        return
+    MLMTree = apps.get_model('mlmtree', 'MLMTree')
+    with transaction.atomic():
+        if old_parent_id:
+            MLMTree.objects.filter(user_id=old_parent_id, child_count__gt=0).update(child_count=F('child_count') - 1)
+        if instance.parent_node_id:
+            MLMTree.objects.filter(user_id=instance.parent_node_id).update(child_count=F('child_count') + 1)
+        # Commission follows the closure table, so the whole subtree moves with the user
+        move_upline_links(instance)
+
+        # claim_open_slot walks the MPTT order, so the node moves with its count
+        node = MLMTree.objects.filter(user_id=instance.pk).first()
+        if node is not None:
+            new_parent = MLMTree.objects.filter(user_id=instance.parent_node_id).first()
+            # Moves shift lft/rght like placements do, so take the same root locks
+            tree_ids = {node.tree_id} | ({new_parent.tree_id} if new_parent else set())
+            list(MLMTree.objects.select_for_update().filter(tree_id__in=tree_ids, level=0).order_by('pk').values_list('pk'))
+            node.refresh_from_db()
+            if new_parent:
+                new_parent.refresh_from_db()
+            node.parent = new_parent
+            node.save()
+    instance._counted_parent_node_id = instance.parent_node_id
+
+
+@receiver(post_delete, sender=CustomUser)
+def release_child_slot(sender, instance, **kwargs):
+    if instance.parent_node_id:
+        MLMTree = apps.get_model('mlmtree', 'MLMTree')
+        MLMTree.objects.filter(user_id=instance.parent_node_id, child_count__gt=0).update(
+            child_count=F('child_count') - 1
+        )
@@ -15,7 +15,7 @@ from .forms import (
 )
 from .models import CustomUser, Profile, ShippingAddress, BankingDetails
 from cart.models import Cart, CartItem, Order
-from wallet.models import Wallet, WalletTransaction
+from wallet.models import Wallet
 
 import json
 
@@ -266,7 +266,6 @@ def update_password(request):
 def user_profile(request):
     profile = Profile.objects.get(user=request.user)
     wallet, _ = Wallet.objects.get_or_create(user=request.user)
-    transactions = WalletTransaction.objects.filter(wallet=wallet).order_by('-timestamp')
 
     user_data = {
         'email': request.user.email,
@@ -285,7 +284,6 @@ def user_profile(request):
         'orders': orders,
         'wallet': wallet,
         'wallet_balance': wallet.balance,
-        'transactions': transactions,
     })
 
 
@@ -293,23 +291,21 @@ def user_profile(request):
 # ✅ REFERRALS PAGE
 # ---------------------------
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-from wallet.models import WalletTransaction
+from wallet.utils import get_earnings
+from ecommerce.db_routers import replica_reads
 
 @login_required
+@replica_reads
 def my_referrals_view(request):
     referred_users = request.user.sponsored_users.all()
 
-    # Calculate total earnings from commission transactions
-    total_earnings = WalletTransaction.objects.filter(
-        wallet__user=request.user,
-        transaction_type='credit',
-        description__icontains='commission'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # One row, kept up to date by the commission engine
+    earnings = get_earnings(request.user)
 
     context = {
         'referred_users': referred_users,
-        'total_earnings': total_earnings,
+        'total_earnings': earnings['lifetime'],
+        'earnings': earnings,
     }
 
     return render(request, 'users/my_referrals.html', context)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Wallet, WalletTransaction, Payout
+from .models import EarningsSummary, Wallet, WalletTransaction, Payout
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
@@ -8,9 +8,19 @@ class WalletAdmin(admin.ModelAdmin):
 
 @admin.register(WalletTransaction)
 class WalletTransactionAdmin(admin.ModelAdmin):
-    list_display = ('wallet', 'amount', 'transaction_type', 'timestamp')
+    list_display = ('wallet', 'amount', 'transaction_type', 'category', 'level', 'timestamp')
     search_fields = ('wallet__user__email',)
-    list_filter = ('timestamp',)
+    list_filter = ('category', 'timestamp')
+
+@admin.register(EarningsSummary)
+class EarningsSummaryAdmin(admin.ModelAdmin):
+    # Maintained by the commission engine; rebuild with `manage.py backfill_earnings`
+    list_display = ('wallet', 'lifetime', 'month', 'this_month', 'sponsor', 'company_share', 'updated_at')
+    search_fields = ('wallet__user__email',)
+    readonly_fields = [field.name for field in EarningsSummary._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
 
 @admin.register(Payout)
 class PayoutAdmin(admin.ModelAdmin):
@@ -29,7 +39,8 @@ class PayoutAdmin(admin.ModelAdmin):
 
         # If admin changed status → PAID
         if old_status != "paid" and obj.status == "paid":
-            wallet = obj.user.wallet
+            # The admin view runs in a transaction; lock so balance_after is exact
+            wallet = Wallet.objects.select_for_update().get(user=obj.user)
 
             if wallet.balance >= obj.amount:
                 wallet.balance -= obj.amount
@@ -38,6 +49,8 @@ class PayoutAdmin(admin.ModelAdmin):
                 WalletTransaction.objects.create(
                     wallet=wallet,
                     transaction_type='debit',
+                    category='payout',
                     amount=obj.amount,
+                    balance_after=wallet.balance,
                     description=f"Payout approved by admin: ₹{obj.amount}"
                 )
@@ -6,9 +6,12 @@ from django.db import transaction
 import uuid
 
 from wallet.models import Wallet, WalletTransaction, Payout
+from ecommerce.db_routers import replica_reads
+from api.pagination import LedgerCursorPagination
 
 # Serializer imports
-from .serializers import WalletSerializer, WalletTransactionSerializer
+from .serializers import EarningsSerializer, WalletSerializer, WalletTransactionSerializer
+from .utils import get_earnings
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -19,11 +22,20 @@ def get_wallet_balance(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
+def get_earnings_summary(request):
+    return Response(EarningsSerializer(get_earnings(request.user)).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@replica_reads
 def get_wallet_transactions(request):
-    wallet, _ = Wallet.objects.get_or_create(user=request.user)
-    transactions = WalletTransaction.objects.filter(wallet=wallet).order_by('-timestamp')
-    serializer = WalletTransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    wallet = Wallet.objects.filter(user=request.user).first() or Wallet.objects.get_or_create(user=request.user)[0]
+    # Cursor pages, newest first; balance_after on each row keeps them self-contained
+    paginator = LedgerCursorPagination()
+    page = paginator.paginate_queryset(WalletTransaction.objects.filter(wallet=wallet), request)
+    serializer = WalletTransactionSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -51,7 +63,9 @@ def withdraw_from_wallet(request):
         WalletTransaction.objects.create(
             wallet=wallet,
             transaction_type="debit",
+            category="payout",
             amount=amount,
+            balance_after=wallet.balance,
             description=f"Payout request for ₹{amount}"
         )
 
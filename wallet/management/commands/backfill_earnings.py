@@ -0,0 +1,52 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.models import EarningsSummary
+from wallet.utils import (
+    classify_transactions, current_month, earnings_from_ledger, fill_commission_levels, rebuild_earnings_summaries,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Classifies uncategorised wallet transactions by their description, fills in the upline "
+        "level of commission credits and rebuilds every wallet's earnings summary from the ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the summaries with the ledger; don't change anything.",
+        )
+        parser.add_argument(
+            "--reclassify",
+            action="store_true",
+            help="Classify every transaction again, not just the ones still marked 'other'.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            for category, count in classify_transactions(apps, options["reclassify"]).items():
+                self.stdout.write(f"{category}: {count} transactions")
+            filled = fill_commission_levels(apps, options["batch_size"])
+            self.stdout.write(f"Filled in the upline level of {filled} commission credits.")
+            rebuilt = rebuild_earnings_summaries(apps, options["batch_size"])
+            self.stdout.write(f"Rebuilt earnings summaries for {rebuilt} wallets.")
+
+        expected = {
+            wallet_id: (fields['lifetime'], fields['this_month'], fields['sponsor'], fields['company_share'])
+            for wallet_id, fields in earnings_from_ledger(apps).items()
+        }
+        month = current_month()
+        actual = {
+            summary.wallet_id: (
+                summary.lifetime, summary.current_month_total(month), summary.sponsor, summary.company_share,
+            )
+            for summary in EarningsSummary.objects.filter(lifetime__gt=0).iterator()
+        }
+        wrong = {wallet_id for wallet_id in expected.keys() | actual.keys() if expected.get(wallet_id) != actual.get(wallet_id)}
+        if wrong:
+            raise CommandError(f"Earnings summaries out of step with the ledger for {len(wrong)} wallets.")
+        self.stdout.write(self.style.SUCCESS(f"Earnings summaries match the ledger ({len(actual)} wallets)."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wallet.models import Wallet, WalletTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in balance_after on wallet transactions written before it was stored, working back "
+        "from each wallet's current balance (or the newest stored balance) through its ledger."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        wallet_ids = list(
+            WalletTransaction.objects.filter(balance_after__isnull=True)
+            .values_list("wallet_id", flat=True).distinct().order_by("wallet_id")
+        )
+        filled = 0
+        for wallet_id in wallet_ids:
+            filled += self.backfill_wallet(wallet_id, options["batch_size"])
+        self.stdout.write(f"Filled in the running balance of {filled} wallet transactions.")
+
+    def backfill_wallet(self, wallet_id, batch_size):
+        with transaction.atomic():
+            # No new transactions for this wallet until its ledger is done
+            balance = Wallet.objects.select_for_update().values_list("balance", flat=True).get(pk=wallet_id)
+            filled = 0
+            last_pk = None
+            while True:
+                rows = WalletTransaction.objects.filter(wallet_id=wallet_id).order_by("-id")
+                if last_pk is not None:
+                    rows = rows.filter(pk__lt=last_pk)
+                rows = list(rows.only("pk", "transaction_type", "amount", "balance_after")[:batch_size])
+                if not rows:
+                    break
+                last_pk = rows[-1].pk
+                updates = []
+                for row in rows:
+                    # Trust balances already stored; walk back from them
+                    if row.balance_after is None:
+                        row.balance_after = balance
+                        updates.append(row)
+                    balance = row.balance_after - row.signed_amount
+                WalletTransaction.objects.bulk_update(updates, ["balance_after"], batch_size=batch_size)
+                filled += len(updates)
+        return filled
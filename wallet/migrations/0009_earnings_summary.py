@@ -0,0 +1,44 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_payout_transaction_id_payout_upi_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EarningsSummary',
+            fields=[
+                ('wallet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='earnings', serialize=False, to='wallet.wallet')),
+                ('lifetime', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('month', models.DateField(blank=True, null=True)),
+                ('this_month', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sponsor', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('company_share', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('by_level', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'earnings summaries',
+            },
+        ),
+        migrations.AddField(
+            model_name='wallettransaction',
+            name='category',
+            field=models.CharField(choices=[('commission', 'Upline commission'), ('sponsor_commission', 'Sponsor commission'), ('company_share', 'Company share of commission'), ('purchase', 'Purchase'), ('payout', 'Payout'), ('other', 'Other')], default='other', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='wallettransaction',
+            name='level',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', 'category', 'timestamp'], name='wallet_txn_category_idx'),
+        ),
+    ]
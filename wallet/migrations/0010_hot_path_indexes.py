@@ -0,0 +1,21 @@
+# Generated by Django 4.2.18 on 2026-10-18 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_earnings_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payout',
+            index=models.Index(fields=['user', '-created_at'], name='wallet_payout_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['wallet', '-timestamp'], name='wallet_txn_wallet_time_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.18 on 2026-10-18 05:10
+
+from django.db import migrations
+
+
+def backfill_earnings(apps, schema_editor):
+    from wallet.utils import classify_transactions, fill_commission_levels, rebuild_earnings_summaries
+
+    # Same steps as `manage.py backfill_earnings`, on the historical models
+    classify_transactions(apps)
+    fill_commission_levels(apps)
+    rebuild_earnings_summaries(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mlmtree', '0002_uplinelink'),
+        ('wallet', '0011_ledger_balance_after'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_earnings, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.db import models
 from cart.models import Order
@@ -21,17 +23,94 @@ class WalletTransaction(models.Model):
         ('credit', 'Credit'),
         ('debit', 'Debit'),
     )
+    CATEGORIES = (
+        ('commission', 'Upline commission'),
+        ('sponsor_commission', 'Sponsor commission'),
+        ('company_share', 'Company share of commission'),
+        ('purchase', 'Purchase'),
+        ('payout', 'Payout'),
+        ('other', 'Other'),
+    )
+    # Credits in these categories count as earnings (see EarningsSummary)
+    EARNING_CATEGORIES = ('commission', 'sponsor_commission', 'company_share')
 
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPES)
+    category = models.CharField(max_length=20, choices=CATEGORIES, default='other')
+    # Upline level (1 = direct parent) for 'commission' credits
+    level = models.PositiveSmallIntegerField(null=True, blank=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # Wallet balance right after this transaction, written under the wallet
+    # lock so ids and balances run in the same order (empty on rows older
+    # than the field until `manage.py backfill_ledger_balances` runs)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
     order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # The ledger, newest first (wallet.utils.paginate_ledger)
+            models.Index(fields=['wallet', '-id'], name='wallet_txn_wallet_id_idx'),
+            models.Index(fields=['wallet', 'category', 'timestamp'], name='wallet_txn_category_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} for {self.wallet.user.email}"
 
+    @property
+    def signed_amount(self):
+        return self.amount if self.transaction_type == 'credit' else -self.amount
+
+
+class EarningsSummary(models.Model):
+    """
+    Running commission totals for a wallet, so pages that show earnings
+    read one row instead of summing the ledger. Kept up to date in the same
+    transaction as the credits (wallet.utils.record_earnings); rebuilt from
+    the ledger by `manage.py backfill_earnings` (wallet migration 0012 runs
+    the same backfill once for the existing ledger).
+    """
+    wallet = models.OneToOneField(Wallet, on_delete=models.CASCADE, primary_key=True, related_name='earnings')
+    lifetime = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # this_month counts the credits since `month` (the first of a month)
+    month = models.DateField(null=True, blank=True)
+    this_month = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sponsor = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    company_share = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Upline commission per level: {"1": "12.50", ...}. Credits whose level
+    # isn't known (old ledger rows) only count towards the totals.
+    by_level = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'earnings summaries'
+
+    def __str__(self):
+        return f"Earnings of {self.wallet}"
+
+    def add(self, category, level, amount, month):
+        """Adds one earning credit; `month` is the first day of the current month."""
+        if self.month != month:
+            self.month, self.this_month = month, Decimal('0')
+        self.lifetime += amount
+        self.this_month += amount
+        if category == 'sponsor_commission':
+            self.sponsor += amount
+        elif category == 'company_share':
+            self.company_share += amount
+        elif level:
+            key = str(level)
+            self.by_level[key] = str((Decimal(self.by_level.get(key, '0')) + amount).quantize(Decimal('0.01')))
+
+    def current_month_total(self, month):
+        """this_month, or nothing if no credit has come in since `month` began."""
+        return self.this_month if self.month == month else Decimal('0')
+
+    def levels(self):
+        """[(level, amount)] in level order."""
+        return sorted((int(level), Decimal(amount)) for level, amount in self.by_level.items())
+
 
 class Payout(models.Model):
     STATUS_CHOICES = (
@@ -58,5 +137,10 @@ class Payout(models.Model):
 
     transaction_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='wallet_payout_user_time_idx'),
+        ]
+
     def __str__(self):
         return f"Payout of ₹{self.amount} for {self.user.email} - {self.status}"
@@ -10,4 +10,15 @@ class WalletSerializer(serializers.ModelSerializer):
 class WalletTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = WalletTransaction
-        fields = ['transaction_type', 'amount', 'description', 'timestamp']
\ No newline at end of file
+        fields = ['id', 'transaction_type', 'category', 'amount', 'balance_after', 'description', 'timestamp']
+
+class EarningsSerializer(serializers.Serializer):
+    """Serializes wallet.utils.get_earnings()."""
+    lifetime = serializers.DecimalField(max_digits=14, decimal_places=2)
+    this_month = serializers.DecimalField(max_digits=14, decimal_places=2)
+    sponsor = serializers.DecimalField(max_digits=14, decimal_places=2)
+    company_share = serializers.DecimalField(max_digits=14, decimal_places=2)
+    by_level = serializers.SerializerMethodField()
+
+    def get_by_level(self, earnings):
+        return [{'level': level, 'amount': f"{amount:.2f}"} for level, amount in earnings['levels']]
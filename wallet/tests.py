@@ -1,3 +1,180 @@
+import csv
+import importlib
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
 from django.test import TestCase
 
-# Create your tests here.
+from cart.models import Order, OrderItem
+from ecommerce.testing import QueryBudgetMixin
+from mlmtree.utils import credit_wallets, distribute_order_commission
+from store.models import Product
+from users.models import CustomUser
+from wallet.models import EarningsSummary, Wallet, WalletTransaction
+from wallet.utils import LEDGER_PAGE_SIZE, current_month, log_wallet_transaction
+
+
+class WalletLedgerTests(QueryBudgetMixin, TestCase):
+    """Running balances on the ledger, its keyset pages and the CSV export."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user("earner@example.com", "pw")
+        cls.wallet = Wallet.objects.get(user=cls.user)
+        for _ in range(30):
+            credit_wallets({
+                (cls.user.pk, 'commission', 1): Decimal("2.00"),
+                (cls.user.pk, 'sponsor_commission', None): Decimal("1.00"),
+            })
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertBalancesRunning(self):
+        balance = Decimal("0")
+        for txn in WalletTransaction.objects.filter(wallet=self.wallet).order_by('id'):
+            balance += txn.signed_amount
+            self.assertEqual(txn.balance_after, balance)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, balance)
+
+    def test_balance_after(self):
+        self.assertBalancesRunning()
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal("95.00"))
+        log_wallet_transaction(self.user, Decimal("5.00"), "Bonus")
+        self.assertBalancesRunning()
+        response = self.client.post("/api/wallet/withdraw/", {"amount": "15.00"})
+        self.assertEqual(response.status_code, 200)
+        self.assertBalancesRunning()
+
+    def test_backfill(self):
+        WalletTransaction.objects.filter(pk__lt=WalletTransaction.objects.order_by('-id')[5].pk).update(balance_after=None)
+        call_command("backfill_ledger_balances", batch_size=7, stdout=open("/dev/null", "w"))
+        self.assertBalancesRunning()
+
+    def test_pages(self):
+        newest = list(WalletTransaction.objects.filter(wallet=self.wallet).order_by('-id').values_list('pk', flat=True))
+        # Session, user, wallet, one page of the ledger, payouts and the header's cart summary
+        response = self.assertQueryBudget("/wallet/transactions/", 6)
+        page = response.context['page']
+        self.assertEqual([txn.pk for txn in page], newest[:LEDGER_PAGE_SIZE])
+        self.assertContains(response, "Download full history")
+
+        response = self.client.get(f"/wallet/transactions/{page.next_url}")
+        older = response.context['page']
+        self.assertEqual([txn.pk for txn in older], newest[LEDGER_PAGE_SIZE:2 * LEDGER_PAGE_SIZE])
+        back = self.client.get(f"/wallet/transactions/{older.previous_url}").context['page']
+        self.assertEqual([txn.pk for txn in back], newest[:LEDGER_PAGE_SIZE])
+
+        data = self.client.get("/api/wallet/transactions/", {"page_size": 40}).json()
+        self.assertEqual([row['id'] for row in data['results']], newest[:40])
+        self.assertEqual(data['results'][0]['balance_after'], "90.00")
+        data = self.client.get(data['next']).json()
+        self.assertEqual([row['id'] for row in data['results']], newest[40:])
+
+    def test_csv_export(self):
+        response = self.client.get("/wallet/transactions/export.csv")
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:6], ['id', 'date', 'type', 'category', 'amount', 'balance_after'])
+        self.assertEqual(len(rows), 61)
+        self.assertEqual(rows[1][4:6], ['2.00', '2.00'])
+        self.assertEqual(rows[-1][5], '90.00')
+
+
+def ledger_earnings():
+    """{wallet_id: (lifetime, this_month, sponsor, company_share, levels)} summed straight from the ledger."""
+    totals = defaultdict(lambda: [Decimal('0'), Decimal('0'), Decimal('0'), Decimal('0'), defaultdict(Decimal)])
+    month = current_month()
+    for txn in WalletTransaction.objects.filter(transaction_type='credit', category__in=WalletTransaction.EARNING_CATEGORIES):
+        total = totals[txn.wallet_id]
+        total[0] += txn.amount
+        if txn.timestamp.date() >= month:
+            total[1] += txn.amount
+        if txn.category == 'sponsor_commission':
+            total[2] += txn.amount
+        elif txn.category == 'company_share':
+            total[3] += txn.amount
+        elif txn.level:
+            total[4][txn.level] += txn.amount
+    return {
+        wallet_id: (lifetime, this_month, sponsor, company_share, sorted(levels.items()))
+        for wallet_id, (lifetime, this_month, sponsor, company_share, levels) in totals.items()
+    }
+
+
+def summary_earnings():
+    month = current_month()
+    return {
+        summary.wallet_id: (
+            summary.lifetime, summary.current_month_total(month), summary.sponsor, summary.company_share,
+            summary.levels(),
+        )
+        for summary in EarningsSummary.objects.all()
+    }
+
+
+class EarningsSummaryTests(TestCase):
+    """The summaries, however they were written, hold what summing the ledger gives."""
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.create_superuser(email="company@example.com", password="x")
+        cls.sponsor = CustomUser.objects.create_user("sponsor@example.com", "x")
+        chain = [cls.sponsor]
+        for n in range(4):
+            chain.append(CustomUser.objects.create_user(
+                f"upline{n}@example.com", "x", parent_sponsor=cls.sponsor, parent_node=chain[-1],
+            ))
+        product = Product.objects.create(
+            name="Kit", price=Decimal("50.00"), special_commission_amount=Decimal("10.00"),
+        )
+        for n, parent in enumerate([chain[-1], chain[2], chain[-1]]):
+            buyer = CustomUser.objects.create_user(
+                f"buyer{n}@example.com", "x", parent_sponsor=cls.sponsor, parent_node=parent,
+            )
+            order = Order.objects.create(user=buyer, shipping_address="Address", amount_paid=Decimal("0.00"))
+            items = OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, user=buyer, quantity=n + 1, price=product.price),
+            ])
+            distribute_order_commission(order, items)
+        log_wallet_transaction(cls.sponsor, Decimal("3.00"), "Sponsor commission", category='sponsor_commission')
+        log_wallet_transaction(cls.sponsor, Decimal("4.00"), "Bonus")
+
+    def forget_categories(self):
+        """Puts the ledger back the way it was before transactions had categories and levels."""
+        EarningsSummary.objects.all().delete()
+        WalletTransaction.objects.update(category='other', level=None)
+
+    def test_record_earnings_matches_ledger(self):
+        expected = ledger_earnings()
+        self.assertEqual(summary_earnings(), expected)
+        self.assertTrue(any(levels for *_, levels in expected.values()))
+        # The logged sponsor commission counts, the "Bonus" ('other') doesn't
+        sponsor_wallet = Wallet.objects.get(user=self.sponsor)
+        from_orders = WalletTransaction.objects.filter(
+            wallet=sponsor_wallet, category='sponsor_commission', order__isnull=False,
+        ).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(expected[sponsor_wallet.pk][2], from_orders + Decimal("3.00"))
+
+    def test_backfill_command_matches_ledger(self):
+        recorded = summary_earnings()
+        self.forget_categories()
+        call_command("backfill_earnings", stdout=open("/dev/null", "w"))
+        self.assertEqual(summary_earnings(), ledger_earnings())
+        # Categories and levels come back from descriptions and the upline table
+        self.assertEqual(summary_earnings(), recorded)
+        call_command("backfill_earnings", check=True, stdout=open("/dev/null", "w"))
+
+    def test_migration_matches_ledger(self):
+        recorded = summary_earnings()
+        self.forget_categories()
+        migration = importlib.import_module("wallet.migrations.0012_backfill_earnings")
+        historical = MigrationExecutor(connection).loader.project_state(("wallet", "0012_backfill_earnings")).apps
+        migration.backfill_earnings(historical, None)
+        self.assertEqual(summary_earnings(), recorded)
+        self.assertEqual(summary_earnings(), ledger_earnings())
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import wallet_transactions_view 
+from .views import wallet_transactions_view, wallet_ledger_csv
 
 urlpatterns = [
     path('transactions/', wallet_transactions_view, name='wallet_transactions'),
+    path('transactions/export.csv', wallet_ledger_csv, name='wallet_ledger_csv'),
 ]
\ No newline at end of file
@@ -1,16 +1,293 @@
 # wallet/utils.py
-from wallet.models import Wallet, WalletTransaction
+import csv
+from collections import defaultdict
+from datetime import datetime, time
+from decimal import Decimal
 
-def log_wallet_transaction(user, amount, description):
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from store.utils import KeysetPage
+from wallet.models import EarningsSummary, Wallet, WalletTransaction
+
+LEDGER_PAGE_SIZE = 25
+LEDGER_CSV_CHUNK = 2000
+LEDGER_CSV_HEADER = ['id', 'date', 'type', 'category', 'amount', 'balance_after', 'description', 'order']
+
+# Historical models don't carry class attributes, so the backfill reads this here
+EARNING_CATEGORIES = WalletTransaction.EARNING_CATEGORIES
+
+# (category, filter) in the order they're tried; the first match wins.
+# These are the descriptions the app has written over time.
+CLASSIFICATION = (
+    ('sponsor_commission', Q(transaction_type='credit', description__iexact='Sponsor commission')),
+    ('company_share', Q(transaction_type='credit', description__iexact='Company share of commission')),
+    ('commission', Q(transaction_type='credit', description__icontains='commission')),
+    ('purchase', Q(transaction_type='debit', description__istartswith='Order ', description__iendswith='placed with Wallet')),
+    ('payout', Q(transaction_type='debit', description__istartswith='Payout')),
+)
+
+
+def log_wallet_transaction(user, amount, description, category='other'):
     """
     Records a credit transaction to user's wallet (for commission or others),
     assuming the amount is already added to wallet.balance elsewhere.
     """
     wallet, _ = Wallet.objects.get_or_create(user=user)
 
-    WalletTransaction.objects.create(
-        wallet=wallet,
-        transaction_type='credit',
-        amount=amount,
-        description=description
-    )
\ No newline at end of file
+    with transaction.atomic():
+        balance = Wallet.objects.select_for_update().filter(pk=wallet.pk).values_list('balance', flat=True).get()
+        WalletTransaction.objects.create(
+            wallet=wallet,
+            transaction_type='credit',
+            category=category,
+            amount=amount,
+            balance_after=balance,
+            description=description
+        )
+        if category in WalletTransaction.EARNING_CATEGORIES:
+            record_earnings({(wallet.pk, category, None): Decimal(amount)})
+
+
+def current_month():
+    return timezone.localdate().replace(day=1)
+
+
+def record_earnings(earnings):
+    """
+    Adds {(wallet_id, category, level): amount} earning credits to the
+    wallets' EarningsSummary rows. Call it in the transaction that writes
+    the credits, so the summary and the ledger always agree.
+    """
+    if not earnings:
+        return
+    month = current_month()
+    wallet_ids = {wallet_id for wallet_id, _, _ in earnings}
+    EarningsSummary.objects.bulk_create(
+        [EarningsSummary(wallet_id=wallet_id) for wallet_id in wallet_ids], ignore_conflicts=True,
+    )
+    summaries = {
+        summary.wallet_id: summary
+        for summary in EarningsSummary.objects.select_for_update().filter(wallet_id__in=wallet_ids).order_by('pk')
+    }
+    for (wallet_id, category, level), amount in earnings.items():
+        summaries[wallet_id].add(category, level, amount, month)
+    now = timezone.now()
+    for summary in summaries.values():
+        summary.updated_at = now  # bulk_update skips auto_now
+    EarningsSummary.objects.bulk_update(
+        summaries.values(),
+        ['lifetime', 'month', 'this_month', 'sponsor', 'company_share', 'by_level', 'updated_at'],
+    )
+
+
+def get_earnings(user):
+    """
+    {'lifetime', 'this_month', 'sponsor', 'company_share', 'levels'} for
+    the user, from their EarningsSummary row (zeros if they have none yet).
+    """
+    summary = EarningsSummary.objects.filter(wallet__user=user).first()
+    if summary is None:
+        zero = Decimal('0.00')
+        return {'lifetime': zero, 'this_month': zero, 'sponsor': zero, 'company_share': zero, 'levels': []}
+    return {
+        'lifetime': summary.lifetime,
+        'this_month': summary.current_month_total(current_month()),
+        'sponsor': summary.sponsor,
+        'company_share': summary.company_share,
+        'levels': summary.levels(),
+    }
+
+
+# The backfill below takes an app registry rather than importing models, so
+# the wallet data migration can run it against the historical models and
+# `manage.py backfill_earnings` against the current ones (django.apps.apps).
+
+def classify_transactions(apps, reclassify=False):
+    """
+    Gives uncategorised ('other') transactions the category their
+    description implies, or every transaction with `reclassify`.
+    Returns {category: rows changed}.
+    """
+    WalletTransaction = apps.get_model('wallet', 'WalletTransaction')
+    counts = {}
+    with transaction.atomic():
+        if reclassify:
+            WalletTransaction.objects.exclude(category='other').update(category='other')
+        for category, condition in CLASSIFICATION:
+            # Rows an earlier rule took aren't 'other' any more
+            counts[category] = WalletTransaction.objects.filter(condition, category='other').update(category=category)
+    return counts
+
+
+def fill_commission_levels(apps, batch_size=5000):
+    """
+    Gives upline commission credits from an order the depth of the buyer
+    below the earner, from the upline closure table. Returns how many it filled.
+    """
+    WalletTransaction = apps.get_model('wallet', 'WalletTransaction')
+    UplineLink = apps.get_model('mlmtree', 'UplineLink')
+    last_pk = 0
+    filled = 0
+    while True:
+        batch = list(
+            WalletTransaction.objects.filter(
+                pk__gt=last_pk, category='commission', level__isnull=True, order__isnull=False,
+            ).order_by('pk').values_list('pk', 'wallet__user_id', 'order__user_id')[:batch_size]
+        )
+        if not batch:
+            return filled
+        last_pk = batch[-1][0]
+        depths = dict(
+            ((ancestor_id, descendant_id), depth)
+            for ancestor_id, descendant_id, depth in UplineLink.objects.filter(
+                ancestor_id__in={earner_id for _, earner_id, _ in batch},
+                descendant_id__in={buyer_id for _, _, buyer_id in batch},
+            ).values_list('ancestor_id', 'descendant_id', 'depth')
+        )
+        updates = [
+            WalletTransaction(pk=pk, level=depths[(earner_id, buyer_id)])
+            for pk, earner_id, buyer_id in batch
+            if (earner_id, buyer_id) in depths
+        ]
+        WalletTransaction.objects.bulk_update(updates, ['level'])
+        filled += len(updates)
+
+
+def earnings_from_ledger(apps):
+    """
+    {wallet_id: {EarningsSummary field: value}} summed from the earning
+    credits on the ledger - what record_earnings() should have arrived at.
+    """
+    WalletTransaction = apps.get_model('wallet', 'WalletTransaction')
+    month = current_month()
+    month_start = datetime.combine(month, time.min)
+    if settings.USE_TZ:
+        month_start = timezone.make_aware(month_start)
+
+    zero = Decimal('0')
+    summaries = defaultdict(lambda: {
+        'lifetime': zero, 'month': month, 'this_month': zero, 'sponsor': zero, 'company_share': zero, 'by_level': {},
+    })
+    earnings = WalletTransaction.objects.filter(
+        transaction_type='credit', category__in=EARNING_CATEGORIES,
+    )
+    rows = earnings.values('wallet_id', 'category', 'level').annotate(total=Sum('amount')).order_by()
+    for row in rows:
+        summary = summaries[row['wallet_id']]
+        summary['lifetime'] += row['total']
+        if row['category'] == 'sponsor_commission':
+            summary['sponsor'] += row['total']
+        elif row['category'] == 'company_share':
+            summary['company_share'] += row['total']
+        elif row['level']:
+            key = str(row['level'])
+            summary['by_level'][key] = str(
+                (Decimal(summary['by_level'].get(key, '0')) + row['total']).quantize(Decimal('0.01'))
+            )
+    this_month = (
+        earnings.filter(timestamp__gte=month_start)
+        .values('wallet_id').annotate(total=Sum('amount')).order_by()
+    )
+    for row in this_month:
+        summaries[row['wallet_id']]['this_month'] = row['total']
+    return dict(summaries)
+
+
+def rebuild_earnings_summaries(apps, batch_size=5000):
+    """
+    Replaces every wallet's EarningsSummary with totals summed from the
+    ledger. Returns how many summaries it wrote.
+    """
+    Wallet = apps.get_model('wallet', 'Wallet')
+    EarningsSummary = apps.get_model('wallet', 'EarningsSummary')
+    with transaction.atomic():
+        # Holding every wallet lock keeps commission credits out until the new rows are in
+        list(Wallet.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+        EarningsSummary.objects.all().delete()
+        summaries = earnings_from_ledger(apps)
+        EarningsSummary.objects.bulk_create(
+            [EarningsSummary(wallet_id=wallet_id, **fields) for wallet_id, fields in summaries.items()],
+            batch_size=batch_size,
+        )
+    return len(summaries)
+
+
+def _ledger_cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def paginate_ledger(request, wallet, page_size=LEDGER_PAGE_SIZE):
+    """
+    Newest-first page of the wallet's transactions behind ?after= / ?before=
+    id cursors, read through the (wallet, -id) index however far back the
+    page is. Rows carry their stored balance_after, so showing balances
+    never needs the rows before the page.
+    """
+    transactions = WalletTransaction.objects.filter(wallet=wallet)
+    after = _ledger_cursor(request.GET.get('after'))
+    before = None if after else _ledger_cursor(request.GET.get('before'))
+
+    if before:
+        rows = list(transactions.filter(pk__gt=before).order_by('id')[:page_size + 1])
+        more_before = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            rows, request,
+            next_cursor=rows[-1].pk if rows else None,
+            previous_cursor=rows[0].pk if rows and more_before else None,
+        )
+
+    if after:
+        transactions = transactions.filter(pk__lt=after)
+    rows = list(transactions.order_by('-id')[:page_size + 1])
+    more_after = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows, request,
+        next_cursor=rows[-1].pk if more_after else None,
+        previous_cursor=rows[0].pk if rows and after else None,
+    )
+
+
+class _Echo:
+    """Stands in for a file so csv.writer hands each formatted line back."""
+
+    def write(self, value):
+        return value
+
+
+def ledger_csv_lines(wallet, chunk_size=LEDGER_CSV_CHUNK):
+    """
+    Yields the wallet's whole ledger as CSV lines, oldest first, for a
+    StreamingHttpResponse. Reads `chunk_size` rows at a time by id, so
+    memory stays flat and no cursor stays open while the client downloads.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(LEDGER_CSV_HEADER)
+    last_pk = 0
+    while True:
+        rows = list(
+            WalletTransaction.objects.filter(wallet=wallet, pk__gt=last_pk).order_by('id').values_list(
+                'pk', 'timestamp', 'transaction_type', 'category', 'amount', 'balance_after', 'description', 'order_id',
+            )[:chunk_size]
+        )
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        for pk, timestamp, transaction_type, category, amount, balance_after, description, order_id in rows:
+            yield writer.writerow([
+                pk,
+                timezone.localtime(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                transaction_type,
+                category,
+                amount if transaction_type == 'credit' else -amount,
+                '' if balance_after is None else balance_after,
+                description,
+                order_id or '',
+            ])
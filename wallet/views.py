@@ -1,23 +1,26 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.db import transaction
 import uuid
 from decimal import Decimal
 
-from wallet.models import Wallet, WalletTransaction, Payout
+from wallet.models import Wallet, Payout
+from ecommerce.db_routers import replica_reads
+from .utils import ledger_csv_lines, paginate_ledger
 # ❌ removed: from users.models import BankingDetails
 
 
 @login_required
+@replica_reads
 def wallet_transactions_view(request):
     user = request.user
 
-    # Ensure wallet exists
-    wallet, _ = Wallet.objects.get_or_create(user=user)
+    # Ensure wallet exists (get_or_create is a write, so only when it's missing)
+    wallet = Wallet.objects.filter(user=user).first() or Wallet.objects.get_or_create(user=user)[0]
 
-    transactions = WalletTransaction.objects.filter(wallet=wallet).order_by('-timestamp')
+    transactions = paginate_ledger(request, wallet)
     payouts = Payout.objects.filter(user=user).order_by('-created_at')
 
     if request.method == 'POST':
@@ -64,6 +67,16 @@ def wallet_transactions_view(request):
     return render(request, 'wallet/wallet_transactions.html', {
         'wallet': wallet,
         'transactions': transactions,
+        'page': transactions,
         'payouts': payouts,
         'request_id': str(uuid.uuid4()),
     })
+
+
+@login_required
+def wallet_ledger_csv(request):
+    """The user's whole ledger as a CSV download, streamed as it is read."""
+    wallet = Wallet.objects.filter(user=request.user).first() or Wallet.objects.get_or_create(user=request.user)[0]
+    response = StreamingHttpResponse(ledger_csv_lines(wallet), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="wallet-ledger.csv"'
+    return response